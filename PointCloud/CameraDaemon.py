@@ -0,0 +1,248 @@
+"""
+CameraDaemon.py
+作用：
+  常驻采集进程（在装有 PyCameraSDK 的 Python 3.9 下运行），代替每次扫描都启动一次 Capture.py：
+    1) 启动时发现并打开相机，之后一直保持连接
+    2) 已设置的相机参数 / 输出模式缓存在进程内，任务只下发发生变化的参数
+    3) 在本机 TCP 端口上接收采集任务（每行一个 JSON 请求，每行一个 JSON 应答）
+    4) 打开 / 采集出错时关闭相机、重新发现并重连，再重试当前任务
+说明：
+  - 相机只有一台，所有任务由一把锁串行执行
+  - 请求格式：{"cmd": "capture", "output_dir": ..., "folder_name": ..., "camera_ip": ...,
+             "output_mode": "all"|"point3d", "ir_exposure": ..., "ir_gain": ..., "rgb_exposure": ..., "work_mode": ...}
+             {"cmd": "ping"} / {"cmd": "shutdown"}
+  - 采集函数（OpenOneCamera / SetCameraParameters / SaveImages ...）直接复用 Capture.py，
+    每个任务把自己的 out 写入器传给这些函数收集输出（不重定向进程级的 sys.stdout）
+
+用法：
+  python CameraDaemon.py --port 9200 [--camera-ip 192.168.1.10]
+"""
+
+from PyCameraSDK.AinstecError import *  # 导入Ainstec相机错误模块
+from PyCameraSDK.Common import *  # 导入相机SDK通用模块
+from PyCameraSDK.Camera import *  # 导入相机操作主模块
+from Capture import (OpenOneCamera, OutputAll, OutputOnlyPoint3D, PrintCamInfoList,
+                     SaveImages, SetCameraParameters)
+import argparse
+import io
+import json
+import socketserver
+import threading
+import time
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 9200
+
+# 采集失败后的重连重试次数
+DEFAULT_MAX_RETRIES = 2
+
+# 任务字段 -> SetCameraParameters 使用的参数名
+JOB_PARAM_NAMES = {
+    'ir_exposure': 'IR_Exposure',
+    'ir_gain': 'IR_Gain',
+    'rgb_exposure': 'Rgb_ExposureAbsolute',
+    'work_mode': 'Capture_WorkMode',
+}
+
+
+class CameraError(Exception):
+    pass
+
+
+class CameraWorker:
+    def __init__(self, camera_ip=None, max_retries=DEFAULT_MAX_RETRIES):
+        """
+        :param camera_ip: 默认连接的相机 IP（None 表示第一台能打开的相机）
+        :param max_retries: 单个任务出错后重连重试的次数
+        """
+        self.camera_ip = camera_ip
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+
+        self.cam = None
+        self.camInfo = None
+        # 已下发到相机的参数 / 输出模式，重连后清空
+        self._applied_params = {}
+        self._output_mode = None
+
+    @property
+    def connected(self):
+        return self.cam is not None
+
+    def connect(self, camera_ip=None, out=None):
+        """
+        发现并打开相机；失败抛出 CameraError。
+        :param out: 打印输出的目标（默认 sys.stdout）
+        """
+        self.close(out)
+        cam = Camera().CreateCamera()
+        ret, camInfoList = cam.DiscoverCameras()
+        PrintCamInfoList(camInfoList, out=out)
+
+        ret, camInfo = OpenOneCamera(cam, camInfoList, camera_ip or self.camera_ip, out=out)
+        if ret != AC_OK:
+            raise CameraError(f"无法打开相机，错误码: {ret}")
+
+        self.cam = cam
+        self.camInfo = camInfo
+        self.camera_ip = camInfo.cameraIP
+        self._applied_params = {}
+        self._output_mode = None
+
+    def close(self, out=None):
+        if self.cam is not None:
+            try:
+                self.cam.Close(self.camInfo)
+            except Exception as e:
+                print(f"关闭相机时发生错误: {e}", file=out)
+        self.cam = None
+        self.camInfo = None
+
+    def _apply_settings(self, job, out=None):
+        """
+        只下发和缓存不同的参数 / 输出模式，返回本次实际设置的参数
+        """
+        wanted = {name: job[key] for key, name in JOB_PARAM_NAMES.items() if job.get(key)}
+        changed = {k: v for k, v in wanted.items() if self._applied_params.get(k) != v}
+        if changed:
+            SetCameraParameters(self.cam, self.camInfo, changed, out=out)
+            self._applied_params.update(changed)
+
+        output_mode = job.get('output_mode') or 'all'
+        if output_mode != self._output_mode:
+            if output_mode == 'point3d':
+                OutputOnlyPoint3D(self.camInfo)  # 仅输出3D点云
+            else:
+                OutputAll(self.camInfo)  # 启用所有数据输出
+            self._output_mode = output_mode
+        return changed
+
+    def _capture_once(self, job, out=None):
+        camera_ip = job.get('camera_ip')
+        reconnected = False
+        if not self.connected or (camera_ip and camera_ip != self.camera_ip):
+            self.connect(camera_ip, out=out)
+            reconnected = True
+
+        changed = self._apply_settings(job, out=out)
+
+        frameData = FrameData()  # 创建帧数据容器
+        t0 = time.perf_counter()
+        ret = self.cam.Capture(self.camInfo, frameData)  # 执行捕获操作
+        if ret != AC_OK:
+            raise CameraError(f"捕获失败，错误码: {ret}")
+        capture_time = time.perf_counter() - t0
+
+        SaveImages(self.camInfo, frameData, {
+            'base_path': job.get('output_dir'),
+            'custom_name': job.get('folder_name'),
+        }, out=out)
+        return {
+            'camera_ip': self.camera_ip,
+            'reconnected': reconnected,
+            'parameters_set': [f"{k} = {v}" for k, v in changed.items()],
+            'capture_time': capture_time,
+        }
+
+    def capture(self, job):
+        """
+        执行一次采集任务，出错时重连并重试，返回应答 dict。
+        采集函数的打印输出写入本任务自己的缓冲区，放在 stdout 字段中返回。
+        """
+        with self._lock:
+            start = time.perf_counter()
+            stdout = io.StringIO()
+            error = None
+            info = {}
+
+            for attempt in range(self.max_retries + 1):
+                try:
+                    info = self._capture_once(job, out=stdout)
+                    error = None
+                    break
+                except Exception as e:
+                    error = str(e)
+                    print(f"采集出错（第 {attempt + 1} 次）: {error}，关闭相机后重连", file=stdout)
+                    self.close(stdout)
+
+            success = error is None
+            reply = {
+                'success': success,
+                'message': '扫描完成' if success else f'扫描失败: {error}',
+                'camera_connected': self.connected,
+                'data_captured': success,
+                'execution_time': time.perf_counter() - start,
+                'stdout': stdout.getvalue(),
+            }
+            reply.update(info)
+            return reply
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        worker = self.server.worker
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = json.loads(line.decode('utf-8'))
+                cmd = job.get('cmd', 'capture')
+                if cmd == 'ping':
+                    reply = {'success': True, 'camera_connected': worker.connected,
+                             'camera_ip': worker.camera_ip}
+                elif cmd == 'capture':
+                    reply = worker.capture(job)
+                    print(f"{'✅' if reply['success'] else '❌'} {job.get('folder_name')}: "
+                          f"{reply['message']}，耗时 {reply['execution_time']:.2f}s")
+                elif cmd == 'shutdown':
+                    reply = {'success': True}
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+                else:
+                    reply = {'success': False, 'message': f'未知命令: {cmd}'}
+            except Exception as e:
+                reply = {'success': False, 'message': f'请求处理错误: {e}'}
+
+            self.wfile.write((json.dumps(reply, ensure_ascii=False) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+
+class CaptureServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, worker):
+        super().__init__(address, JobHandler)
+        self.worker = worker
+
+
+def main():
+    parser = argparse.ArgumentParser(description='常驻3D相机采集进程')
+    parser.add_argument('--host', type=str, default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--camera-ip', type=str, help='指定相机IP地址')
+    parser.add_argument('--max-retries', type=int, default=DEFAULT_MAX_RETRIES)
+    args = parser.parse_args()
+
+    worker = CameraWorker(args.camera_ip, max_retries=args.max_retries)
+
+    # 启动时先连上相机；失败也继续监听，第一个任务到来时再重连
+    try:
+        worker.connect()
+    except Exception as e:
+        print(f"启动时打开相机失败: {e}，等待任务时重连")
+
+    with CaptureServer((args.host, args.port), worker) as server:
+        print(f"📷 采集进程已启动: {args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            worker.close()
+            print("采集进程已退出")
+
+
+if __name__ == "__main__":
+    main()
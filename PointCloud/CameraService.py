@@ -1,15 +1,24 @@
+import asyncio
 import logging
 import httpx
 import zipfile
-import shutil
+import hashlib
 import os
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+import re
+import uuid
+import zlib
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import subprocess
 from datetime import datetime
 from enum import Enum
-import aiofiles
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
@@ -18,6 +27,17 @@ logger = logging.getLogger("FileTransfer")
 # 调用Python3.9的路径
 python_path = "/home/er/.pyenv/shims/python"
 
+# 常驻采集进程（CameraDaemon.py）：相机保持打开，不再每次扫描启动 Capture.py
+USE_CAPTURE_DAEMON = True
+CAPTURE_DAEMON_SCRIPT = "CameraDaemon.py"
+CAPTURE_DAEMON_ADDR = ("127.0.0.1", 9200)
+CAPTURE_DAEMON_START_TIMEOUT = 30
+CAPTURE_DAEMON_STOP_TIMEOUT = 10
+CAPTURE_TIMEOUT = 120
+
+_daemon_proc = None
+_daemon_lock = threading.Lock()
+
 # 兼容Pydantic V1和V2
 try:
     from pydantic import model_dump
@@ -94,8 +114,23 @@ app = FastAPI(
 # 存储扫描状态
 scan_results = {}
 batch_results = {}
-UPLOAD_DIR = "./uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+# 扫描任务队列：相机同一时间只能做一次采集，任务在有界线程池中按提交顺序执行
+SCAN_WORKERS = 1
+MAX_PENDING_SCANS = 32
+SSE_KEEPALIVE = 15
+SCAN_FINAL_STATES = (ScanStatus.COMPLETED, ScanStatus.FAILED, ScanStatus.TIMEOUT)
+
+scan_executor = ThreadPoolExecutor(max_workers=SCAN_WORKERS, thread_name_prefix="scan")
+# scan_id -> 未结束的 asyncio.Task
+scan_jobs = {}
+# scan_id -> [asyncio.Queue]，SSE 订阅者
+scan_subscribers = {}
+
+# 传给客户端的文件、读文件块大小、试压缩的样本大小
+TRANSFER_FILES = ("t.bmp", "t.ply")
+TRANSFER_CHUNK_SIZE = 1 << 20
+COMPRESS_PROBE_BYTES = 256 << 10
 
 
 def fix_path_separators(path: str) -> str:
@@ -112,8 +147,99 @@ def fix_path_separators(path: str) -> str:
     return path
 
 
+class _ZipSink:
+    """ZipFile 的输出端：只在内存中暂存尚未发送的字节，不可 seek，zipfile 会改用数据描述符"""
+
+    def __init__(self):
+        self._buf = bytearray()
+
+    def write(self, data):
+        self._buf += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self._buf)
+        self._buf.clear()
+        return data
+
+
+def _is_compressible(path: str) -> bool:
+    """用文件开头一段数据试压缩，压缩率不足 10% 的文件直接存储（ZIP_STORED）"""
+    with open(path, 'rb') as f:
+        sample = f.read(COMPRESS_PROBE_BYTES)
+    if not sample:
+        return False
+    return len(zlib.compress(sample, 1)) < 0.9 * len(sample)
+
+
+def _zip_entries(paths: List[str]):
+    """
+    逐块生成 zip 流（同步生成器，在线程中驱动）：
+    源文件按 TRANSFER_CHUNK_SIZE 读取后直接写入 zip，不产生临时副本
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w') as zipf:
+        for path in paths:
+            compress_type = zipfile.ZIP_DEFLATED if _is_compressible(path) else zipfile.ZIP_STORED
+            zinfo = zipfile.ZipInfo.from_file(path, os.path.basename(path))
+            zinfo.compress_type = compress_type
+            logger.info(f"打包 {zinfo.filename}: {zinfo.file_size} bytes，"
+                        f"{'压缩' if compress_type == zipfile.ZIP_DEFLATED else '不压缩'}")
+
+            with open(path, 'rb') as src, zipf.open(zinfo, 'w') as dst:
+                for block in iter(lambda: src.read(TRANSFER_CHUNK_SIZE), b''):
+                    dst.write(block)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            yield sink.drain()
+    # 中央目录
+    yield sink.drain()
+
+
+async def _multipart_zip_body(scan_id: str, paths: List[str], boundary: str, digest):
+    """
+    multipart/form-data 请求体：scan_id、is_zip 字段在前，zip 流在中间，
+    整个 zip 的 sha256 作为 checksum 字段放在最后，接收端可以边收边校验
+    """
+    def field(name, value):
+        return (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                f'{value}\r\n').encode('utf-8')
+
+    yield field('scan_id', scan_id)
+    yield field('is_zip', 'true')
+    yield (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{scan_id}.zip"\r\n'
+           f'Content-Type: application/zip\r\n\r\n').encode('utf-8')
+
+    # 读文件和压缩是阻塞操作，放到线程中逐块执行，不占用事件循环
+    loop = asyncio.get_running_loop()
+    chunks = _zip_entries(paths)
+    while True:
+        data = await loop.run_in_executor(None, next, chunks, None)
+        if data is None:
+            break
+        if data:
+            digest.update(data)
+            yield data
+
+    yield b'\r\n' + field('checksum', f'sha256:{digest.hexdigest()}')
+    yield f'--{boundary}--\r\n'.encode('utf-8')
+
+
+def _find_transfer_files(source_path: str) -> List[str]:
+    """扫描目录中需要传给客户端的 t.bmp 和 t.ply"""
+    paths = [os.path.join(source_path, name) for name in TRANSFER_FILES]
+    missing = [p for p in paths if not os.path.isfile(p)]
+    if missing:
+        raise Exception(f"在目录中未找到t.bmp和t.ply文件: {source_path}")
+    return paths
+
+
 async def transfer_files_to_client(scan_id: str, source_path: str, client_ip: str, client_port: int):
-    """将文件传输到客户端 - 使用 httpx 替代 aiohttp"""
+    """将文件流式传输到客户端：源文件逐块打包进请求体，不复制临时目录、不在内存中拼接整个 zip"""
     logger.info(
         f"开始传输文件: scan_id={scan_id}, source_path={source_path}, client_ip={client_ip}, client_port={client_port}")
 
@@ -122,9 +248,7 @@ async def transfer_files_to_client(scan_id: str, source_path: str, client_ip: st
         source_path = fix_path_separators(source_path)
 
         # 更新状态为传输中
-        if scan_id in scan_results:
-            scan_results[scan_id]['status'] = ScanStatus.TRANSFERRING
-            scan_results[scan_id]['message'] = '文件传输中'
+        _update_scan(scan_id, status=ScanStatus.TRANSFERRING, message='文件传输中')
 
         # 检查源路径是否存在
         if not os.path.exists(source_path):
@@ -132,104 +256,227 @@ async def transfer_files_to_client(scan_id: str, source_path: str, client_ip: st
             logger.error(error_msg)
             raise Exception(error_msg)
 
-        # 查找t.bmp和t.ply文件
-        t_bmp_path = None
-        t_ply_path = None
+        paths = _find_transfer_files(source_path)
 
-        for file in os.listdir(source_path):
-            if file == "t.bmp":
-                t_bmp_path = os.path.join(source_path, file)
-            elif file == "t.ply":
-                t_ply_path = os.path.join(source_path, file)
+        # 准备传输文件
+        client_url = f"http://{client_ip}:{client_port}/receive-file"
+        logger.info(f"传输到客户端URL: {client_url}")
 
-        # 检查是否找到两个文件
-        if not t_bmp_path or not t_ply_path:
-            error_msg = f"在目录中未找到t.bmp和t.ply文件: {source_path}"
+        boundary = uuid.uuid4().hex
+        digest = hashlib.sha256()
+        start_time = time.perf_counter()
+
+        # 使用 httpx 异步客户端以分块编码发送
+        async with httpx.AsyncClient(timeout=httpx.Timeout(60.0, read=300.0)) as client:
+            response = await client.post(
+                client_url,
+                content=_multipart_zip_body(scan_id, paths, boundary, digest),
+                headers={'Content-Type': f'multipart/form-data; boundary={boundary}'}
+            )
+
+        if response.status_code == 200:
+            result = response.json()
+            logger.info(f"文件传输成功: {result}，耗时 {time.perf_counter() - start_time:.2f}s，"
+                        f"sha256={digest.hexdigest()}")
+
+            # 更新扫描结果
+            _update_scan(scan_id, status=ScanStatus.COMPLETED, message='扫描完成且文件已传输',
+                         download_url=result.get('download_url'))
+            return True
+        else:
+            error_msg = f"文件传输失败: HTTP {response.status_code} - {response.text}"
             logger.error(error_msg)
             raise Exception(error_msg)
 
-        # 创建临时目录存放要传输的文件
-        temp_dir = os.path.join(UPLOAD_DIR, f"transfer_{scan_id}")
-        os.makedirs(temp_dir, exist_ok=True)
-
-        # 复制文件到临时目录
-        shutil.copy(t_bmp_path, temp_dir)
-        shutil.copy(t_ply_path, temp_dir)
-
-        # 压缩临时目录
-        zip_path = os.path.join(UPLOAD_DIR, f"{scan_id}.zip")
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for file in os.listdir(temp_dir):
-                file_path = os.path.join(temp_dir, file)
-                zipf.write(file_path, file)
+    except Exception as e:
+        error_msg = f'文件传输失败: {str(e)}'
+        logger.error(error_msg)
 
-        # 清理临时目录
-        shutil.rmtree(temp_dir)
+        # 更新错误状态
+        _update_scan(scan_id, status=ScanStatus.FAILED, message=error_msg)
 
-        logger.info(f"创建传输ZIP文件: {zip_path}")
+        return False
 
-        # 准备传输文件
-        client_url = f"http://{client_ip}:{client_port}/receive-file"
-        logger.info(f"传输到客户端URL: {client_url}")
 
-        # 使用 httpx 异步客户端发送文件
-        async with httpx.AsyncClient() as client:
-            # 读取文件内容
-            async with aiofiles.open(zip_path, 'rb') as f:
-                file_content = await f.read()
-
-            # 构建 multipart 表单数据
-            files = {
-                'file': (os.path.basename(zip_path), file_content, 'application/zip'),
-                'scan_id': (None, scan_id),
-                'is_zip': (None, 'true')
-            }
+def _daemon_request(payload: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    """向常驻采集进程发送一行 JSON 请求并读取一行应答"""
+    with socket.create_connection(CAPTURE_DAEMON_ADDR, timeout=timeout) as sock:
+        sock.sendall((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError("采集进程未返回应答")
+    return json.loads(line.decode("utf-8"))
 
-            logger.info(f"开始发送文件: {zip_path} (大小: {len(file_content)} bytes)")
 
-            # 发送 POST 请求
-            response = await client.post(client_url, files=files)
+def ensure_capture_daemon() -> bool:
+    """采集进程未运行时用 Python3.9 启动它，并等待其开始监听"""
+    global _daemon_proc
 
-            if response.status_code == 200:
-                result = response.json()
-                logger.info(f"文件传输成功: {result}")
+    try:
+        _daemon_request({"cmd": "ping"}, timeout=2)
+        return True
+    except (OSError, ValueError):
+        pass
+
+    with _daemon_lock:
+        if _daemon_proc is None or _daemon_proc.poll() is not None:
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            cmd = [python_path, CAPTURE_DAEMON_SCRIPT,
+                   "--host", CAPTURE_DAEMON_ADDR[0], "--port", str(CAPTURE_DAEMON_ADDR[1])]
+            logger.info(f"启动采集进程: {' '.join(cmd)}")
+            _daemon_proc = subprocess.Popen(cmd, cwd=script_dir, start_new_session=True)
+
+        deadline = time.monotonic() + CAPTURE_DAEMON_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if _daemon_proc.poll() is not None:
+                logger.error(f"采集进程启动失败，返回码: {_daemon_proc.returncode}")
+                return False
+            try:
+                _daemon_request({"cmd": "ping"}, timeout=2)
+                return True
+            except (OSError, ValueError):
+                time.sleep(0.2)
 
-                # 更新扫描结果
-                if scan_id in scan_results:
-                    scan_results[scan_id]['status'] = ScanStatus.COMPLETED
-                    scan_results[scan_id]['message'] = '扫描完成且文件已传输'
-                    scan_results[scan_id]['download_url'] = result.get('download_url')
+    logger.error("等待采集进程启动超时")
+    return False
 
-                # 清理临时文件
-                os.remove(zip_path)
-                logger.info(f"删除临时ZIP文件: {zip_path}")
 
-                return True
-            else:
-                error_msg = f"文件传输失败: HTTP {response.status_code} - {response.text}"
-                logger.error(error_msg)
-                raise Exception(error_msg)
+def stop_capture_daemon() -> bool:
+    """
+    让采集进程退出并释放相机，返回进程是否确认已停止。
+    退回到 Capture.py 之前必须先调用，否则两个进程会争用同一台相机。
+    """
+    global _daemon_proc
 
-    except Exception as e:
-        error_msg = f'文件传输失败: {str(e)}'
-        logger.error(error_msg)
+    try:
+        _daemon_request({"cmd": "shutdown"}, timeout=2)
+    except (OSError, ValueError):
+        pass
+
+    with _daemon_lock:
+        proc = _daemon_proc
+        if proc is not None:
+            try:
+                proc.wait(timeout=CAPTURE_DAEMON_STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                logger.warning("采集进程未按时退出，强制结束")
+                proc.kill()
+                proc.wait()
+            _daemon_proc = None
+            return True
+
+    # 不是本服务启动的采集进程：只能等它停止监听
+    deadline = time.monotonic() + CAPTURE_DAEMON_STOP_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            _daemon_request({"cmd": "ping"}, timeout=2)
+        except (OSError, ValueError):
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def _capture_via_daemon(scan_config: ScanConfig, final_output_dir: str,
+                        final_output_path: str) -> Dict[str, Any]:
+    """通过常驻采集进程执行一次采集（相机保持打开，只下发变化的参数）"""
+    job = {
+        "cmd": "capture",
+        # 采集进程的工作目录可能不同，统一传绝对路径
+        "output_dir": os.path.abspath(final_output_dir),
+        "folder_name": scan_config.folder_name,
+        "camera_ip": scan_config.camera_ip,
+        "ir_exposure": scan_config.ir_exposure,
+        "ir_gain": scan_config.ir_gain,
+        "rgb_exposure": scan_config.rgb_exposure,
+        "work_mode": scan_config.work_mode,
+    }
 
-        # 更新错误状态
-        if scan_id in scan_results:
-            scan_results[scan_id]['status'] = ScanStatus.FAILED
-            scan_results[scan_id]['message'] = error_msg
+    start_time = datetime.now()
+    os.makedirs(final_output_path, exist_ok=True)
+    reply = _daemon_request(job, timeout=CAPTURE_TIMEOUT)
+    execution_time = (datetime.now() - start_time).total_seconds()
+
+    success = bool(reply.get("success"))
+    logger.info(f"采集进程应答: {reply.get('message')}，采集耗时 {reply.get('capture_time')}")
+
+    scan_info = {
+        'success': success,
+        'returncode': 0 if success else 1,
+        'camera_found': bool(reply.get('camera_ip')),
+        'camera_ip': reply.get('camera_ip'),
+        'camera_connected': bool(reply.get('camera_connected')),
+        'parameters_set': reply.get('parameters_set', []),
+        'data_captured': bool(reply.get('data_captured')),
+        'data_saved': success,
+        'save_path': final_output_path,
+        'depth_range': None,
+        'execution_time': execution_time,
+        'capture_time': reply.get('capture_time'),
+        'reconnected': reply.get('reconnected', False),
+        'stdout': reply.get('stdout', ''),
+        'stderr': ''
+    }
 
-        return False
+    return {
+        'status': ScanStatus.COMPLETED if success else ScanStatus.FAILED,
+        'success': success,
+        'message': reply.get('message', '扫描完成' if success else '扫描失败'),
+        'details': scan_info,
+        'timestamp': datetime.now().isoformat(),
+        'execution_time': execution_time,
+        'save_path': final_output_path
+    }
 
 
 # 核心扫描函数
 def capture_3d_scan(scan_config: ScanConfig, scan_id: str) -> Dict[str, Any]:
-    script_path = "Capture.py"
-
     # 路径分隔符
     final_output_dir = fix_path_separators(scan_config.output_dir or "./scans")
     final_output_path = os.path.join(final_output_dir, scan_config.folder_name)
 
+    # 优先交给常驻采集进程；进程不可用时退回到每次启动 Capture.py
+    if USE_CAPTURE_DAEMON:
+        if ensure_capture_daemon():
+            try:
+                return _capture_via_daemon(scan_config, final_output_dir, final_output_path)
+            except socket.timeout:
+                error_msg = '采集超时（超过2分钟）'
+                logger.error(error_msg)
+                return {
+                    'status': ScanStatus.TIMEOUT,
+                    'success': False,
+                    'message': error_msg,
+                    'details': {'error': error_msg},
+                    'timestamp': datetime.now().isoformat(),
+                    'execution_time': CAPTURE_TIMEOUT,
+                    'save_path': final_output_path
+                }
+            except (OSError, ValueError) as e:
+                logger.error(f"采集进程通信失败: {e}")
+
+        # 采集进程可能还占着相机：确认它已退出后才启动 Capture.py
+        if not stop_capture_daemon():
+            error_msg = '采集进程无响应且无法停止，相机仍被占用'
+            logger.error(error_msg)
+            return {
+                'status': ScanStatus.FAILED,
+                'success': False,
+                'message': error_msg,
+                'details': {'error': error_msg},
+                'timestamp': datetime.now().isoformat(),
+                'execution_time': 0,
+                'save_path': final_output_path
+            }
+        logger.info("采集进程已停止，改为启动 Capture.py")
+
+    return _capture_via_subprocess(scan_config, final_output_dir, final_output_path)
+
+
+def _capture_via_subprocess(scan_config: ScanConfig, final_output_dir: str,
+                            final_output_path: str) -> Dict[str, Any]:
+    script_path = "Capture.py"
+
     cmd = [python_path, script_path]
     cmd.extend(["--output-dir", final_output_dir])
     cmd.extend(["--folder-name", scan_config.folder_name])
@@ -262,7 +509,7 @@ def capture_3d_scan(scan_config: ScanConfig, scan_id: str) -> Dict[str, Any]:
             capture_output=True,
             encoding='utf-8',
             text=True,
-            timeout=120,
+            timeout=CAPTURE_TIMEOUT,
             cwd=script_dir
         )
 
@@ -365,9 +612,72 @@ async def root():
     return {"message": "3D相机扫描API服务运行中", "status": "active", "version": "1.1.0"}
 
 
+def _scan_response(scan_id: str) -> ScanResponse:
+    result = scan_results[scan_id]
+    return ScanResponse(
+        scan_id=scan_id,
+        status=result['status'],
+        success=result['success'],
+        message=result['message'],
+        details=result['details'],
+        timestamp=result['timestamp'],
+        execution_time=result.get('execution_time'),
+        save_path=result.get('save_path'),
+        download_url=result.get('download_url')
+    )
+
+
+def _update_scan(scan_id: str, **fields):
+    """更新扫描状态并推送给该扫描的所有事件流订阅者（只在事件循环线程调用）"""
+    if scan_id not in scan_results:
+        return
+    scan_results[scan_id].update(fields)
+    snapshot = model_dump(_scan_response(scan_id))
+    for queue in scan_subscribers.get(scan_id, []):
+        queue.put_nowait(snapshot)
+
+
+def _run_scan_job(loop, scan_config: ScanConfig, scan_id: str) -> Dict[str, Any]:
+    """扫描线程池中执行：标记为运行中，然后执行阻塞的采集"""
+    loop.call_soon_threadsafe(lambda: _update_scan(
+        scan_id, status=ScanStatus.RUNNING, message='扫描进行中'))
+    return capture_3d_scan(scan_config, scan_id)
+
+
+async def _scan_job(scan_config: ScanConfig, scan_id: str):
+    """排队执行一个扫描任务，完成后写回状态"""
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(scan_executor, _run_scan_job, loop, scan_config, scan_id)
+    except Exception as e:
+        error_msg = f'执行错误: {str(e)}'
+        logger.error(error_msg)
+        result = {
+            'status': ScanStatus.FAILED,
+            'success': False,
+            'message': error_msg,
+            'details': {'error': str(e)},
+            'timestamp': datetime.now().isoformat()
+        }
+
+    # 如果扫描成功且需要传输到客户端
+    if result['success'] and scan_config.transfer_to_client:
+        result['needs_transfer'] = True
+        result['message'] = '扫描完成，等待文件传输'
+
+    _update_scan(scan_id, **result)
+
+
 @app.post("/scan/", response_model=ScanResponse)
-async def start_scan(scan_config: ScanConfig, background_tasks: BackgroundTasks):
-    """启动单个扫描任务"""
+async def start_scan(scan_config: ScanConfig, wait: bool = False):
+    """
+    提交扫描任务，立即返回 scan_id（状态 pending）。
+    任务在扫描线程池中排队执行，通过 /scan/{scan_id} 轮询或 /scan/{scan_id}/events 订阅完成状态；
+    wait=true 时等到扫描结束再返回（等待期间不阻塞事件循环）。
+    """
+    if len(scan_jobs) >= MAX_PENDING_SCANS:
+        raise HTTPException(status_code=429, detail="扫描队列已满，请稍后再试")
+
     scan_id = f"scan_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
 
     # 扫描配置中的路径
@@ -377,33 +687,22 @@ async def start_scan(scan_config: ScanConfig, background_tasks: BackgroundTasks)
 
     # 使用model_dump()
     scan_results[scan_id] = {
-        'status': ScanStatus.RUNNING,
+        'status': ScanStatus.PENDING,
         'success': False,
-        'message': '扫描进行中',
+        'message': f'扫描排队中（前面还有 {len(scan_jobs)} 个任务）',
         'details': {},
         'timestamp': datetime.now().isoformat(),
         'scan_config': model_dump(fixed_config)
     }
 
-    # 执行扫描
-    result = capture_3d_scan(fixed_config, scan_id)
-    scan_results[scan_id].update(result)
+    job = asyncio.create_task(_scan_job(fixed_config, scan_id))
+    scan_jobs[scan_id] = job
+    job.add_done_callback(lambda _: scan_jobs.pop(scan_id, None))
 
-    # 如果扫描成功且需要传输到客户端
-    if result['success'] and fixed_config.transfer_to_client:
-        scan_results[scan_id]['needs_transfer'] = True
-        scan_results[scan_id]['message'] = '扫描完成，等待文件传输'
+    if wait:
+        await asyncio.shield(job)
 
-    return ScanResponse(
-        scan_id=scan_id,
-        status=result['status'],
-        success=result['success'],
-        message=result['message'],
-        details=result['details'],
-        timestamp=result['timestamp'],
-        execution_time=result.get('execution_time'),
-        save_path=result.get('save_path')
-    )
+    return _scan_response(scan_id)
 
 
 @app.get("/scan/{scan_id}", response_model=ScanResponse)
@@ -412,18 +711,40 @@ async def get_scan_status(scan_id: str):
     if scan_id not in scan_results:
         raise HTTPException(status_code=404, detail="扫描任务不存在")
 
-    result = scan_results[scan_id]
+    return _scan_response(scan_id)
 
-    return ScanResponse(
-        scan_id=scan_id,
-        status=result['status'],
-        success=result['success'],
-        message=result['message'],
-        details=result['details'],
-        timestamp=result['timestamp'],
-        execution_time=result.get('execution_time'),
-        save_path=result.get('save_path')
-    )
+
+@app.get("/scan/{scan_id}/events")
+async def scan_events(scan_id: str):
+    """以 SSE 推送扫描状态变化，扫描结束后关闭事件流"""
+    if scan_id not in scan_results:
+        raise HTTPException(status_code=404, detail="扫描任务不存在")
+
+    queue = asyncio.Queue()
+    scan_subscribers.setdefault(scan_id, []).append(queue)
+
+    async def event_stream():
+        try:
+            snapshot = model_dump(_scan_response(scan_id))
+            while True:
+                yield f"event: status\ndata: {json.dumps(snapshot, ensure_ascii=False, default=str)}\n\n"
+                if snapshot['status'] in SCAN_FINAL_STATES:
+                    break
+                try:
+                    snapshot = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # 保活注释行，防止代理断开空闲连接
+                    yield ": keep-alive\n\n"
+                    snapshot = model_dump(_scan_response(scan_id))
+        finally:
+            subscribers = scan_subscribers.get(scan_id, [])
+            if queue in subscribers:
+                subscribers.remove(queue)
+            if not subscribers:
+                scan_subscribers.pop(scan_id, None)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
 
 
 @app.post("/transfer-file/")
@@ -454,6 +775,106 @@ async def transfer_file(transfer_request: FileTransferRequest, background_tasks:
     return {"message": "文件传输已启动", "scan_id": transfer_request.scan_id}
 
 
+def _scan_dir(scan_id: str) -> str:
+    if scan_id not in scan_results:
+        raise HTTPException(status_code=404, detail="扫描任务不存在")
+    save_path = scan_results[scan_id].get('save_path')
+    if not scan_results[scan_id]['success'] or not save_path:
+        raise HTTPException(status_code=400, detail="扫描未成功完成，无法下载文件")
+    return fix_path_separators(save_path)
+
+
+# _parse_range 的返回值：Range 合法但超出文件范围，应答 416
+RANGE_UNSATISFIABLE = object()
+
+
+def _parse_range(range_header: str, size: int):
+    """
+    解析单段 Range（bytes=a-b / bytes=a- / bytes=-n），返回 (start, end)。
+    多段 / 无法解析的 Range 返回 None，调用方忽略该头并返回完整文件；
+    合法但超出文件范围时返回 RANGE_UNSATISFIABLE。
+    """
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', range_header.strip())
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # 最后 n 个字节
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        return RANGE_UNSATISFIABLE
+    return start, end
+
+
+def _iter_file(path: str, start: int, length: int):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(TRANSFER_CHUNK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+@app.get("/scan/{scan_id}/files")
+async def list_scan_files(scan_id: str):
+    """列出扫描目录中的文件及大小，配合 /scan/{scan_id}/files/{filename} 按需拉取"""
+    scan_dir = _scan_dir(scan_id)
+    if not os.path.isdir(scan_dir):
+        raise HTTPException(status_code=404, detail=f"扫描目录不存在: {scan_dir}")
+
+    files = [
+        {"filename": entry.name, "size": entry.stat().st_size,
+         "url": f"/scan/{scan_id}/files/{entry.name}"}
+        for entry in sorted(os.scandir(scan_dir), key=lambda e: e.name) if entry.is_file()
+    ]
+    return {"scan_id": scan_id, "files": files}
+
+
+@app.get("/scan/{scan_id}/files/{filename}")
+async def download_scan_file(scan_id: str, filename: str, request: Request):
+    """
+    拉取式下载扫描文件，支持 HTTP Range：传输中断后客户端带 Range: bytes=<已收字节>- 续传。
+    ETag 由文件大小和修改时间构成，If-Range 不匹配时返回完整文件。
+    """
+    scan_dir = _scan_dir(scan_id)
+    if os.path.basename(filename) != filename or filename in ('', '.', '..'):
+        raise HTTPException(status_code=400, detail="非法文件名")
+
+    path = os.path.join(scan_dir, filename)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="文件不存在")
+
+    st = os.stat(path)
+    size = st.st_size
+    etag = f'"{size:x}-{st.st_mtime_ns:x}"'
+    headers = {"Accept-Ranges": "bytes", "ETag": etag}
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range == etag):
+        byte_range = _parse_range(range_header, size)
+        if byte_range is RANGE_UNSATISFIABLE:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}", **headers})
+
+        if byte_range is not None:
+            start, end = byte_range
+            length = end - start + 1
+            headers.update({"Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(length)})
+            return StreamingResponse(_iter_file(path, start, length), status_code=206,
+                                     media_type="application/octet-stream", headers=headers)
+
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(_iter_file(path, 0, size), media_type="application/octet-stream",
+                             headers=headers)
+
+
 @app.get("/batch/{batch_id}", response_model=BatchScanResponse)
 async def get_batch_status(batch_id: str):
     """获取批量扫描任务状态"""
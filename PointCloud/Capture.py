@@ -8,16 +8,16 @@ import datetime
 
 
 # 打印相机信息列表
-def PrintCamInfoList(camInfoList):
+def PrintCamInfoList(camInfoList, out=None):
     # 遍历所有发现的相机信息
     for i in range(len(camInfoList)):
         # 输出相机索引、IP地址、错误码和系统版本
         print("索引", i, ":", camInfoList[i].cameraIP, "返回码:",
-              camInfoList[i].errorCode, "相机版本:", camInfoList[i].cameraSystemVersion)
+              camInfoList[i].errorCode, "相机版本:", camInfoList[i].cameraSystemVersion, file=out)
 
 
 # 打开指定IP的相机
-def OpenOneCamera(cam, camInfoList, strWantedIP=None):
+def OpenOneCamera(cam, camInfoList, strWantedIP=None, out=None):
     # 遍历相机列表尝试连接
     for i in range(len(camInfoList)):
         # 如果指定了IP且不匹配则跳过
@@ -26,11 +26,11 @@ def OpenOneCamera(cam, camInfoList, strWantedIP=None):
         # 尝试打开相机
         if (cam.Open(camInfoList[i]) == AC_OK):
             print("\033[1;32m", "成功打开",
-                  camInfoList[i].cameraIP, "\033[0m")
+                  camInfoList[i].cameraIP, "\033[0m", file=out)
             return AC_OK, camInfoList[i]  # 返回成功状态和相机信息
 
 
-    print("\033[1;31m" "无法打开任何相机。", "\033[0m")
+    print("\033[1;31m" "无法打开任何相机。", "\033[0m", file=out)
     return AC_E_NO_CAMERA, CameraInfo()  # 返回错误代码和空相机信息
 
 
@@ -54,7 +54,7 @@ def OutputOnlyPoint3D(camInfo):
 
 
 # 自定义创建输出目录函数
-def create_custom_outdir(base_path=None, custom_name=None):
+def create_custom_outdir(base_path=None, custom_name=None, out=None):
     if base_path is None:
         base_path = '.'
 
@@ -71,23 +71,23 @@ def create_custom_outdir(base_path=None, custom_name=None):
     if not isExists:
         # 如果不存在则创建目录
         os.makedirs(path)
-        print(path + ' 创建成功')
+        print(path + ' 创建成功', file=out)
         return path
     else:
         # 如果目录存在则不创建，并提示目录已存在
-        print(path + ' 目录已存在')
+        print(path + ' 目录已存在', file=out)
         return path
 
 
 # 保存捕获的各种图像数据
-def SaveImages(camInfo, frameData, save_path=None):
+def SaveImages(camInfo, frameData, save_path=None, out=None):
     if save_path is None:
-        filePath = create_custom_outdir()
+        filePath = create_custom_outdir(out=out)
     else:
         filePath = create_custom_outdir(base_path=save_path.get('base_path', '.'),
-                                        custom_name=save_path.get('custom_name'))
+                                        custom_name=save_path.get('custom_name'), out=out)
 
-    print(f"数据保存到: {filePath}")
+    print(f"数据保存到: {filePath}", file=out)
 
     # 根据数据类型调用不同的保存函数
     if frameData.textureSize:
@@ -120,10 +120,11 @@ def SaveImages(camInfo, frameData, save_path=None):
 
 
 # 设置相机参数
-def SetCameraParameters(cam, camInfo, camera_params):
+def SetCameraParameters(cam, camInfo, camera_params, out=None):
     """
     设置相机参数
     camera_params: 字典，包含要设置的参数和值
+    out: 打印输出的目标（默认 sys.stdout）
     """
     if not camera_params:
         return AC_OK
@@ -146,18 +147,18 @@ def SetCameraParameters(cam, camInfo, camera_params):
                 param_type = getattr(ParamType, mapped_param_name)
                 ret = cam.SetValue(camInfo, param_type, param_value)
                 if ret == AC_OK:
-                    print(f"成功设置参数 {param_name} -> {mapped_param_name} = {param_value}")
+                    print(f"成功设置参数 {param_name} -> {mapped_param_name} = {param_value}", file=out)
                 else:
-                    print(f"设置参数 {param_name} -> {mapped_param_name} 失败，错误码: {ret}")
+                    print(f"设置参数 {param_name} -> {mapped_param_name} 失败，错误码: {ret}", file=out)
             else:
                 # 如果参数名不是枚举，尝试作为字符串参数设置
                 ret = cam.SetValue(camInfo, mapped_param_name, param_value)
                 if ret == AC_OK:
-                    print(f"成功设置参数 {param_name} -> {mapped_param_name} = {param_value}")
+                    print(f"成功设置参数 {param_name} -> {mapped_param_name} = {param_value}", file=out)
                 else:
-                    print(f"设置参数 {param_name} -> {mapped_param_name} 失败，错误码: {ret}")
+                    print(f"设置参数 {param_name} -> {mapped_param_name} 失败，错误码: {ret}", file=out)
         except Exception as e:
-            print(f"设置参数 {param_name} 时发生错误: {e}")
+            print(f"设置参数 {param_name} 时发生错误: {e}", file=out)
 
     return AC_OK
 
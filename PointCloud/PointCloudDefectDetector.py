@@ -10,12 +10,16 @@ import threading
 import time
 import zipfile
 from datetime import datetime
-import aiofiles
 
 import requests
 import numpy as np
 from dianyun.cse.pointcloud_project.src.sss_API import PointCloudAPI
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, BackgroundTasks
+from dianyun.cse.pointcloud_project.src.detection_result import DetectionResult
+from dianyun.cse.pointcloud_project.src.defect_clustering import (
+    DEFAULT_MIN_POINTS, DEFAULT_VOXEL_SIZE, cluster_defects,
+)
+from PointCloud.streaming_upload import UploadError, parse_upload
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
 import uvicorn
 # 设置日志
 logging.basicConfig(level=logging.INFO)
@@ -28,69 +32,171 @@ client_app = FastAPI(title="3D扫描客户端文件接收服务")
 CLIENT_STORAGE = "./client_scans"
 os.makedirs(CLIENT_STORAGE, exist_ok=True)
 
+# 等待文件传输 + 解压完成的默认超时（秒）
+DEFAULT_TRANSFER_TIMEOUT = 60
+# 接收服务不在本进程时，轮询扫描目录的间隔（秒）
+SCAN_POLL_INTERVAL = 0.5
+# 无人等待的到达记录（等待方已超时后才到达）保留的时长（秒），超过后清理
+SCAN_ARRIVAL_TTL = 600
+
+
+class ScanArrival:
+    """一次扫描文件到达客户端的完成事件：接收服务在保存 / 解压结束后置位，检测器在另一个线程等待"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.scan_dir = None
+        self.error = None
+        self.created = time.monotonic()
+
+
+# scan_id -> ScanArrival；接收可能早于等待，先到的一方创建
+_scan_arrivals = {}
+_scan_arrivals_lock = threading.Lock()
+
+
+def _scan_arrival(scan_id: str) -> ScanArrival:
+    with _scan_arrivals_lock:
+        # 等待方超时之后才到达的记录不会再被取走，按 SCAN_ARRIVAL_TTL 清理
+        now = time.monotonic()
+        stale = [k for k, a in _scan_arrivals.items()
+                 if a.event.is_set() and now - a.created > SCAN_ARRIVAL_TTL]
+        for k in stale:
+            del _scan_arrivals[k]
+        return _scan_arrivals.setdefault(scan_id, ScanArrival())
+
+
+def notify_scan_arrived(scan_id: str, scan_dir: str = None, error: str = None):
+    """扫描文件已落盘（或接收失败），唤醒等待该 scan_id 的检测器"""
+    arrival = _scan_arrival(scan_id)
+    arrival.scan_dir = scan_dir
+    arrival.error = error
+    arrival.event.set()
+
+
+def wait_for_scan(scan_id: str, timeout: float = DEFAULT_TRANSFER_TIMEOUT) -> str:
+    """
+    等待指定 scan_id 的文件接收并解压完成，返回扫描目录。
+    超时抛出 TimeoutError，接收 / 解压失败抛出 RuntimeError。
+    """
+    arrival = _scan_arrival(scan_id)
+    try:
+        if not arrival.event.wait(timeout):
+            raise TimeoutError(f"等待扫描文件超时（{timeout}s）: {scan_id}")
+        if arrival.error:
+            raise RuntimeError(arrival.error)
+        return arrival.scan_dir
+    finally:
+        with _scan_arrivals_lock:
+            _scan_arrivals.pop(scan_id, None)
+
+
+def poll_for_scan(scan_id: str, timeout: float = DEFAULT_TRANSFER_TIMEOUT) -> str:
+    """
+    接收服务不在本进程时（无法收到 notify_scan_arrived），轮询 CLIENT_STORAGE/<scan_id>，
+    出现 .ply 且 ZIP 已解压删除后返回扫描目录；超时抛出 TimeoutError。
+    """
+    scan_dir = os.path.join(CLIENT_STORAGE, scan_id)
+    deadline = time.monotonic() + timeout
+    while True:
+        if (glob.glob(os.path.join(scan_dir, "*.ply"))
+                and not glob.glob(os.path.join(scan_dir, "*.zip"))):
+            return scan_dir
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"等待扫描文件超时（{timeout}s）: {scan_id}")
+        time.sleep(SCAN_POLL_INTERVAL)
+
+
+def find_scan_ply(scan_dir: str):
+    """扫描目录中的点云文件：优先 t.ply，否则取第一个 .ply"""
+    t_ply_path = os.path.join(scan_dir, "t.ply")
+    if os.path.exists(t_ply_path):
+        return t_ply_path
+
+    print(f"文件不存在: {t_ply_path}")
+    # 尝试寻找其他可能的点云文件
+    ply_files = sorted(glob.glob(os.path.join(scan_dir, "*.ply")))
+    if ply_files:
+        print(f"使用替代文件: {ply_files[0]}")
+        return ply_files[0]
+    return None
+
 
 @client_app.post("/receive-file")
-async def receive_file(
-        background_tasks: BackgroundTasks,
-        scan_id: str = Form(...),
-        is_zip: str = Form(...),
-        file: UploadFile = File(...)
-):
-    """接收从服务器传输的文件"""
-    logger.info(f"接收到文件传输请求: scan_id={scan_id}, is_zip={is_zip}, filename={file.filename}")
+async def receive_file(request: Request, background_tasks: BackgroundTasks):
+    """
+    接收从服务器传输的文件（multipart 字段：scan_id、is_zip、file、checksum="sha256:<hex>"）。
+    文件边收边写盘并计算 sha256，校验通过后移动到扫描目录；ZIP 在后台线程中解压。
+    """
+    try:
+        upload = await parse_upload(request, CLIENT_STORAGE)
+    except UploadError as e:
+        logger.error(e.detail)
+        if e.fields.get("scan_id"):
+            notify_scan_arrived(e.fields["scan_id"], error=e.detail)
+        raise
+
+    scan_id = upload.fields.get("scan_id")
+    is_zip = upload.fields.get("is_zip", "false")
+    logger.info(f"接收到文件传输请求: scan_id={scan_id}, is_zip={is_zip}, filename={upload.filename}")
+
+    if not scan_id or os.path.basename(scan_id) != scan_id or upload.tmp_path is None:
+        upload.discard()
+        error_msg = "缺少 scan_id 或文件，或 scan_id 非法"
+        if scan_id:
+            notify_scan_arrived(scan_id, error=error_msg)
+        raise HTTPException(status_code=422, detail=error_msg)
 
     try:
+        digest = upload.sha256.hexdigest()
+        expected = upload.fields.get("checksum")
+        if not expected:
+            raise ValueError("缺少 checksum 字段，无法校验文件完整性")
+        if expected.lower() != f"sha256:{digest}":
+            raise ValueError(f"校验和不匹配: 期望 {expected}，实际 sha256:{digest}")
+
         scan_dir = os.path.join(CLIENT_STORAGE, scan_id)
         os.makedirs(scan_dir, exist_ok=True)
         logger.info(f"创建扫描目录: {scan_dir}")
 
         is_zip_bool = is_zip.lower() == 'true'
-        filename = file.filename or f"{scan_id}.file"
+        filename = upload.filename or f"{scan_id}.file"
+        file_path = os.path.join(scan_dir, filename)
+        os.replace(upload.tmp_path, file_path)
+        logger.info(f"文件保存成功: {file_path} (大小: {upload.size} bytes, sha256: {digest})")
 
         if is_zip_bool:
-            logger.info(f"接收ZIP文件: {filename}")
-            zip_path = os.path.join(scan_dir, filename)
-
-            # 保存ZIP文件
-            file_content = await file.read()
-            async with aiofiles.open(zip_path, 'wb') as f:
-                await f.write(file_content)
-            logger.info(f"ZIP文件保存成功: {zip_path} (大小: {len(file_content)} bytes)")
-
-            # 在后台任务中解压ZIP文件
-            background_tasks.add_task(extract_zip_file, zip_path, scan_dir)
+            # 在后台线程中解压ZIP文件
+            background_tasks.add_task(extract_zip_file, file_path, scan_dir, scan_id)
 
             return {
                 "status": "success",
                 "message": "文件接收成功，正在解压",
                 "scan_id": scan_id,
-                "save_path": scan_dir
+                "save_path": scan_dir,
+                "sha256": digest
             }
-        else:
-            logger.info(f"接收单个文件: {filename}")
-            file_path = os.path.join(scan_dir, filename)
-
-            # 保存文件
-            file_content = await file.read()
-            async with aiofiles.open(file_path, 'wb') as f:
-                await f.write(file_content)
-            logger.info(f"文件保存成功: {file_path} (大小: {len(file_content)} bytes)")
 
-            return {
-                "status": "success",
-                "message": "文件接收完成",
-                "scan_id": scan_id,
-                "save_path": file_path
-            }
+        notify_scan_arrived(scan_id, scan_dir)
+        return {
+            "status": "success",
+            "message": "文件接收完成",
+            "scan_id": scan_id,
+            "save_path": file_path,
+            "sha256": digest
+        }
 
     except Exception as e:
+        upload.discard()
         error_msg = f"文件接收失败: {str(e)}"
         logger.error(error_msg)
-        raise HTTPException(status_code=500, detail=error_msg)
+        notify_scan_arrived(scan_id, error=error_msg)
+        status_code = 400 if isinstance(e, ValueError) else 500
+        raise HTTPException(status_code=status_code, detail=error_msg)
 
 
-async def extract_zip_file(zip_path: str, extract_dir: str):
-    """在后台解压ZIP文件"""
+def extract_zip_file(zip_path: str, extract_dir: str, scan_id: str = None):
+    """解压ZIP文件：普通函数，BackgroundTasks 会在线程池中执行，不阻塞事件循环；完成后通知等待该 scan_id 的检测器"""
     try:
         logger.info(f"开始解压ZIP文件: {zip_path} -> {extract_dir}")
 
@@ -103,8 +209,13 @@ async def extract_zip_file(zip_path: str, extract_dir: str):
         os.remove(zip_path)
         logger.info(f"删除ZIP文件: {zip_path}")
 
+        if scan_id is not None:
+            notify_scan_arrived(scan_id, extract_dir)
+
     except Exception as e:
         logger.error(f"解压ZIP文件失败: {str(e)}")
+        if scan_id is not None:
+            notify_scan_arrived(scan_id, error=f"解压ZIP文件失败: {str(e)}")
 
 
 @client_app.get("/health")
@@ -165,7 +276,12 @@ class PointCloudDefectDetector:
                  camera_api_url="http://192.168.25.184:8000",
                  standard_part_path=r"E:\pointcloud_ai_project2\data\npy\standard_part.npy",
                  client_port=8001,
-                 start_file_receiver=True):
+                 start_file_receiver=True,
+                 inference_url=None,
+                 cluster_voxel_size=DEFAULT_VOXEL_SIZE,
+                 cluster_min_points=DEFAULT_MIN_POINTS,
+                 result_cache_mb=None,
+                 transfer_timeout=DEFAULT_TRANSFER_TIMEOUT):
         """
         点云缺陷检测器
 
@@ -174,16 +290,37 @@ class PointCloudDefectDetector:
             camera_api_url: 相机API地址（服务端IP）
             standard_part_path: 标准工件文件路径（服务端Windows路径）
             client_port: 客户端文件接收端口
-            start_file_receiver: 是否启动文件接收服务
+            start_file_receiver: 是否在本进程内启动文件接收服务；为 False 时（接收服务在其他进程）
+                                 改为轮询 CLIENT_STORAGE/<scan_id> 等待文件到达
+            inference_url: 常驻分割推理服务地址（见 seg_server.py），如 "unix:/tmp/pointnet_seg.sock"
+                           或 "http://127.0.0.1:9100"；为 None 时在本进程内加载模型推理
+            cluster_voxel_size: 缺陷点聚类的体素边长（mm），相邻体素内的缺陷点合并为一个缺陷区域
+            cluster_min_points: 缺陷区域最少点数，更小的区域视为噪声
+            result_cache_mb: 推理结果缓存的磁盘预算（MB），同一扫描文件重复检测时直接命中；None 表示不缓存
+            transfer_timeout: 等待扫描文件传输并解压完成的超时（秒）
         """
         self.defect_api_url = defect_api_url
         self.camera_api_url = camera_api_url
         self.standard_part_path = standard_part_path
         self.client_port = client_port
         self.client_storage = CLIENT_STORAGE
+        self.cluster_voxel_size = cluster_voxel_size
+        self.cluster_min_points = cluster_min_points
+        self.transfer_timeout = transfer_timeout
+        self.receiver_in_process = start_file_receiver
+
+        # 初始化推理后端：常驻推理服务，或本进程内的 PointCloudAPI（文档3的功能）
+        if inference_url is not None:
+            from dianyun.cse.pointcloud_project.src.seg_client import SegServerClient
+            self.pointcloud_api = SegServerClient(inference_url)
+        else:
+            self.pointcloud_api = PointCloudAPI("dianyun/cse/pointcloud_project", cache_max_mb=result_cache_mb)
 
-        # 初始化PointCloudAPI（文档3的功能）
-        self.pointcloud_api = PointCloudAPI("dianyun/cse/pointcloud_project")
+        # 启动时预热模型，第一次检测不再承担加载 checkpoint 的开销
+        try:
+            self.pointcloud_api.warmup()
+        except Exception as e:
+            print(f"模型预热失败: {e}")
 
         # 启动客户端文件接收服务
         if start_file_receiver:
@@ -215,7 +352,8 @@ class PointCloudDefectDetector:
         try:
             # 发送扫描请求
             print("开始扫描...")
-            response = requests.post(f"{self.camera_api_url}/scan/", json=scan_config, timeout=300)
+            response = requests.post(f"{self.camera_api_url}/scan/", json=scan_config,
+                                     params={"wait": "true"}, timeout=300)
             result = response.json()
             print("扫描结果:")
             print(json.dumps(result, indent=2, ensure_ascii=False))
@@ -241,15 +379,33 @@ class PointCloudDefectDetector:
                     )
                     transfer_result = transfer_response.json()
                     print("传输响应:", transfer_result)
-
-                    # 等待文件传输完成
-                    time.sleep(5)  # 给文件传输和解压留出时间
+                    if transfer_response.status_code != 200:
+                        return {
+                            "success": False,
+                            "message": f"文件传输请求失败: {transfer_result}",
+                            "scan_id": scan_id
+                        }
+
+                    # 等待接收服务通知本次 scan_id 的文件已保存并解压；
+                    # 接收服务不在本进程时只能轮询扫描目录
+                    try:
+                        if self.receiver_in_process:
+                            client_path = wait_for_scan(scan_id, self.transfer_timeout)
+                        else:
+                            client_path = poll_for_scan(scan_id, self.transfer_timeout)
+                    except (TimeoutError, RuntimeError) as e:
+                        return {
+                            "success": False,
+                            "message": f"文件传输失败: {e}",
+                            "scan_id": scan_id
+                        }
 
                     return {
                         "success": True,
                         "scan_id": scan_id,
                         "server_path": save_path,
-                        "client_path": os.path.join(self.client_storage, scan_id),
+                        "client_path": client_path,
+                        "ply_path": find_scan_ply(client_path),
                         "transferred_to_client": True,
                         "message": "扫描完成且文件已传输到客户端"
                     }
@@ -297,20 +453,10 @@ class PointCloudDefectDetector:
         scan_folders.sort(key=extract_timestamp, reverse=True)
         latest_scan_folder = scan_folders[0]
 
-        t_ply_path = os.path.join(latest_scan_folder, "t.ply")
-
-        # 检查文件是否存在
-        if os.path.exists(t_ply_path):
-            print(f"找到最新扫描文件: {t_ply_path}")
-            return t_ply_path
-        else:
-            print(f"文件不存在: {t_ply_path}")
-            # 尝试寻找其他可能的点云文件
-            ply_files = glob.glob(os.path.join(latest_scan_folder, "*.ply"))
-            if ply_files:
-                print(f"使用替代文件: {ply_files[0]}")
-                return ply_files[0]
-            return None
+        ply_path = find_scan_ply(latest_scan_folder)
+        if ply_path is not None:
+            print(f"找到最新扫描文件: {ply_path}")
+        return ply_path
 
     def detect_defects(self, ply_path=None):
         """
@@ -334,31 +480,22 @@ class PointCloudDefectDetector:
 
             # 确保返回的结果包含必要的字段
             if detection_result is None:
-                detection_result = {}
+                detection_result = DetectionResult()
 
             # 添加文件路径信息
             detection_result['pointcloud_file'] = ply_path
 
-            # 处理类别2的坐标点（缺陷点）
-            class2_coords = detection_result.get('class2_coordinates')
-            if class2_coords is not None:
-                # 转换格式为缺陷点列表
-                defect_points = []
-                for i, coords in enumerate(class2_coords):
-                    if len(coords) >= 3:
-                        defect_points.append({
-                            'x': coords[0],
-                            'y': coords[1],
-                            'z': coords[2],
-                            'distance': 0.0,  # 可以根据需要计算实际距离
-                            'point_id': i
-                        })
-
-                detection_result['defect_points'] = defect_points
-                detection_result['num_defects'] = len(defect_points)
-            else:
-                detection_result['defect_points'] = []
-                detection_result['num_defects'] = 0
+            # 类别2的坐标点（缺陷点）保持为 (M,3) 数组；
+            # defect_points / num_defects / class2_coordinates 在 UI 访问时才转换成 list / dict
+            class2_coords = detection_result.class2_coords
+
+            # 缺陷点聚成缺陷区域，每个区域一个打磨目标（质心），机械臂按区域移动
+            defect_regions = cluster_defects(
+                class2_coords, voxel_size=self.cluster_voxel_size, min_points=self.cluster_min_points
+            )
+            detection_result['defect_regions'] = defect_regions
+            detection_result['num_regions'] = len(defect_regions)
+            detection_result['grinding_targets'] = [[r['x'], r['y'], r['z']] for r in defect_regions]
 
             detection_result.setdefault('unit', 'mm')
             detection_result.setdefault('transform_matrix', [])
@@ -370,47 +507,55 @@ class PointCloudDefectDetector:
             return None
 
     def get_3d_coordinates(self):
-        """完整流程：扫描 → 传输 → 解压 → 检测 → 返回缺陷点坐标"""
+        """
+        完整流程：扫描 → 传输 → 解压 → 检测 → 返回缺陷点坐标
+
+        成功和失败都返回 DetectionResult（MutableMapping，按 dict 方式读取 success / message / scan_id ...）；
+        失败时没有缺陷点（num_defects 为 0）。需要 JSON 或普通 dict 时用 to_json() / to_dict()。
+        """
         # 1. 请求相机扫描（传输文件到客户端）
         print("步骤1: 请求相机扫描并传输文件到客户端...")
         scan_result = self.request_scan(transfer_to_client=True)
 
         if not scan_result['success']:
-            return {
-                "success": False,
-                "message": f"扫描失败: {scan_result.get('message')}",
-                "scan_id": scan_result.get('scan_id')
-            }
-
-        # 2. 等待文件传输和解压完成
-        print("步骤2: 等待文件传输和解压...")
-        time.sleep(3)
-
-        # 3. 使用文档3的API进行缺陷检测
+            return DetectionResult(
+                success=False,
+                message=f"扫描失败: {scan_result.get('message')}",
+                scan_id=scan_result.get('scan_id')
+            )
+
+        # 2. request_scan 已等到本次扫描的文件接收并解压完成
+        print(f"步骤2: 文件已就绪: {scan_result['client_path']}")
+        ply_path = scan_result.get('ply_path')
+        if ply_path is None:
+            return DetectionResult(
+                success=False,
+                message=f"扫描目录中没有点云文件: {scan_result['client_path']}",
+                scan_id=scan_result['scan_id'],
+                pointcloud_file=None
+            )
+
+        # 3. 使用文档3的API对本次扫描进行缺陷检测
         print("步骤3: 调用缺陷检测API...")
-        detection_result = self.detect_defects()
+        detection_result = self.detect_defects(ply_path)
 
         if not detection_result:
-            return {
-                "success": False,
-                "message": "缺陷检测失败",
-                "scan_id": scan_result['scan_id'],
-                "pointcloud_file": None
-            }
-
-        # 4. 返回结果
+            return DetectionResult(
+                success=False,
+                message="缺陷检测失败",
+                scan_id=scan_result['scan_id'],
+                pointcloud_file=ply_path
+            )
+
+        # 4. 返回结果（DetectionResult：坐标保持为数组，UI 需要时再用 to_dict() / to_json() 转换）
         print("步骤4: 返回检测结果...")
-        return {
+        detection_result.update({
             "success": True,
             "scan_id": scan_result['scan_id'],
-            "pointcloud_file": detection_result.get('pointcloud_file'),
-            "defect_points": detection_result.get('defect_points', []),
-            "num_defects": detection_result.get('num_defects', 0),
-            "unit": detection_result.get('unit', 'mm'),
-            "transform_matrix": detection_result.get('transform_matrix', []),
-            "class2_coordinates": detection_result.get('class2_coordinates'),
-            "message": f"检测完成，发现 {detection_result.get('num_defects', 0)} 个缺陷点"
-        }
+            "message": f"检测完成，发现 {detection_result.num_defects} 个缺陷点，"
+                       f"{detection_result.get('num_regions', 0)} 个缺陷区域"
+        })
+        return detection_result
 
 
 # 使用示例
@@ -439,14 +584,21 @@ if __name__ == "__main__":
         print(f"单位: {result['unit']}")
 
         # 打印缺陷点坐标
-        if result['defect_points']:
+        if result.num_defects:
             print("\n缺陷点坐标:")
-            for i, point in enumerate(result['defect_points'][:10]):  # 只显示前10个
-                print(f"缺陷点 {i + 1}: ({point['x']:.3f}, {point['y']:.3f}, {point['z']:.3f})")
+            for i, (x, y, z) in enumerate(result.class2_coords[:10]):  # 只显示前10个
+                print(f"缺陷点 {i + 1}: ({x:.3f}, {y:.3f}, {z:.3f})")
+
+        # 缺陷区域（打磨目标）
+        if result['defect_regions']:
+            print(f"\n缺陷区域数量: {result['num_regions']}")
+            for region in result['defect_regions'][:10]:
+                print(f"区域 {region['region_id']}: 质心 ({region['x']:.3f}, {region['y']:.3f}, {region['z']:.3f}), "
+                      f"{region['num_points']} 点, 范围 {[round(v, 2) for v in region['extent']]}")
 
         # 也可以直接显示类别2的坐标
-        if result.get('class2_coordinates'):
-            print(f"\n类别2坐标点数量: {len(result['class2_coordinates'])}")
+        if result.num_defects:
+            print(f"\n类别2坐标点数量: {result.num_defects}")
     else:
         print(f"✗ 操作失败: {result['message']}")
 
@@ -0,0 +1,159 @@
+"""
+streaming_upload.py
+作用：
+  客户端文件接收服务（PointCloudDefectDetector.py / UI/C-2.py）共用的流式 multipart 上传解析
+说明：
+  - 文件部分边收边写入 <存储目录>/.incoming/ 下的临时文件并计算 sha256，内存占用与文件大小无关
+  - 解析失败抛出 UploadError（HTTP 400），其中带有出错前已解析出的表单字段；
+    请求体在结束边界之前被截断同样视为失败（MultipartParser.finalize() 本身不检查）
+"""
+
+import hashlib
+import os
+import uuid
+
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:
+    from multipart.multipart import MultipartParser, parse_options_header
+
+
+# 上传按固定大小的块交给 multipart 解析器，文件部分边收边写盘、边算 sha256
+UPLOAD_CHUNK_SIZE = 1 << 20
+INCOMING_DIRNAME = ".incoming"
+# 普通表单字段的长度上限
+MAX_FIELD_SIZE = 4096
+
+
+class UploadError(HTTPException):
+    """上传解析失败；fields 为出错前已解析出的表单字段（可能含 scan_id）"""
+
+    def __init__(self, detail: str, fields: dict):
+        super().__init__(status_code=400, detail=detail)
+        self.fields = fields
+
+
+class StreamingUpload:
+    """
+    multipart 解析回调：文件部分直接写入 <存储目录>/.incoming/ 下的临时文件，
+    其他字段保存在 fields 中；整个上传过程中内存占用与文件大小无关
+    """
+
+    def __init__(self, incoming_dir: str):
+        os.makedirs(incoming_dir, exist_ok=True)
+        self.incoming_dir = incoming_dir
+        self.fields = {}
+        self.filename = None
+        self.tmp_path = None
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+        self._header_field = b""
+        self._header_value = b""
+        self._headers = {}
+        self._name = None
+        self._value = None
+        self._out = None
+        # 收到结束边界（--boundary--）后置位
+        self.complete = False
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": lambda data, start, end: self._append_header("_header_field", data[start:end]),
+            "on_header_value": lambda data, start, end: self._append_header("_header_value", data[start:end]),
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_end": self._on_end,
+        }
+
+    def _append_header(self, attr, data):
+        setattr(self, attr, getattr(self, attr) + data)
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._name = None
+        self._value = None
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._name = options.get(b"name", b"").decode("utf-8")
+
+        if b"filename" in options:
+            if self._out is not None or self.tmp_path is not None:
+                raise ValueError("一次上传只能包含一个文件")
+            self.filename = os.path.basename(options[b"filename"].decode("utf-8").replace("\\", "/"))
+            self.tmp_path = os.path.join(self.incoming_dir, f"{uuid.uuid4().hex}.part")
+            self._out = open(self.tmp_path, "wb")
+        else:
+            self._value = bytearray()
+
+    def _on_part_data(self, data, start, end):
+        block = data[start:end]
+        if self._out is not None:
+            self._out.write(block)
+            self.sha256.update(block)
+            self.size += len(block)
+        else:
+            self._value += block
+            if len(self._value) > MAX_FIELD_SIZE:
+                raise ValueError(f"表单字段过长: {self._name}")
+
+    def _on_part_end(self):
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+        else:
+            self.fields[self._name] = self._value.decode("utf-8")
+
+    def _on_end(self):
+        self.complete = True
+
+    def discard(self):
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+        if self.tmp_path is not None and os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+async def parse_upload(request: Request, storage_dir: str) -> StreamingUpload:
+    """
+    把请求体按 UPLOAD_CHUNK_SIZE 分块送入解析器；写盘在线程池中执行，不阻塞事件循环。
+    文件部分写入 <storage_dir>/.incoming/，调用方校验后再移动到最终位置。
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="需要 multipart/form-data 请求")
+
+    upload = StreamingUpload(os.path.join(storage_dir, INCOMING_DIRNAME))
+    parser = MultipartParser(params[b"boundary"], upload.callbacks())
+    try:
+        buf = bytearray()
+        async for chunk in request.stream():
+            buf += chunk
+            if len(buf) >= UPLOAD_CHUNK_SIZE:
+                await run_in_threadpool(parser.write, bytes(buf))
+                buf.clear()
+        if buf:
+            await run_in_threadpool(parser.write, bytes(buf))
+        parser.finalize()
+    except Exception as e:
+        upload.discard()
+        raise UploadError(f"上传数据解析失败: {e}", upload.fields)
+
+    # 请求体被截断：文件部分没有结束（临时文件仍打开），或没有收到结束边界
+    if upload._out is not None or not upload.complete:
+        upload.discard()
+        raise UploadError("上传数据不完整：未收到 multipart 结束边界", upload.fields)
+    return upload
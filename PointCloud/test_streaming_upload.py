@@ -0,0 +1,71 @@
+"""
+test_streaming_upload.py
+作用：
+  验证 parse_upload 拒绝被截断的 multipart 请求体，并删除 .incoming 下的临时文件
+用法：
+  python -m pytest PointCloud/test_streaming_upload.py
+"""
+
+import asyncio
+import os
+
+import pytest
+
+from PointCloud.streaming_upload import INCOMING_DIRNAME, UploadError, parse_upload
+
+BOUNDARY = "testboundary"
+
+
+class FakeRequest:
+    """parse_upload 只用到 headers 和 stream()"""
+
+    def __init__(self, body: bytes, chunk_size: int = 256):
+        self.headers = {"content-type": f"multipart/form-data; boundary={BOUNDARY}"}
+        self._body = body
+        self._chunk_size = chunk_size
+
+    async def stream(self):
+        for i in range(0, len(self._body), self._chunk_size):
+            yield self._body[i:i + self._chunk_size]
+
+
+def build_body(payload: bytes) -> bytes:
+    b = BOUNDARY.encode()
+    return (b"--" + b + b'\r\nContent-Disposition: form-data; name="scan_id"\r\n\r\nabc\r\n'
+            + b"--" + b + b'\r\nContent-Disposition: form-data; name="file"; filename="t.ply"\r\n'
+            + b"Content-Type: application/octet-stream\r\n\r\n" + payload + b"\r\n"
+            + b"--" + b + b"--\r\n")
+
+
+def incoming_files(storage_dir) -> list:
+    return os.listdir(os.path.join(storage_dir, INCOMING_DIRNAME))
+
+
+def test_complete_body_accepted(tmp_path):
+    payload = os.urandom(1000)
+    upload = asyncio.run(parse_upload(FakeRequest(build_body(payload)), str(tmp_path)))
+
+    assert upload.fields == {"scan_id": "abc"}
+    assert upload.size == len(payload)
+    with open(upload.tmp_path, "rb") as f:
+        assert f.read() == payload
+
+
+@pytest.mark.parametrize("cut", [
+    "mid_file",         # 文件部分中途断开
+    "before_closing",   # 文件部分已结束，但没有结束边界
+])
+def test_truncated_body_rejected(tmp_path, cut):
+    payload = os.urandom(1000)
+    body = build_body(payload)
+    if cut == "mid_file":
+        body = body[:body.index(payload) + 500]
+    else:
+        body = body[:-len(b"--\r\n")]
+
+    with pytest.raises(UploadError) as exc:
+        asyncio.run(parse_upload(FakeRequest(body), str(tmp_path)))
+
+    assert exc.value.status_code == 400
+    assert exc.value.fields == {"scan_id": "abc"}
+    assert incoming_files(tmp_path) == []
@@ -3,8 +3,8 @@ import requests  # 添加这行导入
 import json
 import socket
 import time  # 添加这行导入
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, BackgroundTasks
-import aiofiles
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
+from PointCloud.streaming_upload import parse_upload
 import uvicorn
 import zipfile
 import logging
@@ -24,67 +24,68 @@ os.makedirs(CLIENT_STORAGE, exist_ok=True)
 
 
 @client_app.post("/receive-file")
-async def receive_file(
-        background_tasks: BackgroundTasks,
-        scan_id: str = Form(...),
-        is_zip: str = Form(...),
-        file: UploadFile = File(...)
-):
-    """接收从服务器传输的文件"""
-    logger.info(f"接收到文件传输请求: scan_id={scan_id}, is_zip={is_zip}, filename={file.filename}")
+async def receive_file(request: Request, background_tasks: BackgroundTasks):
+    """
+    接收从服务器传输的文件（multipart 字段：scan_id、is_zip、file、checksum="sha256:<hex>"）。
+    文件边收边写盘并计算 sha256，校验通过后移动到扫描目录；ZIP 在后台线程中解压。
+    """
+    upload = await parse_upload(request, CLIENT_STORAGE)
+    scan_id = upload.fields.get("scan_id")
+    is_zip = upload.fields.get("is_zip", "false")
+    logger.info(f"接收到文件传输请求: scan_id={scan_id}, is_zip={is_zip}, filename={upload.filename}")
+
+    if not scan_id or os.path.basename(scan_id) != scan_id or upload.tmp_path is None:
+        upload.discard()
+        raise HTTPException(status_code=422, detail="缺少 scan_id 或文件，或 scan_id 非法")
 
     try:
+        digest = upload.sha256.hexdigest()
+        expected = upload.fields.get("checksum")
+        if not expected:
+            raise ValueError("缺少 checksum 字段，无法校验文件完整性")
+        if expected.lower() != f"sha256:{digest}":
+            raise ValueError(f"校验和不匹配: 期望 {expected}，实际 sha256:{digest}")
+
         scan_dir = os.path.join(CLIENT_STORAGE, scan_id)
         os.makedirs(scan_dir, exist_ok=True)
         logger.info(f"创建扫描目录: {scan_dir}")
 
         is_zip_bool = is_zip.lower() == 'true'
-        filename = file.filename or f"{scan_id}.file"
+        filename = upload.filename or f"{scan_id}.file"
+        file_path = os.path.join(scan_dir, filename)
+        os.replace(upload.tmp_path, file_path)
+        logger.info(f"文件保存成功: {file_path} (大小: {upload.size} bytes, sha256: {digest})")
 
         if is_zip_bool:
-            logger.info(f"接收ZIP文件: {filename}")
-            zip_path = os.path.join(scan_dir, filename)
-
-            # 保存ZIP文件
-            file_content = await file.read()
-            async with aiofiles.open(zip_path, 'wb') as f:
-                await f.write(file_content)
-            logger.info(f"ZIP文件保存成功: {zip_path} (大小: {len(file_content)} bytes)")
-
-            # 在后台任务中解压ZIP文件
-            background_tasks.add_task(extract_zip_file, zip_path, scan_dir)
+            # 在后台线程中解压ZIP文件
+            background_tasks.add_task(extract_zip_file, file_path, scan_dir)
 
             return {
                 "status": "success",
                 "message": "文件接收成功，正在解压",
                 "scan_id": scan_id,
-                "save_path": scan_dir
+                "save_path": scan_dir,
+                "sha256": digest
             }
-        else:
-            logger.info(f"接收单个文件: {filename}")
-            file_path = os.path.join(scan_dir, filename)
-
-            # 保存文件
-            file_content = await file.read()
-            async with aiofiles.open(file_path, 'wb') as f:
-                await f.write(file_content)
-            logger.info(f"文件保存成功: {file_path} (大小: {len(file_content)} bytes)")
 
-            return {
-                "status": "success",
-                "message": "文件接收完成",
-                "scan_id": scan_id,
-                "save_path": file_path
-            }
+        return {
+            "status": "success",
+            "message": "文件接收完成",
+            "scan_id": scan_id,
+            "save_path": file_path,
+            "sha256": digest
+        }
 
     except Exception as e:
+        upload.discard()
         error_msg = f"文件接收失败: {str(e)}"
         logger.error(error_msg)
-        raise HTTPException(status_code=500, detail=error_msg)
+        status_code = 400 if isinstance(e, ValueError) else 500
+        raise HTTPException(status_code=status_code, detail=error_msg)
 
 
-async def extract_zip_file(zip_path: str, extract_dir: str):
-    """在后台解压ZIP文件"""
+def extract_zip_file(zip_path: str, extract_dir: str):
+    """解压ZIP文件：普通函数，BackgroundTasks 会在线程池中执行，不阻塞事件循环"""
     try:
         logger.info(f"开始解压ZIP文件: {zip_path} -> {extract_dir}")
 
@@ -178,7 +179,8 @@ def request_scan(transfer_to_client=True):
     try:
         # 发送扫描请求
         print("开始扫描...")
-        response = requests.post("http://192.168.25.184:8000/scan/", json=scan_config, timeout=300)
+        response = requests.post("http://192.168.25.184:8000/scan/", json=scan_config,
+                                 params={"wait": "true"}, timeout=300)
         result = response.json()
         print("扫描结果:")
         print(json.dumps(result, indent=2, ensure_ascii=False))
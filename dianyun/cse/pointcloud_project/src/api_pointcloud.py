@@ -3,21 +3,29 @@
 from __future__ import annotations
 
 import os
-from typing import Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import torch
 
-from model_pointnet import SimplePointNetSeg
-from pc_backend import load_pointcloud, save_colored_ply
+from dianyun.cse.pointcloud_project.src import model_registry
+from dianyun.cse.pointcloud_project.src.pc_backend import load_pointcloud, save_colored_ply
+from dianyun.cse.pointcloud_project.src.sampling import SAMPLING_STRATEGIES, nearest_labels, sample_indices
 
 
+# 多视角投票（votes > 1）时，每个视角绕 z 轴的最大随机旋转角（度）。
+# 训练时没有做旋转增强，角度不宜过大。
+TTA_MAX_ANGLE_DEG = 5.0
+
 class PointCloudSegAPI:
     """
     点云分割 API 封装：
       - 加载 PointNet 分割模型
-      - 对输入点云做中心化 + 单位球归一化 + 采样/补齐
+      - 对输入点云做中心化 + 单位球归一化 + 采样/补齐（random / voxel / fps）
       - 执行前向推理，输出每个点的类别
+      - 可选：多视角投票（votes=K，K 个视角拼成一个 batch 只做一次前向）
+      - 可选：最近邻回投，给每个原始点赋予预测类别（dense=True）
       - 可选：保存带颜色的 PLY 结果
 
     类别约定（和训练保持一致）：
@@ -32,50 +40,70 @@ class PointCloudSegAPI:
         num_classes: int = 3,
         num_points: int = 4096,
         device: Optional[str] = None,
+        variant: str = "plain",
+        sampling: str = "random",
     ) -> None:
         """
         :param model_path: 训练好的权重路径，如 'checkpoints/pointnet_seg_best.pth'
         :param num_classes: 类别数（默认 3）
         :param num_points: 推理时采样/补齐的点数（需要和训练时一致）
         :param device: 'cuda' / 'cpu' / None（自动）
+        :param variant: 模型变体，见 model_registry.VARIANTS
+                        （'plain' 原始模型 / 'fused' Conv+BN 折叠 / 'int8' CPU 动态量化）
+        :param sampling: 采样策略，见 sampling.SAMPLING_STRATEGIES
+                         （'random' 随机 / 'voxel' 体素网格 / 'fps' 最远点，后两者是确定性的）
         """
+        if sampling not in SAMPLING_STRATEGIES:
+            raise ValueError(f"未知的采样策略: {sampling}，可选: {SAMPLING_STRATEGIES}")
+
         self.model_path = model_path
         self.num_classes = num_classes
         self.num_points = num_points
+        self.variant = variant
+        self.sampling = sampling
 
-        if device is None:
-            self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        else:
-            self.device = torch.device(device)
+        self.device = model_registry.resolve_device(device, variant)
 
         self.model = self._load_model()
 
     # ---------- 内部工具函数 ----------
 
     def _load_model(self) -> torch.nn.Module:
-        if not os.path.isfile(self.model_path):
-            raise FileNotFoundError(f"模型文件不存在: {self.model_path}")
-
-        model = SimplePointNetSeg(num_classes=self.num_classes).to(self.device)
-        state = torch.load(self.model_path, map_location=self.device)
-        model.load_state_dict(state)
-        model.eval()
-        return model
+        # 进程级注册表：同一 checkpoint 只加载一次，和 PointCloudAPI 共享
+        return model_registry.get_model(
+            self.model_path, num_classes=self.num_classes, device=self.device, variant=self.variant
+        )
 
     @staticmethod
     def _preprocess_points(
         points: np.ndarray,
         num_points: int,
-    ) -> np.ndarray:
+        sampling: str = "random",
+    ) -> Tuple[np.ndarray, np.ndarray]:
         """
         预处理点云：
           1) 中心化
           2) 单位球归一化
-          3) 采样/补齐到 num_points
+          3) 按 sampling 策略采样/补齐到 num_points
 
         :param points: (N, 3) numpy 数组
         :param num_points: 目标点数
-        :return: (num_points, 3) numpy 数组
+        :param sampling: 'random' / 'voxel' / 'fps'
+        :return: (xyz_processed, idx)
+                 xyz_processed: (num_points, 3) numpy 数组
+                 idx: (num_points,) 采样点在原始点云中的索引
+        """
+        xyz = PointCloudSegAPI._normalize_points(points)
+
+        # 3) 采样/补齐
+        idx = sample_indices(xyz, num_points, sampling)
+
+        return xyz[idx], idx
+
+    @staticmethod
+    def _normalize_points(points: np.ndarray) -> np.ndarray:
+        """
+        中心化 + 单位球归一化，返回 (N,3) float32。
         """
         xyz = np.asarray(points, dtype=np.float32)
 
@@ -91,14 +119,52 @@ class PointCloudSegAPI:
         if m > 0:
             xyz = xyz / m
 
-        # 3) 随机采样/补齐
-        N = xyz.shape[0]
-        if N >= num_points:
-            idx = np.random.choice(N, num_points, replace=False)
-        else:
-            idx = np.random.choice(N, num_points, replace=True)
+        return xyz
+
+    def _tta_views(
+        self,
+        xyz: np.ndarray,
+        votes: int,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        由归一化后的点云构造 votes 个视角：
+          视角 0 = self.sampling 采样、不旋转；其余视角 = 随机采样 + 绕 z 轴小角度旋转。
+
+        :param xyz: (N,3) 归一化后的点云
+        :return: (views, idx)
+                 views: (votes, num_points, 3)
+                 idx: (votes, num_points) 每个视角的点在原始点云中的索引
+        """
+        idx = np.stack(
+            [sample_indices(xyz, self.num_points, self.sampling if k == 0 else "random")
+             for k in range(votes)],
+            axis=0,
+        )
+
+        theta = np.deg2rad(np.random.uniform(-TTA_MAX_ANGLE_DEG, TTA_MAX_ANGLE_DEG, size=votes))
+        theta[0] = 0.0
+        c, s = np.cos(theta), np.sin(theta)
+        rot = np.zeros((votes, 3, 3), dtype=np.float32)
+        rot[:, 0, 0], rot[:, 0, 1] = c, -s
+        rot[:, 1, 0], rot[:, 1, 1] = s, c
+        rot[:, 2, 2] = 1.0
+
+        views = np.matmul(xyz[idx], rot.transpose(0, 2, 1))  # (votes, num_points, 3)
+        return views, idx
+
+    @staticmethod
+    def _back_project(
+        xyz_raw: np.ndarray,
+        idx: np.ndarray,
+        pred_labels: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        把采样点上的预测类别按最近邻回投到全部原始点。
 
-        return xyz[idx]
+        :return: (dense_labels (N,), xyz_raw (N,3) float32)
+        """
+        xyz_raw = np.asarray(xyz_raw, dtype=np.float32)
+        return nearest_labels(xyz_raw[idx], pred_labels, xyz_raw), xyz_raw
 
     def _forward(
         self,
@@ -110,36 +176,135 @@ class PointCloudSegAPI:
         :param xyz_processed: (num_points,3) numpy 数组
         :return: (num_points,) 预测类别
         """
-        # 转 Tensor，形状 (1,3,num_points)
-        xyz_tensor = torch.from_numpy(xyz_processed).unsqueeze(0).to(self.device)  # (1, N, 3)
-        xyz_tensor = xyz_tensor.transpose(1, 2)  # (1, 3, N)
+        return self._forward_batch(xyz_processed[None])[0]
+
+    def _forward_batch(
+        self,
+        xyz_batch: np.ndarray,
+    ) -> np.ndarray:
+        """
+        对一批已预处理的点云执行一次前向推理。
+
+        :param xyz_batch: (B,num_points,3) numpy 数组
+        :return: (B,num_points) 预测类别
+        """
+        return self._forward_logits(xyz_batch).argmax(dim=-1).numpy()  # (B, N)
+
+    def _forward_logits(
+        self,
+        xyz_batch: np.ndarray,
+    ) -> torch.Tensor:
+        """
+        :param xyz_batch: (B,num_points,3) numpy 数组
+        :return: (B,num_points,num_classes) CPU 上的 logits
+        """
+        # 转 Tensor，形状 (B,3,num_points)
+        xyz_tensor = torch.from_numpy(np.ascontiguousarray(xyz_batch)).to(self.device)  # (B, N, 3)
+        xyz_tensor = xyz_tensor.transpose(1, 2)  # (B, 3, N)
 
         with torch.no_grad():
-            pred = self.model(xyz_tensor)  # (1, N, num_classes)
+            pred = self.model(xyz_tensor)  # (B, N, num_classes)
 
-        pred_labels = pred.argmax(dim=-1).squeeze(0).cpu().numpy()  # (N,)
-        return pred_labels
+        return pred.float().cpu()
+
+    def _predict_votes(
+        self,
+        points: np.ndarray,
+        votes: int,
+        dense: bool,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        多视角投票推理，返回值见 predict_points。
+        """
+        xyz = self._normalize_points(points)
+        views, idx = self._tta_views(xyz, votes)
+
+        logits = self._forward_logits(views)  # (votes, num_points, C)
+        flat_idx = torch.from_numpy(idx.reshape(-1))
+
+        # 同一原始点在各视角（及同一视角内重复采样）的 logits 全部累加
+        acc = torch.zeros(xyz.shape[0], logits.shape[-1], dtype=logits.dtype)
+        acc.index_add_(0, flat_idx, logits.reshape(-1, logits.shape[-1]))
+
+        covered = np.bincount(idx.reshape(-1), minlength=xyz.shape[0]) > 0
+        labels = acc.argmax(dim=-1).numpy()
+
+        if not dense:
+            return labels[covered], xyz[covered]
+
+        xyz_raw = np.asarray(points, dtype=np.float32)
+        if not covered.all():
+            labels[~covered] = nearest_labels(xyz_raw[covered], labels[covered], xyz_raw[~covered])
+        return labels, xyz_raw
+
+    def _load_and_preprocess(
+        self,
+        cloud: Union[str, np.ndarray],
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        predict_batch 的单个任务：cloud 为 PLY 路径时先读取，再做预处理。
+
+        :return: (xyz_processed, idx, xyz_raw)
+        """
+        if isinstance(cloud, str):
+            if not os.path.isfile(cloud):
+                raise FileNotFoundError(f"PLY 文件不存在: {cloud}")
+            cloud = load_pointcloud(cloud)
+            if cloud is None or len(cloud) == 0:
+                raise RuntimeError("读取到的点云为空")
+        xyz_processed, idx = self._preprocess_points(cloud, self.num_points, self.sampling)
+        return xyz_processed, idx, cloud
 
     # ---------- 对外 API ----------
 
+    def warmup(self, runs: int = 2) -> None:
+        """
+        启动时空跑几次前向，让第一次真实推理和之后一样快。
+        """
+        model_registry.warmup(
+            self.model_path,
+            num_classes=self.num_classes,
+            device=self.device,
+            num_points=self.num_points,
+            runs=runs,
+            variant=self.variant,
+        )
+
     def predict_points(
         self,
         points: np.ndarray,
         *,
         save_colored_to: Optional[str] = None,
+        dense: bool = False,
+        votes: int = 1,
     ) -> Tuple[np.ndarray, np.ndarray]:
         """
         对内存中的点云（N,3）做推理。
 
         :param points: 原始点云 (N,3)
-        :param save_colored_to: 若不为 None，则把 (num_points,3) + 预测类别 写成带颜色 PLY
-        :return: (pred_labels, xyz_processed)
-                 pred_labels: (num_points,) 预测标签
-                 xyz_processed: (num_points,3) 预处理后点云（已采样/归一化）
+        :param save_colored_to: 若不为 None，则把点云 + 预测类别 写成带颜色 PLY
+        :param dense: True 时把预测类别最近邻回投到全部原始点
+        :param votes: 视角数 K。K > 1 时做 K 个视角（不同采样 + 小角度旋转）的投票：
+                      K 个视角拼成一个 batch 只做一次前向，logits 按原始点索引累加后取 argmax
+        :return: (pred_labels, xyz)
+                 dense=False, votes=1: (num_points,) 预测标签, (num_points,3) 预处理后点云（已采样/归一化）
+                 dense=False, votes>1: (M,) 预测标签, (M,3) 归一化后点云，M 为至少被一个视角采到的原始点数
+                 dense=True : (N,) 预测标签, (N,3) 原始点云
         """
-        xyz_processed = self._preprocess_points(points, self.num_points)
+        if votes < 1:
+            raise ValueError(f"votes 必须 >= 1，但收到 {votes}")
+        if votes > 1:
+            pred_labels, xyz_out = self._predict_votes(points, votes, dense)
+            if save_colored_to is not None:
+                save_colored_ply(save_colored_to, xyz_out, pred_labels)
+            return pred_labels, xyz_out
+
+        xyz_processed, idx = self._preprocess_points(points, self.num_points, self.sampling)
         pred_labels = self._forward(xyz_processed)
 
+        if dense:
+            pred_labels, xyz_processed = self._back_project(points, idx, pred_labels)
+
         if save_colored_to is not None:
             # 利用你已有的 pc_backend.save_colored_ply
             save_colored_ply(save_colored_to, xyz_processed, pred_labels)
@@ -151,13 +316,15 @@ class PointCloudSegAPI:
         ply_path: str,
         *,
         out_ply: Optional[str] = None,
+        dense: bool = False,
     ) -> Tuple[np.ndarray, np.ndarray]:
         """
         从 PLY 文件读取点云并推理。
 
         :param ply_path: 输入 PLY 文件路径
         :param out_ply: 若不为 None，则保存带颜色的 PLY 到该路径
-        :return: (pred_labels, xyz_processed)
+        :param dense: True 时把预测类别最近邻回投到全部原始点
+        :return: (pred_labels, xyz)，含义同 predict_points
         """
         if not os.path.isfile(ply_path):
             raise FileNotFoundError(f"PLY 文件不存在: {ply_path}")
@@ -168,10 +335,52 @@ class PointCloudSegAPI:
         if xyz_raw is None or len(xyz_raw) == 0:
             raise RuntimeError(f"从 {ply_path} 读取到的点云为空")
 
-        xyz_processed = self._preprocess_points(xyz_raw, self.num_points)
+        xyz_processed, idx = self._preprocess_points(xyz_raw, self.num_points, self.sampling)
         pred_labels = self._forward(xyz_processed)
 
+        if dense:
+            pred_labels, xyz_processed = self._back_project(xyz_raw, idx, pred_labels)
+
         if out_ply is not None:
             save_colored_ply(out_ply, xyz_processed, pred_labels)
 
         return pred_labels, xyz_processed
+
+    def predict_batch(
+        self,
+        clouds: Sequence[Union[str, np.ndarray]],
+        *,
+        save_colored_to: Optional[Sequence[Optional[str]]] = None,
+        max_workers: Optional[int] = None,
+        dense: bool = False,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        一次推理多个点云：多线程并行读取/预处理，堆叠成 (B,3,num_points) 后只做一次前向。
+
+        :param clouds: 点云列表，每项为 (N,3) 数组或 PLY 文件路径
+        :param save_colored_to: 可选，与 clouds 等长的输出 PLY 路径列表（某项为 None 则不保存）
+        :param max_workers: 预处理线程数（None = 由 ThreadPoolExecutor 决定）
+        :param dense: True 时把预测类别最近邻回投到每个点云的全部原始点
+        :return: 与 clouds 顺序一致的 [(pred_labels, xyz), ...]，含义同 predict_points
+        """
+        if len(clouds) == 0:
+            return []
+        if save_colored_to is not None and len(save_colored_to) != len(clouds):
+            raise ValueError("save_colored_to 的长度必须和 clouds 一致")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            processed = list(pool.map(self._load_and_preprocess, clouds))
+
+        xyz_batch = np.stack([p[0] for p in processed], axis=0)  # (B, num_points, 3)
+        pred_batch = self._forward_batch(xyz_batch)  # (B, num_points)
+
+        results = []
+        for i, (xyz_processed, idx, xyz_raw) in enumerate(processed):
+            pred_labels = pred_batch[i]
+            if dense:
+                pred_labels, xyz_processed = self._back_project(xyz_raw, idx, pred_labels)
+            if save_colored_to is not None and save_colored_to[i] is not None:
+                save_colored_ply(save_colored_to[i], xyz_processed, pred_labels)
+            results.append((pred_labels, xyz_processed))
+
+        return results
@@ -0,0 +1,72 @@
+"""
+bench_inference.py
+作用：
+  1. 从同一个 checkpoint 加载不同的推理变体（见 model_registry.VARIANTS）
+  2. 用同一个随机点云测每个变体单个点云的前向耗时（CPU）
+  3. 和原始模型对比 logits 最大误差、标签一致率
+"""
+
+import os
+import time
+
+import torch
+
+from dianyun.cse.pointcloud_project.src.model_registry import VARIANTS, get_model
+
+
+CKPT_PATH = r"/home/er/Desktop/cse/pointcloud_project/checkpoints/pointnet_seg_best.pth"
+NUM_POINTS = 4096
+WARMUP_RUNS = 3
+BENCH_RUNS = 20
+
+
+def benchmark_variants(model_path, variants=VARIANTS, num_points=NUM_POINTS,
+                       runs=BENCH_RUNS, device="cpu"):
+    """
+    return: {variant: {"ms_per_cloud", "max_abs_diff", "label_agreement"}}
+    """
+    x = torch.rand(1, 3, num_points, device=device) * 2.0 - 1.0
+
+    results = {}
+    ref = None
+    with torch.no_grad():
+        for variant in variants:
+            model = get_model(model_path, num_classes=3, device=device, variant=variant)
+
+            for _ in range(WARMUP_RUNS):
+                model(x)
+
+            t0 = time.perf_counter()
+            for _ in range(runs):
+                logits = model(x)
+            elapsed = (time.perf_counter() - t0) / runs
+
+            if ref is None:
+                ref = logits
+            results[variant] = {
+                "ms_per_cloud": elapsed * 1000.0,
+                "max_abs_diff": (logits - ref).abs().max().item(),
+                "label_agreement": (logits.argmax(-1) == ref.argmax(-1)).float().mean().item(),
+            }
+
+    return results
+
+
+def main():
+    if not os.path.isfile(CKPT_PATH):
+        raise FileNotFoundError(f"找不到模型文件: {CKPT_PATH}")
+
+    print(f"点数: {NUM_POINTS}，每个变体跑 {BENCH_RUNS} 次，线程数: {torch.get_num_threads()}")
+
+    results = benchmark_variants(CKPT_PATH)
+    base = results[VARIANTS[0]]["ms_per_cloud"]
+
+    for variant, r in results.items():
+        print(f"  {variant:>8s}: {r['ms_per_cloud']:8.2f} ms/云 | "
+              f"加速 {base / r['ms_per_cloud']:.2f}x | "
+              f"max|Δlogit| {r['max_abs_diff']:.2e} | "
+              f"标签一致率 {r['label_agreement'] * 100:.2f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+bulk_infer.py
+作用：
+  模型更新后对整个扫描目录（如 client_scans/）离线重新推理：
+    1) 递归查找目录下的 PLY 文件
+    2) 进程池并行解析 PLY（解析是纯 CPU 的 numpy 工作，和前向互不阻塞）
+    3) 主进程持有一个预热好的模型，按 batch 做全分辨率分块推理（predict_chunked）
+    4) 每个扫描写一个 <相对路径>.labels.npy，并在 summary.csv 中追加一行（点数、类别 2 点数、耗时）
+    5) 中断后重新运行会跳过 summary.csv 中已完成、且模型哈希相同的扫描
+说明：
+  - 同一 batch 内点数不同的点云用自身的点循环补齐到相同长度，
+    max pooling 的全局特征不受重复点影响，因此每个点的标签与单独推理一致
+
+用法：
+  python -m dianyun.cse.pointcloud_project.src.bulk_infer client_scans --model checkpoints/pointnet_seg_best.pth
+"""
+
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+
+from dianyun.cse.pointcloud_project.src.model_registry import VARIANTS, get_model, resolve_device
+from dianyun.cse.pointcloud_project.src.pc_backend import load_pointcloud
+from dianyun.cse.pointcloud_project.src.result_cache import CACHE_DIRNAME, file_digest
+
+
+SUMMARY_FIELDS = ["scan", "status", "num_points", "num_class2", "load_ms", "infer_ms",
+                  "batch_size", "labels_path", "model_digest", "error"]
+
+DEFAULT_BATCH_SIZE = 4
+DEFAULT_CHUNK_SIZE = 65536
+
+
+def find_scans(root: str, pattern_ext: str = ".ply") -> list:
+    """
+    递归查找 root 下的点云文件（跳过缓存目录），返回排序后的相对路径列表。
+    """
+    scans = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d != CACHE_DIRNAME)
+        for name in sorted(filenames):
+            if name.lower().endswith(pattern_ext):
+                scans.append(os.path.relpath(os.path.join(dirpath, name), root))
+    return scans
+
+
+def _load_scan(path: str):
+    """
+    进程池任务：解析 PLY，返回 (xyz 或 None, 耗时 ms, 错误信息)。
+    """
+    t0 = time.perf_counter()
+    try:
+        xyz = np.ascontiguousarray(load_pointcloud(path), dtype=np.float32)
+        if xyz.shape[0] == 0:
+            return None, (time.perf_counter() - t0) * 1000.0, "点云为空"
+        return xyz, (time.perf_counter() - t0) * 1000.0, ""
+    except Exception as e:
+        return None, (time.perf_counter() - t0) * 1000.0, str(e)
+
+
+def _read_done(summary_path: str, model_digest: str) -> set:
+    """
+    summary.csv 中用当前模型成功完成、且标签文件仍存在的扫描
+    """
+    done = set()
+    if not os.path.isfile(summary_path):
+        return done
+    with open(summary_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if (row.get("status") == "ok" and row.get("model_digest") == model_digest
+                    and os.path.isfile(row.get("labels_path", ""))):
+                done.add(row["scan"])
+    return done
+
+
+def predict_padded_batch(model, clouds, chunk_size):
+    """
+    clouds: [(N_i,3), ...] -> [(N_i,), ...]，一次（分块）前向。
+    点数不同的点云用自身的点循环补齐，max pooling 不受重复点影响，标签与逐个推理一致。
+    """
+    n_max = max(c.shape[0] for c in clouds)
+    batch = np.stack([c[np.arange(n_max) % c.shape[0]] for c in clouds], axis=0)  # (B, n_max, 3)
+
+    x = torch.from_numpy(batch).transpose(1, 2)  # (B, 3, n_max)
+    labels = model.predict_chunked(x, chunk_size=chunk_size).numpy()
+    return [labels[i, :c.shape[0]] for i, c in enumerate(clouds)]
+
+
+def _save_labels(path: str, labels: np.ndarray):
+    # 先写临时文件再改名，中断时不会留下半个标签文件
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp.npy"
+    np.save(tmp, labels.astype(np.uint8))
+    os.replace(tmp, path)
+
+
+def bulk_infer(scan_root, model_path, out_dir=None, summary_path=None, workers=None,
+               batch_size=DEFAULT_BATCH_SIZE, chunk_size=DEFAULT_CHUNK_SIZE,
+               variant="plain", device=None):
+    """
+    return: {"total", "skipped", "ok", "failed", "elapsed_s"}
+    """
+    out_dir = out_dir or os.path.join(scan_root, "bulk_results")
+    summary_path = summary_path or os.path.join(out_dir, "summary.csv")
+    os.makedirs(out_dir, exist_ok=True)
+
+    dev = resolve_device(device, variant)
+    model = get_model(model_path, num_classes=3, device=dev, variant=variant)
+    model_digest = file_digest(model_path)
+
+    scans = find_scans(scan_root)
+    done = _read_done(summary_path, model_digest)
+    todo = [s for s in scans if s not in done]
+    print(f"📂 {len(scans)} 个扫描，已完成 {len(scans) - len(todo)} 个，本次处理 {len(todo)} 个")
+
+    new_file = not os.path.isfile(summary_path)
+    stats = {"total": len(scans), "skipped": len(scans) - len(todo), "ok": 0, "failed": 0}
+    t_start = time.perf_counter()
+
+    with open(summary_path, "a", newline="", encoding="utf-8") as f, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        if new_file:
+            writer.writeheader()
+
+        def write_row(**row):
+            row.setdefault("model_digest", model_digest)
+            writer.writerow(row)
+            f.flush()
+
+        # 按 batch 分组提交，下一组在解析的同时当前组做前向
+        groups = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+        pending = [pool.submit(_load_scan, os.path.join(scan_root, s)) for s in groups[0]] if groups else []
+
+        for gi, group in enumerate(groups):
+            loaded = [fut.result() for fut in pending]
+            pending = ([pool.submit(_load_scan, os.path.join(scan_root, s)) for s in groups[gi + 1]]
+                       if gi + 1 < len(groups) else [])
+
+            ok = []
+            for scan, (xyz, load_ms, err) in zip(group, loaded):
+                if xyz is None:
+                    stats["failed"] += 1
+                    write_row(scan=scan, status="failed", load_ms=f"{load_ms:.1f}", error=err)
+                    print(f"❌ {scan}: {err}")
+                else:
+                    ok.append((scan, xyz, load_ms))
+            if not ok:
+                continue
+
+            t0 = time.perf_counter()
+            with torch.no_grad():
+                preds = predict_padded_batch(model, [xyz for _, xyz, _ in ok], chunk_size)
+            infer_ms = (time.perf_counter() - t0) * 1000.0 / len(ok)
+
+            for (scan, xyz, load_ms), labels in zip(ok, preds):
+                labels_path = os.path.join(out_dir, os.path.splitext(scan)[0] + ".labels.npy")
+                _save_labels(labels_path, labels)
+                stats["ok"] += 1
+                write_row(scan=scan, status="ok", num_points=xyz.shape[0],
+                          num_class2=int((labels == 2).sum()), load_ms=f"{load_ms:.1f}",
+                          infer_ms=f"{infer_ms:.1f}", batch_size=len(ok), labels_path=labels_path)
+                print(f"✅ {scan}: {xyz.shape[0]} 点，类别 2: {int((labels == 2).sum())}")
+
+    stats["elapsed_s"] = time.perf_counter() - t_start
+    print(f"🎉 完成 {stats['ok']} 个，失败 {stats['failed']} 个，跳过 {stats['skipped']} 个，"
+          f"耗时 {stats['elapsed_s']:.1f}s。汇总: {summary_path}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对扫描目录做离线批量推理")
+    parser.add_argument("scan_root", help="扫描目录，如 client_scans")
+    parser.add_argument("--model", required=True, help="checkpoint 路径")
+    parser.add_argument("--out-dir", default=None, help="标签输出目录（默认 <scan_root>/bulk_results）")
+    parser.add_argument("--summary", default=None, help="汇总 CSV 路径（默认 <out_dir>/summary.csv）")
+    parser.add_argument("--workers", type=int, default=None, help="解析 PLY 的进程数")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--variant", default="plain", choices=VARIANTS)
+    parser.add_argument("--device", default=None)
+    args = parser.parse_args()
+
+    bulk_infer(args.scan_root, args.model, out_dir=args.out_dir, summary_path=args.summary,
+               workers=args.workers, batch_size=args.batch_size, chunk_size=args.chunk_size,
+               variant=args.variant, device=args.device)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,279 @@
+import json
 import numpy as np
 import os
 import torch
+from concurrent.futures import ProcessPoolExecutor
 from torch.utils.data import Dataset
 
 # 新增：导入 C++ 后端
 from dianyun.cse.pointcloud_project.src.pc_backend import load_pointcloud   # ← 这是 C++ 的接口（）
 
+MANIFEST_NAME = "manifest.json"
+
+# 分片格式：<root>/shards/index.json + points_XXXX.npy (M,3) float32 + labels_XXXX.npy (M,) uint8
+SHARD_DIRNAME = "shards"
+SHARD_INDEX_NAME = "index.json"
+DEFAULT_SHARD_POINTS = 16_000_000
+
+
+def _label_histogram(path, num_classes):
+    """
+    只解压 npz 中的 labels，返回 (点数, 各类别点数)
+    """
+    with np.load(path) as data:
+        labels = data["labels"].reshape(-1)
+    hist = np.bincount(labels, minlength=num_classes)[:num_classes]
+    return int(labels.shape[0]), hist.tolist()
+
+
+def load_manifest(root, files, num_classes=3, workers=None):
+    """
+    数据集清单：每个 npz 文件的点数和类别直方图，保存在 root/manifest.json。
+    文件的 mtime / 大小变化（或新增）时只重算这些文件（多进程并行），其余直接复用。
+
+    return: {文件名: {"mtime_ns", "size", "num_points", "hist"}}
+    """
+    manifest_path = os.path.join(root, MANIFEST_NAME)
+    old = {}
+    if os.path.isfile(manifest_path):
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                old = json.load(f)
+        except (OSError, ValueError):
+            old = {}
+    if old.get("num_classes") != num_classes:
+        old = {}
+    old_files = old.get("files", {})
+
+    entries = {}
+    stale = []
+    for name in files:
+        st = os.stat(os.path.join(root, name))
+        entry = old_files.get(name)
+        if entry is not None and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            entries[name] = entry
+        else:
+            entries[name] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+            stale.append(name)
+
+    if stale:
+        print(f"📝 更新数据集清单：{len(stale)} 个文件需要统计")
+        paths = [os.path.join(root, name) for name in stale]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for name, (num_points, hist) in zip(stale, pool.map(_label_histogram, paths,
+                                                                [num_classes] * len(paths))):
+                entries[name]["num_points"] = num_points
+                entries[name]["hist"] = hist
+
+    if stale or len(old_files) != len(entries):
+        try:
+            tmp = manifest_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"num_classes": num_classes, "files": entries}, f)
+            os.replace(tmp, manifest_path)
+        except OSError as e:
+            print(f"⚠️ 数据集清单写入失败: {e}")
+
+    return entries
+
+
+def convert_to_shards(root, shard_points=DEFAULT_SHARD_POINTS, num_classes=3):
+    """
+    一次性把 root 下的压缩 .npz 转成不压缩的分片（可 memmap 读取）：
+      <root>/shards/points_XXXX.npy  (M,3) float32，多个文件首尾相接
+      <root>/shards/labels_XXXX.npy  (M,)  uint8
+      <root>/shards/index.json       每个文件所在分片、起始偏移、点数、源文件 mtime、类别直方图
+    单个文件不会跨分片；每个分片约 shard_points 个点。
+    """
+    files = sorted(f for f in os.listdir(root) if f.endswith(".npz"))
+    out_dir = os.path.join(root, SHARD_DIRNAME)
+    os.makedirs(out_dir, exist_ok=True)
+
+    index = {"num_classes": num_classes, "shards": [], "files": {}}
+    buf_points, buf_labels, buf_count = [], [], 0
+
+    def flush():
+        nonlocal buf_points, buf_labels, buf_count
+        if not buf_points:
+            return
+        shard_id = len(index["shards"])
+        points_name = f"points_{shard_id:04d}.npy"
+        labels_name = f"labels_{shard_id:04d}.npy"
+        np.save(os.path.join(out_dir, points_name), np.concatenate(buf_points))
+        np.save(os.path.join(out_dir, labels_name), np.concatenate(buf_labels))
+        index["shards"].append({"points": points_name, "labels": labels_name, "num_points": buf_count})
+        buf_points, buf_labels, buf_count = [], [], 0
+
+    for name in files:
+        path = os.path.join(root, name)
+        with np.load(path) as data:
+            xyz = np.ascontiguousarray(data["points"][:, :3], dtype=np.float32)
+            labels = data["labels"].reshape(-1)
+
+        if buf_count and buf_count + xyz.shape[0] > shard_points:
+            flush()
+
+        index["files"][name] = {
+            "shard": len(index["shards"]),
+            "start": buf_count,
+            "count": int(xyz.shape[0]),
+            "mtime_ns": os.stat(path).st_mtime_ns,
+            "hist": np.bincount(labels, minlength=num_classes)[:num_classes].tolist(),
+        }
+        buf_points.append(xyz)
+        buf_labels.append(labels.astype(np.uint8))
+        buf_count += xyz.shape[0]
+    flush()
+
+    with open(os.path.join(out_dir, SHARD_INDEX_NAME), "w", encoding="utf-8") as f:
+        json.dump(index, f)
+
+    print(f"✅ 已转换 {len(files)} 个文件为 {len(index['shards'])} 个分片: {out_dir}")
+    return out_dir
+
+
+def _load_shard_index(root, files):
+    """
+    分片索引存在且与当前 .npz 文件（文件名 + mtime）一致时返回索引，否则返回 None
+    """
+    index_path = os.path.join(root, SHARD_DIRNAME, SHARD_INDEX_NAME)
+    if not os.path.isfile(index_path):
+        return None
+    with open(index_path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+
+    entries = index["files"]
+    if set(entries) != set(files):
+        print("⚠️ 分片与 .npz 文件列表不一致，使用 .npz 读取（请重新运行 convert_to_shards）")
+        return None
+    for name in files:
+        if os.stat(os.path.join(root, name)).st_mtime_ns != entries[name]["mtime_ns"]:
+            print(f"⚠️ {name} 在分片转换后被修改，使用 .npz 读取（请重新运行 convert_to_shards）")
+            return None
+    return index
+
+
 class PointCloudDataset(Dataset):
-    def __init__(self, root, num_points=4096):
+    def __init__(self, root, num_points=4096, defect_class=None, use_shards=True):
+        """
+        defect_class: 不为 None 时子采样优先保留该类的点（类感知采样），
+                      每个文件的瑕疵 / 非瑕疵点索引只在第一次读取时计算并缓存
+        use_shards: root/shards 存在且未过期时从 memmap 分片读取（见 convert_to_shards），
+                    否则读取 .npz
+        """
         self.root = root
         self.num_points = num_points
-        self.files = [f for f in os.listdir(root) if f.endswith(".npz")]
+        self.defect_class = defect_class
+        self.files = sorted(f for f in os.listdir(root) if f.endswith(".npz"))
+
+        self.shard_index = _load_shard_index(root, self.files) if use_shards else None
+        # memmap 在每个进程第一次读取时打开（DataLoader 多进程下不随 Dataset 一起 pickle）
+        self._shards = None
+
+        # 文件序号 -> (瑕疵点索引, 非瑕疵点索引)
+        self._class_index = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shards"] = None
+        return state
 
     def __len__(self):
         return len(self.files)
 
-    def __getitem__(self, idx):
+    def _shard_arrays(self, shard_id):
+        if self._shards is None:
+            shard_dir = os.path.join(self.root, SHARD_DIRNAME)
+            self._shards = [
+                (np.load(os.path.join(shard_dir, sh["points"]), mmap_mode="r"),
+                 np.load(os.path.join(shard_dir, sh["labels"]), mmap_mode="r"))
+                for sh in self.shard_index["shards"]
+            ]
+        return self._shards[shard_id]
+
+    def _read_file(self, idx):
+        """
+        return: (xyz (N,3) float32, labels (N,))；分片模式下为 memmap 上的零拷贝切片
+        """
+        if self.shard_index is not None:
+            entry = self.shard_index["files"][self.files[idx]]
+            points, labels = self._shard_arrays(entry["shard"])
+            sl = slice(entry["start"], entry["start"] + entry["count"])
+            return points[sl], labels[sl]
+
         path = os.path.join(self.root, self.files[idx])
-        data = np.load(path)
-        xyz = data["points"].astype(np.float32)
-        labels = data["labels"].astype(np.int64)
+        with np.load(path) as data:
+            # 与分片一致只取 xyz 三列
+            return data["points"][:, :3].astype(np.float32), data["labels"].reshape(-1)
+
+    def __getitem__(self, idx):
+        xyz, labels = self._read_file(idx)
 
-        # 随机采样
         if xyz.shape[0] > self.num_points:
-            idx = np.random.choice(xyz.shape[0], self.num_points, replace=False)
-            xyz = xyz[idx]
-            labels = labels[idx]
+            if self.defect_class is None:
+                # 随机采样
+                sel = np.random.choice(xyz.shape[0], self.num_points, replace=False)
+            else:
+                sel = self._class_aware_indices(idx, labels)
+            xyz = xyz[sel]
+            labels = labels[sel]
+        elif xyz.shape[0] < self.num_points:
+            # 点数不足：随机重复补齐，同一 batch 内每个样本都是 num_points 个点
+            extra = np.random.randint(0, xyz.shape[0], self.num_points - xyz.shape[0])
+            sel = np.concatenate([np.arange(xyz.shape[0]), extra])
+            xyz = xyz[sel]
+            labels = labels[sel]
 
+        # 只拷贝采样后的点（memmap 切片是只读的）
+        xyz = np.array(xyz, dtype=np.float32)
+        labels = np.array(labels, dtype=np.int64)
         return torch.from_numpy(xyz), torch.from_numpy(labels)
 
+    def class_histogram(self, num_classes=3, workers=None):
+        """
+        整个数据集（全部点，不是子采样）中各类别的点数，来自分片索引或 manifest.json。
+        """
+        if self.shard_index is not None and self.shard_index["num_classes"] == num_classes:
+            entries = self.shard_index["files"]
+        else:
+            entries = load_manifest(self.root, self.files, num_classes=num_classes, workers=workers)
+        counts = np.zeros(num_classes, dtype=np.int64)
+        for name in self.files:
+            counts += np.asarray(entries[name]["hist"], dtype=np.int64)
+        return counts
+
+    def _class_aware_indices(self, file_idx, labels):
+        """
+        全部瑕疵点（超过 num_points 时随机截断）+ 随机非瑕疵点补齐到 num_points
+        """
+        cached = self._class_index.get(file_idx)
+        if cached is None:
+            is_defect = labels == self.defect_class
+            cached = (np.flatnonzero(is_defect).astype(np.int32), np.flatnonzero(~is_defect).astype(np.int32))
+            self._class_index[file_idx] = cached
+        defect_idx, other_idx = cached
+
+        if defect_idx.shape[0] >= self.num_points:
+            return np.random.choice(defect_idx, self.num_points, replace=False)
+
+        need = self.num_points - defect_idx.shape[0]
+        chosen_other = np.random.choice(other_idx, need, replace=False)
+        return np.concatenate([defect_idx, chosen_other])
+
     # --------------------------
     # 新增：从 PLY 读取点云（for inference）
     # --------------------------
     @staticmethod
     def load_from_ply(path: str):
         xyz = load_pointcloud(path)  # 调用 C++ 加载（）
-        return torch.from_numpy(xyz.astype(np.float32))
+        return torch.from_numpy(xyz.astype(np.float32, copy=False))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="把 .npz 数据集转换为 memmap 分片")
+    parser.add_argument("root")
+    parser.add_argument("--shard-points", type=int, default=DEFAULT_SHARD_POINTS)
+    args = parser.parse_args()
+    convert_to_shards(args.root, shard_points=args.shard_points)
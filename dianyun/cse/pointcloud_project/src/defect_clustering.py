@@ -0,0 +1,171 @@
+"""
+defect_clustering.py
+作用：
+  把推理得到的类别 2（瑕疵）点聚成若干个缺陷区域，每个区域输出一条记录，
+  打磨时机械臂按区域移动，而不是逐点移动：
+    - 体素哈希 + 26 邻域连通分量（相邻体素里的点属于同一区域）
+    - 每个区域：质心、包围盒范围、点数、主方向（协方差最大特征向量）
+  全部为向量化 numpy 运算；装了 scipy 时连通分量用 scipy.sparse.csgraph，否则用指针跳跃的并查集。
+说明：
+  - voxel_size 与点云坐标同单位（相机输出为 mm）
+  - 点数少于 min_points 的区域视为噪声丢弃
+"""
+
+import numpy as np
+
+try:
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+except ImportError:
+    coo_matrix = None
+    connected_components = None
+
+
+# 默认体素边长（mm）/ 区域最少点数
+DEFAULT_VOXEL_SIZE = 2.0
+DEFAULT_MIN_POINTS = 5
+
+# 26 邻域中的一半（另一半为其相反方向），用于构造无向边
+_HALF_NEIGHBORS = np.array(
+    [(dx, dy, dz)
+     for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+     if (dx, dy, dz) > (0, 0, 0)],
+    dtype=np.int64,
+)
+
+
+def _voxel_components(cells: np.ndarray) -> np.ndarray:
+    """
+    cells: (V,3) 互不相同的体素整数坐标 -> (V,) 连通分量编号（0..K-1）
+    """
+    V = cells.shape[0]
+
+    # 留出 1 格边界，邻居的键不会越界回绕
+    cells = cells - cells.min(axis=0) + 1
+    dims = cells.max(axis=0) + 2
+
+    def encode(c):
+        return (c[:, 0] * dims[1] + c[:, 1]) * dims[2] + c[:, 2]
+
+    keys = encode(cells)
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+
+    src, dst = [], []
+    for off in _HALF_NEIGHBORS:
+        nk = encode(cells + off)
+        pos = np.searchsorted(sorted_keys, nk)
+        pos[pos == V] = 0
+        hit = sorted_keys[pos] == nk
+        src.append(np.nonzero(hit)[0])
+        dst.append(order[pos[hit]])
+    src = np.concatenate(src)
+    dst = np.concatenate(dst)
+
+    if connected_components is not None:
+        graph = coo_matrix((np.ones(src.shape[0], dtype=np.int8), (src, dst)), shape=(V, V))
+        _, comp = connected_components(graph, directed=False)
+        return comp
+
+    # 并查集：沿边取较小的编号，再做指针跳跃，直到不再变化
+    comp = np.arange(V)
+    while True:
+        prev = comp.copy()
+        m = np.minimum(comp[src], comp[dst])
+        np.minimum.at(comp, src, m)
+        np.minimum.at(comp, dst, m)
+        comp = comp[comp]
+        if np.array_equal(comp, prev):
+            break
+    return np.unique(comp, return_inverse=True)[1].reshape(-1)
+
+
+def label_regions(xyz: np.ndarray, voxel_size: float = DEFAULT_VOXEL_SIZE) -> np.ndarray:
+    """
+    xyz: (N,3) -> (N,) 每个点所属区域编号（0..K-1）
+    """
+    xyz = np.asarray(xyz, dtype=np.float64)
+    if xyz.shape[0] == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    cells = np.floor((xyz - xyz.min(axis=0)) / voxel_size).astype(np.int64)
+    uniq, point_voxel = np.unique(cells, axis=0, return_inverse=True)
+    return _voxel_components(uniq)[point_voxel.reshape(-1)]
+
+
+def region_stats(xyz: np.ndarray, labels: np.ndarray) -> dict:
+    """
+    按区域编号汇总统计量（全部为 (K,...) 数组）：
+      num_points, centroid, bbox_min, bbox_max, extent, principal_direction
+    """
+    xyz = np.asarray(xyz, dtype=np.float64)
+    K = int(labels.max()) + 1 if labels.shape[0] else 0
+    counts = np.bincount(labels, minlength=K)
+
+    centroid = np.stack([np.bincount(labels, weights=xyz[:, d], minlength=K) for d in range(3)], axis=1)
+    centroid /= counts[:, None]
+
+    # 各区域包围盒：按区域排序后分段 reduce
+    order = np.argsort(labels, kind="stable")
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    bbox_min = np.minimum.reduceat(xyz[order], starts, axis=0)
+    bbox_max = np.maximum.reduceat(xyz[order], starts, axis=0)
+
+    # 协方差 E[xx^T] - μμ^T，批量求特征分解，取最大特征值对应的特征向量
+    centered = xyz - centroid[labels]
+    cov = np.empty((K, 3, 3), dtype=np.float64)
+    for i in range(3):
+        for j in range(i, 3):
+            c = np.bincount(labels, weights=centered[:, i] * centered[:, j], minlength=K) / counts
+            cov[:, i, j] = c
+            cov[:, j, i] = c
+    _, vecs = np.linalg.eigh(cov)
+    direction = vecs[:, :, -1]
+
+    # 符号约定：绝对值最大的分量为正
+    flip = direction[np.arange(K), np.abs(direction).argmax(axis=1)] < 0
+    direction[flip] *= -1
+
+    return {
+        "num_points": counts,
+        "centroid": centroid,
+        "bbox_min": bbox_min,
+        "bbox_max": bbox_max,
+        "extent": bbox_max - bbox_min,
+        "principal_direction": direction,
+    }
+
+
+def cluster_defects(xyz, voxel_size: float = DEFAULT_VOXEL_SIZE,
+                    min_points: int = DEFAULT_MIN_POINTS) -> list:
+    """
+    类别 2 点 (N,3) -> 缺陷区域列表（按点数从大到小），每个区域一条记录：
+      {'region_id', 'x', 'y', 'z'（质心）, 'num_points', 'extent', 'bbox_min', 'bbox_max', 'principal_direction'}
+    """
+    if xyz is None:
+        return []
+    xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+    if xyz.shape[0] == 0:
+        return []
+
+    labels = label_regions(xyz, voxel_size)
+    stats = region_stats(xyz, labels)
+
+    keep = np.nonzero(stats["num_points"] >= min_points)[0]
+    keep = keep[np.argsort(-stats["num_points"][keep], kind="stable")]
+
+    regions = []
+    for region_id, k in enumerate(keep):
+        cx, cy, cz = stats["centroid"][k]
+        regions.append({
+            'region_id': region_id,
+            'x': float(cx),
+            'y': float(cy),
+            'z': float(cz),
+            'num_points': int(stats["num_points"][k]),
+            'extent': stats["extent"][k].tolist(),
+            'bbox_min': stats["bbox_min"][k].tolist(),
+            'bbox_max': stats["bbox_max"][k].tolist(),
+            'principal_direction': stats["principal_direction"][k].tolist(),
+        })
+    return regions
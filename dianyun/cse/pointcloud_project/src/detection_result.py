@@ -0,0 +1,122 @@
+"""
+detection_result.py
+作用：
+  PointCloudAPI.infer / SegServerClient.infer 的返回结果。
+    - 类别 2 的坐标保持为 (M,3) numpy 数组（class2_coords），不在推理路径上生成逐点的 Python 对象
+    - 兼容原来的 dict 用法：result['class2_coordinates'] / result['defect_points'] / result['num_defects']
+      在第一次访问时才转换成 list / dict 并缓存（只在 UI / JSON 边界发生）
+    - 其他字段（result_path、pointcloud_file、scan_id ...）和普通 dict 一样读写
+  坐标明细只在 logger 开启 DEBUG 级别时打印。
+"""
+
+import json
+import logging
+from collections.abc import MutableMapping
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+class DetectionResult(MutableMapping):
+    # 按需从 class2_coords 生成的键
+    LAZY_KEYS = ("class2_coordinates", "defect_points", "num_defects")
+
+    def __init__(self, class2_coords=None, result_path=None, **fields):
+        self._fields = {"result_path": result_path}
+        self._fields.update(fields)
+        self._cache = {}
+        self.class2_coords = None
+        self._set_coords(class2_coords)
+
+    def _set_coords(self, coords):
+        if coords is not None:
+            coords = np.asarray(coords)
+            coords = coords[:, :3] if coords.ndim == 2 else coords.reshape(-1, 3)
+        self.class2_coords = coords
+        self._cache.clear()
+
+    @property
+    def num_defects(self) -> int:
+        return 0 if self.class2_coords is None else int(self.class2_coords.shape[0])
+
+    # ---------- 惰性转换 ----------
+
+    def _build(self, key):
+        coords = self.class2_coords
+        if key == "num_defects":
+            return self.num_defects
+        if key == "class2_coordinates":
+            return coords.tolist() if coords is not None else None
+        # defect_points
+        if coords is None:
+            return []
+        return [
+            {'x': x, 'y': y, 'z': z, 'distance': 0.0, 'point_id': i}
+            for i, (x, y, z) in enumerate(coords.tolist())
+        ]
+
+    # ---------- MutableMapping ----------
+
+    def __getitem__(self, key):
+        if key in self.LAZY_KEYS:
+            if key not in self._cache:
+                self._cache[key] = self._build(key)
+            return self._cache[key]
+        return self._fields[key]
+
+    def __setitem__(self, key, value):
+        if key == "class2_coordinates":
+            self._set_coords(value)
+        elif key in self.LAZY_KEYS:
+            raise KeyError(f"{key} 由 class2_coordinates 派生，不能直接赋值")
+        else:
+            self._fields[key] = value
+
+    def __delitem__(self, key):
+        if key in self.LAZY_KEYS:
+            raise KeyError(f"{key} 由 class2_coordinates 派生，不能删除")
+        del self._fields[key]
+
+    def __iter__(self):
+        yield from self._fields
+        yield from self.LAZY_KEYS
+
+    def __len__(self):
+        return len(self._fields) + len(self.LAZY_KEYS)
+
+    def __contains__(self, key):
+        return key in self.LAZY_KEYS or key in self._fields
+
+    def __repr__(self):
+        return f"DetectionResult(num_defects={self.num_defects}, fields={list(self._fields)})"
+
+    # ---------- UI / JSON 边界 ----------
+
+    def to_dict(self) -> dict:
+        return {key: self[key] for key in self}
+
+    def to_json(self, **kwargs) -> str:
+        kwargs.setdefault("ensure_ascii", False)
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def log_summary(self, max_print_count: int = 300):
+        """
+        打印类别 2 的点数；逐点坐标（最多 max_print_count 个）只在 DEBUG 级别输出。
+        """
+        if self.class2_coords is None or self.num_defects == 0:
+            print("ℹ️ No class-2 points detected, or prediction output has no labels/coords.")
+            return
+
+        print(f"📍 Detected {self.num_defects} point(s) of class 2.")
+
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+
+        print_count = min(self.num_defects, max_print_count)
+        for i, (x, y, z) in enumerate(self.class2_coords[:print_count]):
+            logger.debug(f"  #{i:04d}: ({x:.6f}, {y:.6f}, {z:.6f})")
+
+        if self.num_defects > max_print_count:
+            logger.debug(f"ℹ️ Only the first {max_print_count} points are printed.")
@@ -12,7 +12,7 @@ import numpy as np
 import torch
 
 from dianyun.cse.pointcloud_project.src.dataset_pointcloud import PointCloudDataset
-from dianyun.cse.pointcloud_project.src.model_pointnet import SimplePointNetSeg
+from dianyun.cse.pointcloud_project.src.model_registry import get_model
 from dianyun.cse.pointcloud_project.src.pc_backend import save_colored_ply
 
 
@@ -29,10 +29,7 @@ def main():
     if not os.path.isfile(CKPT_PATH):
         raise FileNotFoundError(f"找不到模型文件: {CKPT_PATH}")
 
-    model = SimplePointNetSeg(num_classes=3).to(device)
-    state = torch.load(CKPT_PATH, map_location=device)
-    model.load_state_dict(state)
-    model.eval()
+    model = get_model(CKPT_PATH, num_classes=3, device=device)
     print("✅ 已加载模型权重。")
 
     # 2. 构建 Dataset，只取一个样本来测试
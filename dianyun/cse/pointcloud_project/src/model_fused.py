@@ -0,0 +1,62 @@
+"""
+model_fused.py
+作用：
+  推理专用的 SimplePointNetSeg：
+    - 把 6 组 Conv1d + BatchNorm1d 的 BN 统计量折叠进卷积权重（每组只剩一次卷积）
+    - 去掉 dropout（推理时本来就是空操作）
+  结构和 state_dict 以外的接口（forward / predict_chunked）与原模型完全一致，
+  输出在浮点误差范围内等价。
+
+说明：
+  - 只能用于推理（eval），折叠后的模型不能再训练
+  - BN / dropout 被替换为 nn.Identity，原模型的 forward 代码无需改动
+"""
+
+import copy
+
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+from dianyun.cse.pointcloud_project.src.model_pointnet import SimplePointNetSeg
+
+
+# 需要折叠的 (卷积, BN) 成对属性名
+CONV_BN_PAIRS = [
+    ("conv1", "bn1"),
+    ("conv2", "bn2"),
+    ("conv3", "bn3"),
+    ("conv_global", "bn_global"),
+    ("conv4", "bn4"),
+    ("conv5", "bn5"),
+]
+
+
+def fuse_model(model: SimplePointNetSeg) -> SimplePointNetSeg:
+    """
+    返回折叠后的新模型（不修改传入的 model）。
+    """
+    fused = copy.deepcopy(model).eval()
+
+    for conv_name, bn_name in CONV_BN_PAIRS:
+        conv = getattr(fused, conv_name)
+        bn = getattr(fused, bn_name)
+        setattr(fused, conv_name, fuse_conv_bn_eval(conv, bn))
+        setattr(fused, bn_name, nn.Identity())
+
+    fused.dropout = nn.Identity()
+    return fused
+
+
+def load_fused_model(model_path: str, num_classes: int = 3, device=None) -> SimplePointNetSeg:
+    """
+    从已有 checkpoint 加载并返回折叠后的推理模型（eval 模式）。
+    """
+    dev = torch.device(device) if device is not None else torch.device("cpu")
+
+    model = SimplePointNetSeg(num_classes=num_classes)
+    state = torch.load(model_path, map_location="cpu")
+    model.load_state_dict(state)
+    model.eval()
+
+    return fuse_model(model).to(dev)
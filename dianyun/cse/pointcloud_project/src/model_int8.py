@@ -0,0 +1,228 @@
+"""
+model_int8.py
+作用：
+  CPU 控制板（ARM / RISC-V）上的 INT8 推理版 SimplePointNetSeg：
+    1) 先把 BN 折叠进卷积、去掉 dropout（model_fused.fuse_model）
+    2) kernel_size=1 的 Conv1d 就是逐点全连接，改写成 nn.Linear，点维度放中间 (B, N, C)；
+       conv4 同时拆成局部/全局两部分，全局项按点云广播
+    3) torch.ao.quantization.quantize_dynamic 把全部 Linear 权重量化为 int8，
+       激活值的量化范围在运行时按每批数据动态确定（不需要离线校准激活）
+  evaluate_drift：在 npz 评估集上对比 float / int8 的逐类准确率，判断加速是否值得。
+
+说明：
+  - 只支持 CPU
+  - 动态量化按每次输入确定激活范围，分块推理（predict_chunked）与整体推理的标签可能有少量差异
+  - 需要 torch 带有可用的量化后端（fbgemm / x86 / qnnpack）
+"""
+
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from dianyun.cse.pointcloud_project.src.model_fused import fuse_model
+from dianyun.cse.pointcloud_project.src.model_pointnet import SimplePointNetSeg
+
+
+def _conv_to_linear(conv: nn.Conv1d) -> nn.Linear:
+    """
+    kernel_size=1 的 Conv1d -> 等价的 nn.Linear
+    """
+    fc = nn.Linear(conv.in_channels, conv.out_channels, bias=conv.bias is not None)
+    with torch.no_grad():
+        fc.weight.copy_(conv.weight[:, :, 0])
+        if conv.bias is not None:
+            fc.bias.copy_(conv.bias)
+    return fc
+
+
+class PointwisePointNetSeg(nn.Module):
+    """
+    由折叠后的 SimplePointNetSeg 改写成的全 Linear 版本，输入输出与原模型一致：
+      x: (B, 3, N) -> (B, N, num_classes)
+    """
+
+    def __init__(self, fused: SimplePointNetSeg):
+        super(PointwisePointNetSeg, self).__init__()
+
+        self.fc1 = _conv_to_linear(fused.conv1)
+        self.fc2 = _conv_to_linear(fused.conv2)
+        self.fc3 = _conv_to_linear(fused.conv3)
+        self.fc_global = _conv_to_linear(fused.conv_global)
+
+        # conv4 拆成 局部(256) / 全局(512) 两部分
+        c_local = fused.conv3.out_channels
+        c_out = fused.conv4.out_channels
+        w4 = fused.conv4.weight[:, :, 0]
+        self.fc4_local = nn.Linear(c_local, c_out, bias=False)
+        self.fc4_global = nn.Linear(w4.shape[1] - c_local, c_out, bias=True)
+        with torch.no_grad():
+            self.fc4_local.weight.copy_(w4[:, :c_local])
+            self.fc4_global.weight.copy_(w4[:, c_local:])
+            self.fc4_global.bias.copy_(fused.conv4.bias)
+
+        self.fc5 = _conv_to_linear(fused.conv5)
+        self.fc6 = _conv_to_linear(fused.conv6)
+
+    def forward(self, x):
+        point_feat = self._point_features(x)            # (B, N, 256)
+        global_feat = self._global_features(point_feat)  # (B, 1, 512)
+        return self._seg_head(point_feat, global_feat)   # (B, N, num_classes)
+
+    def _point_features(self, x):
+        x = x.transpose(1, 2)          # (B, N, 3)
+        x = F.relu(self.fc1(x))        # (B, N, 64)
+        x = F.relu(self.fc2(x))        # (B, N, 128)
+        x = F.relu(self.fc3(x))        # (B, N, 256)
+        return x
+
+    def _global_features(self, point_feat):
+        x = F.relu(self.fc_global(point_feat))        # (B, N, 512)
+        return torch.max(x, dim=1, keepdim=True)[0]   # (B, 1, 512)
+
+    def _seg_head(self, point_feat, global_feat):
+        x = self.fc4_local(point_feat) + self.fc4_global(global_feat)  # (B, N, 256)
+        x = F.relu(x)
+        x = F.relu(self.fc5(x))        # (B, N, 128)
+        return self.fc6(x)             # (B, N, num_classes)
+
+    def _input_device(self):
+        return torch.device("cpu")
+
+    # 两遍分块推理与原模型共用一套实现
+    predict_chunked = SimplePointNetSeg.predict_chunked
+
+
+def select_quantized_engine() -> str:
+    """
+    确保 torch 有可用的量化后端，返回当前使用的后端名。
+    """
+    engines = [e for e in torch.backends.quantized.supported_engines if e != "none"]
+    if not engines:
+        raise RuntimeError("当前 torch 没有可用的量化后端，无法使用 INT8 模式")
+
+    if torch.backends.quantized.engine not in engines:
+        torch.backends.quantized.engine = engines[0]
+    return torch.backends.quantized.engine
+
+
+def quantize_int8(model: SimplePointNetSeg) -> nn.Module:
+    """
+    float 模型 -> 动态量化的 INT8 模型（CPU，eval 模式）。不修改传入的 model。
+    """
+    select_quantized_engine()
+
+    pointwise = PointwisePointNetSeg(fuse_model(model).cpu()).eval()
+    return torch.ao.quantization.quantize_dynamic(pointwise, {nn.Linear}, dtype=torch.qint8)
+
+
+def load_int8_model(model_path: str, num_classes: int = 3) -> nn.Module:
+    """
+    从已有 checkpoint 加载并返回 INT8 推理模型。
+    """
+    model = SimplePointNetSeg(num_classes=num_classes)
+    state = torch.load(model_path, map_location="cpu")
+    model.load_state_dict(state)
+    model.eval()
+    return quantize_int8(model)
+
+
+def evaluate_drift(model_path: str, data_root: str, num_classes: int = 3,
+                   num_points: int = 4096, max_files: int = None, seed: int = 0) -> dict:
+    """
+    在 npz 评估集上比较 float 与 INT8 模型：
+      - 每个类别的点级准确率及其差值（drift = int8 - float，单位：百分点）
+      - 两者预测标签的一致率
+      - 单个点云的平均前向耗时
+    两个模型使用完全相同的采样点。
+    """
+    from dianyun.cse.pointcloud_project.src.dataset_pointcloud import PointCloudDataset
+    from dianyun.cse.pointcloud_project.src.model_registry import get_model
+
+    float_model = get_model(model_path, num_classes=num_classes, device="cpu")
+    int8_model = get_model(model_path, num_classes=num_classes, device="cpu", variant="int8")
+
+    dataset = PointCloudDataset(data_root, num_points=num_points)
+    n_files = len(dataset) if max_files is None else min(max_files, len(dataset))
+    if n_files == 0:
+        raise RuntimeError(f"{data_root} 中没有 npz 文件")
+
+    np.random.seed(seed)
+
+    total = np.zeros(num_classes, dtype=np.int64)
+    correct = {"float": np.zeros(num_classes, dtype=np.int64),
+               "int8": np.zeros(num_classes, dtype=np.int64)}
+    elapsed = {"float": 0.0, "int8": 0.0}
+    agree = 0
+    n_points = 0
+
+    with torch.no_grad():
+        for idx in range(n_files):
+            xyz, gt = dataset[idx]
+            x = xyz.unsqueeze(0).transpose(1, 2)
+            gt = gt.numpy()
+
+            preds = {}
+            for name, model in (("float", float_model), ("int8", int8_model)):
+                t0 = time.perf_counter()
+                preds[name] = model(x).argmax(dim=-1).squeeze(0).numpy()
+                elapsed[name] += time.perf_counter() - t0
+
+            for c in range(num_classes):
+                mask = gt == c
+                total[c] += mask.sum()
+                for name in preds:
+                    correct[name][c] += (preds[name][mask] == c).sum()
+
+            agree += (preds["float"] == preds["int8"]).sum()
+            n_points += gt.shape[0]
+
+    per_class = {}
+    for c in range(num_classes):
+        if total[c] == 0:
+            per_class[c] = None
+            continue
+        acc_f = correct["float"][c] / total[c] * 100.0
+        acc_q = correct["int8"][c] / total[c] * 100.0
+        per_class[c] = {"float_acc": acc_f, "int8_acc": acc_q, "drift": acc_q - acc_f,
+                        "num_points": int(total[c])}
+
+    return {
+        "num_files": n_files,
+        "per_class": per_class,
+        "label_agreement": agree / max(n_points, 1) * 100.0,
+        "float_ms_per_cloud": elapsed["float"] / n_files * 1000.0,
+        "int8_ms_per_cloud": elapsed["int8"] / n_files * 1000.0,
+        "engine": torch.backends.quantized.engine,
+    }
+
+
+def print_drift_report(report: dict):
+    print(f"\n📊 INT8 vs float（{report['num_files']} 个样本，量化后端: {report['engine']}）")
+    for c, r in report["per_class"].items():
+        if r is None:
+            print(f"  类 {c}: 评估集中没有该类。")
+            continue
+        print(f"  类 {c}: float {r['float_acc']:.2f}% | int8 {r['int8_acc']:.2f}% | "
+              f"漂移 {r['drift']:+.2f} 个百分点 ({r['num_points']} 点)")
+    print(f"  预测标签一致率: {report['label_agreement']:.2f}%")
+    speedup = report["float_ms_per_cloud"] / max(report["int8_ms_per_cloud"], 1e-9)
+    print(f"  耗时: float {report['float_ms_per_cloud']:.2f} ms/云 | "
+          f"int8 {report['int8_ms_per_cloud']:.2f} ms/云 | 加速 {speedup:.2f}x")
+
+
+def main():
+    from dianyun.cse.pointcloud_project.src.eval_one_cloud import CKPT_PATH, TEST_DATA_ROOT, NUM_POINTS
+
+    if not os.path.isfile(CKPT_PATH):
+        raise FileNotFoundError(f"找不到模型文件: {CKPT_PATH}")
+
+    report = evaluate_drift(CKPT_PATH, TEST_DATA_ROOT, num_points=NUM_POINTS)
+    print_drift_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -46,34 +46,56 @@ class SimplePointNetSeg(nn.Module):
         # 最后输出 num_classes（这里是 3 类：0/1/2）
         self.conv6 = nn.Conv1d(128, num_classes, 1)
 
+        # 推理用开关（不进 state_dict）：为 True 时分割头不再 repeat + cat 全局特征，
+        # 而是把 conv4 拆成局部/全局两部分，全局部分每个点云只算一次再广播
+        self.broadcast_global = False
+
     def forward(self, x):
         """
         x: (B, 3, N) 的输入点云
         return:
             (B, N, num_classes) 的每点分类 logits（还没有过 softmax）
         """
-        B, C, N = x.shape  # C 应该是 3
+        point_feat = self._point_features(x)            # (B, 256, N)
+        global_feat = self._global_features(point_feat)  # (B, 512, 1)
+        return self._seg_head(point_feat, global_feat)   # (B, N, num_classes)
 
-        # ---- 点特征提取 ----
+    def _point_features(self, x):
+        """
+        点特征提取：(B, 3, N) -> (B, 256, N)
+        """
         x = F.relu(self.bn1(self.conv1(x)))   # (B, 64, N)
         x = F.relu(self.bn2(self.conv2(x)))   # (B, 128, N)
         x = F.relu(self.bn3(self.conv3(x)))   # (B, 256, N)
-        point_feat = x                        # 保存一下局部特征
+        return x
 
-        # ---- 全局特征提取 ----
-        x = F.relu(self.bn_global(self.conv_global(x)))  # (B, 512, N)
+    def _global_features(self, point_feat):
+        """
+        全局特征提取：(B, 256, N) -> (B, 512, 1)
+        """
+        x = F.relu(self.bn_global(self.conv_global(point_feat)))  # (B, 512, N)
 
         # 对所有点做 max pooling，得到一个全局特征向量 (B, 512, 1)
-        global_feat = torch.max(x, dim=2, keepdim=True)[0]  # (B, 512, 1)
+        return torch.max(x, dim=2, keepdim=True)[0]
 
-        # 把全局特征复制 N 次，拼到每个点上
-        global_feat_expanded = global_feat.repeat(1, 1, N)  # (B, 512, N)
+    def _seg_head(self, point_feat, global_feat):
+        """
+        分割头：局部特征 (B, 256, N) + 全局特征 (B, 512, 1) -> (B, N, num_classes)
+        """
+        if self.broadcast_global:
+            x = self._conv4_broadcast(point_feat, global_feat)  # (B, 256, N)
+        else:
+            N = point_feat.shape[2]
+
+            # 把全局特征复制 N 次，拼到每个点上
+            global_feat_expanded = global_feat.repeat(1, 1, N)  # (B, 512, N)
 
-        # 局部(256) + 全局(512) = 768 维特征
-        x = torch.cat([point_feat, global_feat_expanded], dim=1)  # (B, 768, N)
+            # 局部(256) + 全局(512) = 768 维特征
+            x = torch.cat([point_feat, global_feat_expanded], dim=1)  # (B, 768, N)
+            x = self.conv4(x)                                         # (B, 256, N)
 
         # ---- 分割头（输出每个点的类别）----
-        x = F.relu(self.bn4(self.conv4(x)))  # (B, 256, N)
+        x = F.relu(self.bn4(x))              # (B, 256, N)
         x = F.relu(self.bn5(self.conv5(x)))  # (B, 128, N)
         x = self.dropout(x)
         x = self.conv6(x)                    # (B, num_classes, N)
@@ -82,3 +104,56 @@ class SimplePointNetSeg(nn.Module):
         x = x.transpose(1, 2).contiguous()   # (B, N, num_classes)
 
         return x
+
+    def _conv4_broadcast(self, point_feat, global_feat):
+        """
+        conv4(cat[局部, 全局]) = W_local @ 局部 + (W_global @ 全局 + b)
+        第二项每个点云只有一个 256 维向量，直接广播加到每个点上，
+        省掉 (B, 512, N) 和 (B, 768, N) 两个中间张量。
+        """
+        c_local = point_feat.shape[1]
+        w = self.conv4.weight                                                 # (256, 768, 1)
+
+        x = F.conv1d(point_feat, w[:, :c_local])                              # (B, 256, N)
+        g = F.conv1d(global_feat, w[:, c_local:], self.conv4.bias)           # (B, 256, 1)
+        return x.add_(g)
+
+    def _input_device(self):
+        """
+        模型所在设备（分块推理时把每块输入搬到这里）
+        """
+        return next(self.parameters()).device
+
+    @torch.no_grad()
+    def predict_chunked(self, x, chunk_size=65536):
+        """
+        两遍分块推理（仅用于 eval 模式），峰值显存/内存只和 chunk_size 有关：
+          第 1 遍：逐块计算全局特征，对各块结果取逐元素最大值（等价于整体 max pooling）
+          第 2 遍：逐块重新计算点特征，配合全局特征跑分割头，只保留 argmax 标签
+        eval 模式下 BN 和 dropout 都是逐点运算，结果与一次性 forward 的标签一致。
+
+        x: (B, 3, N)，可以在 CPU 上，每块会单独搬到模型所在设备
+        return:
+            (B, N) 的预测类别（CPU 上的 LongTensor）
+        """
+        if chunk_size <= 0:
+            raise ValueError("chunk_size 必须为正数")
+
+        device = self._input_device()
+        B, C, N = x.shape
+
+        # ---- 第 1 遍：全局特征 ----
+        global_feat = None
+        for s in range(0, N, chunk_size):
+            chunk = x[:, :, s:s + chunk_size].to(device)
+            g = self._global_features(self._point_features(chunk))
+            global_feat = g if global_feat is None else torch.maximum(global_feat, g)
+
+        # ---- 第 2 遍：逐块分割 ----
+        labels = torch.empty((B, N), dtype=torch.long)
+        for s in range(0, N, chunk_size):
+            chunk = x[:, :, s:s + chunk_size].to(device)
+            logits = self._seg_head(self._point_features(chunk), global_feat)
+            labels[:, s:s + chunk_size] = logits.argmax(dim=-1).cpu()
+
+        return labels
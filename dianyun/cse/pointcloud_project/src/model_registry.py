@@ -0,0 +1,133 @@
+"""
+model_registry.py
+作用：
+  进程级的模型注册表，避免每次推理都重新构建 SimplePointNetSeg + torch.load。
+  - 以 (checkpoint 绝对路径, 类别数, 设备, 变体) 为键缓存已加载的模型
+  - 变体 variant：
+      "plain"     原始 SimplePointNetSeg
+      "broadcast" 同一份权重，分割头广播全局特征，不生成 (B,768,N) 的拼接张量
+      "fused"     Conv+BN 折叠、去掉 dropout，并开启 broadcast 的推理版（见 model_fused）
+      "int8"      动态量化的 INT8 推理版，仅 CPU（见 model_int8）
+  - 记录 checkpoint 的 mtime，文件被重新训练覆盖后自动重新加载
+  - 模型始终处于 eval 模式
+  - warmup() 在启动时做几次空跑，让第一次真实推理和之后一样快
+使用方：
+  PointCloudAPI / PointCloudSegAPI / eval_one_cloud / test_inference
+"""
+
+import os
+import threading
+from typing import Optional, Union
+
+import torch
+
+from dianyun.cse.pointcloud_project.src.model_pointnet import SimplePointNetSeg
+
+
+_lock = threading.Lock()
+
+# (abs_path, num_classes, device_str, variant) -> (mtime_ns, model)
+_models = {}
+
+VARIANTS = ("plain", "broadcast", "fused", "int8")
+
+# 只能在 CPU 上运行的变体
+CPU_ONLY_VARIANTS = ("int8",)
+
+
+def resolve_device(device: Optional[Union[str, torch.device]] = None,
+                   variant: str = "plain") -> torch.device:
+    """
+    None -> 自动选择 cuda / cpu（CPU_ONLY_VARIANTS 固定为 cpu）；否则按传入值构造 torch.device。
+    """
+    if device is None:
+        if variant in CPU_ONLY_VARIANTS:
+            return torch.device("cpu")
+        return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    return torch.device(device)
+
+
+def _build_model(path: str, num_classes: int, dev: torch.device, variant: str) -> torch.nn.Module:
+    model = SimplePointNetSeg(num_classes=num_classes).to(dev)
+    state = torch.load(path, map_location=dev)
+    model.load_state_dict(state)
+    model.eval()
+
+    if variant == "fused":
+        from dianyun.cse.pointcloud_project.src.model_fused import fuse_model
+        model = fuse_model(model)
+        model.broadcast_global = True
+    elif variant == "broadcast":
+        model.broadcast_global = True
+    elif variant == "int8":
+        from dianyun.cse.pointcloud_project.src.model_int8 import quantize_int8
+        model = quantize_int8(model)
+
+    return model
+
+
+def get_model(
+    model_path: str,
+    num_classes: int = 3,
+    device: Optional[Union[str, torch.device]] = None,
+    variant: str = "plain",
+) -> torch.nn.Module:
+    """
+    返回已加载的 eval 模式模型；同一 checkpoint 在进程内只加载一次。
+    checkpoint 的 mtime 变化时重新加载。
+    """
+    if variant not in VARIANTS:
+        raise ValueError(f"未知的模型变体: {variant}，可选: {VARIANTS}")
+
+    path = os.path.abspath(model_path)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"模型文件不存在: {path}")
+
+    mtime = os.stat(path).st_mtime_ns
+    dev = resolve_device(device, variant)
+    if variant in CPU_ONLY_VARIANTS and dev.type != "cpu":
+        raise ValueError(f"模型变体 {variant} 只支持 CPU，当前设备: {dev}")
+    key = (path, num_classes, str(dev), variant)
+
+    with _lock:
+        entry = _models.get(key)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+
+        model = _build_model(path, num_classes, dev, variant)
+
+        _models[key] = (mtime, model)
+        return model
+
+
+def warmup(
+    model_path: str,
+    num_classes: int = 3,
+    device: Optional[Union[str, torch.device]] = None,
+    num_points: int = 4096,
+    runs: int = 2,
+    variant: str = "plain",
+) -> torch.nn.Module:
+    """
+    加载模型并用随机点云空跑 runs 次（分配内存池、初始化算子），返回模型。
+    """
+    dev = resolve_device(device, variant)
+    model = get_model(model_path, num_classes=num_classes, device=dev, variant=variant)
+
+    dummy = torch.rand(1, 3, num_points, device=dev)
+    with torch.no_grad():
+        for _ in range(runs):
+            model(dummy)
+
+    if dev.type == "cuda":
+        torch.cuda.synchronize(dev)
+
+    return model
+
+
+def clear():
+    """
+    清空注册表（释放所有缓存的模型）。
+    """
+    with _lock:
+        _models.clear()
@@ -0,0 +1,274 @@
+"""
+onnx_engine.py
+作用：
+  1) export_onnx：把训练好的 SimplePointNetSeg 导出为 ONNX（batch 和点数维度都是动态的）
+  2) OnnxSegEngine：基于 onnxruntime 的推理引擎，只依赖 numpy + onnxruntime，运行时不需要 torch
+  3) check_parity：同一批点云分别跑 torch 和 onnxruntime，对比 logits 与标签
+说明：
+  - 导出 / 对比需要 torch（只在函数内部导入）
+  - 控制板上只部署 .onnx + onnxruntime 即可推理
+  - 导出时另外生成 <名称>.global.onnx / <名称>.head.onnx 两个子图，
+    用于和 SimplePointNetSeg.predict_chunked 相同的两遍分块推理（峰值内存只和 chunk_size 有关）
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from dianyun.cse.pointcloud_project.src.pc_backend import load_pointcloud, save_colored_ply
+
+# ONNX运行时
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+    print("警告: 未找到onnxruntime，ONNX推理将不可用")
+
+
+INPUT_NAME = "points"    # (B, 3, N)
+OUTPUT_NAME = "logits"   # (B, N, num_classes)
+GLOBAL_NAME = "global_feat"  # (B, 512, 1)，分块推理子图之间传递的全局特征
+
+_lock = threading.Lock()
+
+# (abs_path, providers) -> (mtime_ns, OnnxSegEngine)
+_engines = {}
+
+
+def split_paths(onnx_path: str):
+    """
+    分块推理用的两个子图路径：(全局特征子图, 分割头子图)
+    """
+    stem = os.path.splitext(onnx_path)[0]
+    return stem + ".global.onnx", stem + ".head.onnx"
+
+
+def _export_split(model, onnx_path: str, num_points: int, opset: int):
+    """
+    导出两遍分块推理的子图：
+      global: points (B,3,n) -> global_feat (B,512,1)（该块的 max pooling 结果）
+      head:   points (B,3,n), global_feat (B,512,1) -> logits (B,n,num_classes)
+    """
+    import torch
+
+    class GlobalPart(torch.nn.Module):
+        def __init__(self, m):
+            super().__init__()
+            self.m = m
+
+        def forward(self, x):
+            return self.m._global_features(self.m._point_features(x))
+
+    class HeadPart(torch.nn.Module):
+        def __init__(self, m):
+            super().__init__()
+            self.m = m
+
+        def forward(self, x, g):
+            return self.m._seg_head(self.m._point_features(x), g)
+
+    global_path, head_path = split_paths(onnx_path)
+    dummy = torch.rand(1, 3, num_points)
+
+    torch.onnx.export(
+        GlobalPart(model).eval(),
+        dummy,
+        global_path,
+        input_names=[INPUT_NAME],
+        output_names=[GLOBAL_NAME],
+        dynamic_axes={INPUT_NAME: {0: "batch", 2: "num_points"}, GLOBAL_NAME: {0: "batch"}},
+        opset_version=opset,
+    )
+    with torch.no_grad():
+        g = GlobalPart(model)(dummy)
+    torch.onnx.export(
+        HeadPart(model).eval(),
+        (dummy, g),
+        head_path,
+        input_names=[INPUT_NAME, GLOBAL_NAME],
+        output_names=[OUTPUT_NAME],
+        dynamic_axes={
+            INPUT_NAME: {0: "batch", 2: "num_points"},
+            GLOBAL_NAME: {0: "batch"},
+            OUTPUT_NAME: {0: "batch", 1: "num_points"},
+        },
+        opset_version=opset,
+    )
+
+
+def export_onnx(model_path: str, onnx_path: str, num_classes: int = 3,
+                num_points: int = 4096, opset: int = 18) -> str:
+    """
+    从 checkpoint 导出 ONNX，输入 points:(B,3,N)，输出 logits:(B,N,num_classes)；
+    同时导出分块推理用的 global / head 子图（见 split_paths）。
+    """
+    import torch
+    from dianyun.cse.pointcloud_project.src.model_registry import get_model
+
+    model = get_model(model_path, num_classes=num_classes, device="cpu")
+    dummy = torch.rand(1, 3, num_points)
+
+    out_dir = os.path.dirname(os.path.abspath(onnx_path))
+    os.makedirs(out_dir, exist_ok=True)
+
+    torch.onnx.export(
+        model,
+        dummy,
+        onnx_path,
+        input_names=[INPUT_NAME],
+        output_names=[OUTPUT_NAME],
+        dynamic_axes={
+            INPUT_NAME: {0: "batch", 2: "num_points"},
+            OUTPUT_NAME: {0: "batch", 1: "num_points"},
+        },
+        opset_version=opset,
+    )
+    _export_split(model, onnx_path, num_points, opset)
+    return onnx_path
+
+
+class OnnxSegEngine:
+    """
+    onnxruntime 推理引擎，接口与 torch 版保持一致：输入 xyz，输出每点类别。
+    """
+
+    def __init__(self, onnx_path: str, providers=None):
+        if ort is None:
+            raise RuntimeError("未安装 onnxruntime，无法使用 ONNX 推理")
+        if not os.path.isfile(onnx_path):
+            raise FileNotFoundError(f"ONNX 模型文件不存在: {onnx_path}")
+
+        self.onnx_path = onnx_path
+        providers = list(providers) if providers else ["CPUExecutionProvider"]
+        self.session = ort.InferenceSession(onnx_path, providers=providers)
+
+        # 分块推理子图（旧版导出没有时为 None，predict_chunked 退回整体前向）
+        global_path, head_path = split_paths(onnx_path)
+        self.global_session = None
+        self.head_session = None
+        if os.path.isfile(global_path) and os.path.isfile(head_path):
+            self.global_session = ort.InferenceSession(global_path, providers=providers)
+            self.head_session = ort.InferenceSession(head_path, providers=providers)
+
+    def predict_logits(self, xyz_batch: np.ndarray) -> np.ndarray:
+        """
+        xyz_batch: (B, N, 3) -> logits (B, N, num_classes)
+        """
+        x = np.ascontiguousarray(np.asarray(xyz_batch, dtype=np.float32).transpose(0, 2, 1))
+        return self.session.run([OUTPUT_NAME], {INPUT_NAME: x})[0]
+
+    def predict(self, xyz: np.ndarray) -> np.ndarray:
+        """
+        xyz: (N, 3) -> 预测类别 (N,)
+        """
+        return self.predict_logits(np.asarray(xyz)[None]).argmax(axis=-1)[0]
+
+    def predict_chunked(self, xyz: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+        """
+        与 SimplePointNetSeg.predict_chunked 相同的两遍分块推理：
+          第 1 遍：逐块跑 global 子图，各块全局特征取逐元素最大值（等价于整体 max pooling）
+          第 2 遍：逐块跑 head 子图，只保留 argmax 标签
+        xyz: (N, 3) -> 预测类别 (N,)
+        """
+        if chunk_size <= 0:
+            raise ValueError("chunk_size 必须为正数")
+
+        xyz = np.asarray(xyz, dtype=np.float32)
+        N = xyz.shape[0]
+        if N <= chunk_size:
+            return self.predict(xyz)
+
+        if self.global_session is None:
+            print(f"⚠️ 未找到分块推理子图 {split_paths(self.onnx_path)}，"
+                  f"整体前向 {N} 个点；重新运行 export_onnx 可生成子图")
+            return self.predict(xyz)
+
+        def chunk(s):
+            return np.ascontiguousarray(xyz[s:s + chunk_size].T[None])  # (1, 3, n)
+
+        # ---- 第 1 遍：全局特征 ----
+        global_feat = None
+        for s in range(0, N, chunk_size):
+            g = self.global_session.run([GLOBAL_NAME], {INPUT_NAME: chunk(s)})[0]
+            global_feat = g if global_feat is None else np.maximum(global_feat, g)
+
+        # ---- 第 2 遍：逐块分割 ----
+        labels = np.empty(N, dtype=np.int64)
+        for s in range(0, N, chunk_size):
+            logits = self.head_session.run([OUTPUT_NAME], {INPUT_NAME: chunk(s), GLOBAL_NAME: global_feat})[0]
+            labels[s:s + chunk_size] = logits[0].argmax(axis=-1)
+        return labels
+
+    def warmup(self, num_points: int = 4096, runs: int = 2):
+        dummy = np.random.rand(1, num_points, 3).astype(np.float32)
+        for _ in range(runs):
+            self.predict_logits(dummy)
+
+
+def get_engine(onnx_path: str, providers=None) -> OnnxSegEngine:
+    """
+    进程级缓存：同一个 .onnx 只创建一次 InferenceSession，文件 mtime 变化时重建。
+    """
+    path = os.path.abspath(onnx_path)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"ONNX 模型文件不存在: {path}")
+
+    mtime = os.stat(path).st_mtime_ns
+    key = (path, tuple(providers) if providers else None)
+
+    with _lock:
+        entry = _engines.get(key)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+
+        engine = OnnxSegEngine(path, providers=providers)
+        _engines[key] = (mtime, engine)
+        return engine
+
+
+def inference_one_cloud_onnx(onnx_path, ply_path, out_path="infer_result.ply", chunk_size=None):
+    """
+    与 test_inference.inference_one_cloud 相同的流程，用 onnxruntime 推理。
+    chunk_size=None：整个点云一次前向；chunk_size=k：两遍分块推理（见 OnnxSegEngine.predict_chunked）
+    """
+    engine = get_engine(onnx_path)
+
+    xyz = load_pointcloud(ply_path)    # numpy (N,3)
+    if chunk_size is None:
+        pred = engine.predict(xyz)     # (N,)
+    else:
+        pred = engine.predict_chunked(xyz, chunk_size=chunk_size)
+
+    save_colored_ply(out_path, xyz, pred)
+
+    return out_path, pred, xyz[pred == 2]
+
+
+def check_parity(model_path: str, onnx_path: str, num_classes: int = 3,
+                 num_points: int = 5000, batch_size: int = 2, atol: float = 1e-4) -> dict:
+    """
+    用随机点云对比 torch 与 onnxruntime 的输出。
+    默认点数与导出时不同，顺便验证点数维度确实是动态的。
+    return: {"max_abs_diff", "label_agreement", "passed"}
+    """
+    import torch
+    from dianyun.cse.pointcloud_project.src.model_registry import get_model
+
+    model = get_model(model_path, num_classes=num_classes, device="cpu")
+    engine = OnnxSegEngine(onnx_path)
+
+    xyz = (np.random.rand(batch_size, num_points, 3).astype(np.float32) * 2.0) - 1.0
+
+    with torch.no_grad():
+        ref = model(torch.from_numpy(xyz).transpose(1, 2)).numpy()
+    out = engine.predict_logits(xyz)
+
+    max_abs_diff = float(np.abs(ref - out).max())
+    label_agreement = float((ref.argmax(axis=-1) == out.argmax(axis=-1)).mean())
+
+    return {
+        "max_abs_diff": max_abs_diff,
+        "label_agreement": label_agreement,
+        "passed": max_abs_diff <= atol,
+    }
@@ -27,10 +27,11 @@ py::array_t<float> load_pointcloud_cpp(const std::string &path) {
     return arr;
 }
 
-// xyz + labels → 写带颜色的 ASCII PLY
+// xyz + labels → 写带颜色的 PLY（默认二进制，binary=false 时写 ASCII）
 void save_colored_ply_cpp(const std::string &path,
                           py::array_t<float> xyz,
-                          py::array_t<int> labels) {
+                          py::array_t<int> labels,
+                          bool binary) {
 
     auto xyz_buf = xyz.unchecked<2>();
     auto lab_buf = labels.unchecked<1>();
@@ -62,7 +63,11 @@ void save_colored_ply_cpp(const std::string &path,
     cloud->height = 1;
     cloud->is_dense = false;
 
-    pcl::io::savePLYFileASCII(path, *cloud);
+    if (binary) {
+        pcl::io::savePLYFileBinary(path, *cloud);
+    } else {
+        pcl::io::savePLYFileASCII(path, *cloud);
+    }
 }
 
 // pybind11 导出模块
@@ -73,5 +78,6 @@ PYBIND11_MODULE(pc_backend, m) {
           "Load PLY file and return Nx3 float32 numpy array");
 
     m.def("save_colored_ply", &save_colored_ply_cpp,
-          "Save colored ply from xyz and labels");
+          "Save colored ply from xyz and labels",
+          py::arg("path"), py::arg("xyz"), py::arg("labels"), py::arg("binary") = true);
 }
@@ -1,79 +1,370 @@
 """
 pc_backend.py
 作用：
-  1) 在没有 open3d 的环境中读取点云（支持 PLY）
-  2) 在没有可视化库的环境中，保存预测/真值为带颜色的 PLY
+  1) 在没有 open3d 的环境中读取点云（支持 ASCII / binary_little_endian / binary_big_endian PLY）
+  2) 在没有可视化库的环境中，保存预测/真值为带颜色的 PLY（默认二进制）
 说明：
   - 这是“临时纯 Python 后端”
   - 在 RISC 上能直接跑
   - 第 2 步我们会把这里替换成 C++ 点云库后端（pybind11）
+  - 二进制 PLY 通过 header 的 property 列表构造结构化 dtype，再用 np.memmap 映射，
+    x/y/z 为连续 float32 时直接返回视图，不做拷贝
+  - ASCII PLY 按块向量化解析；iter_pointcloud 提供定长分块的流式读取
 """
 
+from collections import deque
+from itertools import islice
+
 import numpy as np
 
 
-def load_pointcloud(path: str) -> np.ndarray:
+# ASCII 解析时每块的行数
+_ASCII_CHUNK_LINES = 200_000
+
+# iter_pointcloud 默认每块点数
+DEFAULT_BLOCK_SIZE = 1_000_000
+
+# PLY 类型名 -> numpy 类型码（不含字节序）
+_PLY_TYPES = {
+    "char": "i1", "int8": "i1",
+    "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2",
+    "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4",
+    "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4",
+    "double": "f8", "float64": "f8",
+}
+
+# PLY format -> numpy 字节序前缀
+_PLY_ENDIAN = {
+    "binary_little_endian": "<",
+    "binary_big_endian": ">",
+}
+
+# 标签颜色：0 灰(环境) / 1 蓝(工件) / 2 红(瑕疵)
+_LABEL_COLORS = {
+    0: (128, 128, 128),
+    1: (0, 0, 255),
+    2: (255, 0, 0),
+}
+
+
+def _read_ply_header(path: str) -> dict:
     """
-    读取 ASCII PLY 点云文件，返回 xyz (N,3) float32
-    目前支持最常见的 ASCII 格式：
-      - header 里有 element vertex N
-      - 之后每行至少 3 列 (x y z)
+    解析 PLY header，返回：
+      {
+        "format": "ascii" / "binary_little_endian" / "binary_big_endian",
+        "elements": [{"name": str, "count": int, "properties": [(name, type) 或 (name, "list", count_type, item_type)]}],
+        "header_len": header 占用的字节数（数据起始偏移）
+      }
     """
-    if not path.lower().endswith(".ply"):
-        raise ValueError("目前只支持 .ply ASCII 文件")
-
-    with open(path, "r", encoding="utf-8", errors="ignore") as f:
-        lines = f.readlines()
-
-    # 1) 找 vertex 数量
-    num_verts = None
-    header_end = None
-    for i, line in enumerate(lines):
-        line = line.strip()
-        if line.startswith("element vertex"):
-            num_verts = int(line.split()[-1])
-        if line == "end_header":
-            header_end = i + 1
-            break
-
-    if num_verts is None or header_end is None:
-        raise ValueError("PLY header 解析失败：没找到 vertex 或 end_header")
-
-    # 2) 读取后面的点
+    elements = []
+    fmt = None
+
+    with open(path, "rb") as f:
+        magic = f.readline().strip()
+        if magic != b"ply":
+            raise ValueError(f"不是有效的 PLY 文件: {path}")
+
+        while True:
+            raw = f.readline()
+            if not raw:
+                raise ValueError("PLY header 解析失败：没找到 end_header")
+
+            parts = raw.decode("ascii", errors="ignore").split()
+            if not parts:
+                continue
+
+            key = parts[0]
+            if key == "format":
+                fmt = parts[1]
+            elif key == "element":
+                elements.append({"name": parts[1], "count": int(parts[2]), "properties": []})
+            elif key == "property":
+                if not elements:
+                    raise ValueError("PLY header 解析失败：property 出现在 element 之前")
+                if parts[1] == "list":
+                    # property list <count_type> <item_type> <name>
+                    elements[-1]["properties"].append((parts[4], "list", parts[2], parts[3]))
+                else:
+                    elements[-1]["properties"].append((parts[2], parts[1]))
+            elif key == "end_header":
+                header_len = f.tell()
+                break
+
+    if fmt is None:
+        raise ValueError("PLY header 解析失败：没找到 format")
+
+    return {"format": fmt, "elements": elements, "header_len": header_len}
+
+
+def _element_dtype(element: dict, endian: str) -> np.dtype:
+    """
+    根据 element 的 property 列表构造结构化 dtype（仅支持定长 property）。
+    """
+    fields = []
+    for prop in element["properties"]:
+        if len(prop) != 2:
+            raise ValueError(f"element '{element['name']}' 含有 list property，无法按定长记录映射")
+        name, ply_type = prop
+        if ply_type not in _PLY_TYPES:
+            raise ValueError(f"不支持的 PLY 属性类型: {ply_type}")
+        fields.append((name, endian + _PLY_TYPES[ply_type]))
+    return np.dtype(fields)
+
+
+def _structured_to_xyz(vertex: np.ndarray) -> np.ndarray:
+    """
+    从结构化 vertex 数组中取出 (N,3) float32 的 xyz。
+    x/y/z 为相邻的本机字节序 float32 且记录按 4 字节对齐时返回零拷贝视图
+    （torch.from_numpy 要求步长是元素大小的整数倍），否则做一次转换拷贝。
+    """
+    fields = vertex.dtype.fields
+    for name in ("x", "y", "z"):
+        if name not in fields:
+            raise ValueError(f"PLY vertex 缺少属性 '{name}'")
+
+    f32 = np.dtype(np.float32)
+    (tx, ox), (ty, oy), (tz, oz) = (fields[n][:2] for n in ("x", "y", "z"))
+    itemsize = vertex.dtype.itemsize
+    aligned = itemsize % 4 == 0 and ox % 4 == 0
+    if tx == ty == tz == f32 and oy == ox + 4 and oz == ox + 8 and aligned and vertex.shape[0] > 0:
+        return np.ndarray(
+            shape=(vertex.shape[0], 3),
+            dtype=np.float32,
+            buffer=vertex,
+            offset=ox,
+            strides=(itemsize, 4),
+        )
+
+    xyz = np.empty((vertex.shape[0], 3), dtype=np.float32)
+    xyz[:, 0] = vertex["x"]
+    xyz[:, 1] = vertex["y"]
+    xyz[:, 2] = vertex["z"]
+    return xyz
+
+
+def _find_vertex(header: dict):
+    """
+    返回 (vertex 在 elements 中的下标, vertex element)。
+    """
+    for i, element in enumerate(header["elements"]):
+        if element["name"] == "vertex":
+            return i, element
+    raise ValueError("PLY header 解析失败：没找到 vertex")
+
+
+def _map_binary_vertices(path: str, header: dict, mmap: bool) -> np.ndarray:
+    """
+    把二进制 PLY 的 vertex 块映射/读取为结构化数组 (N,)。
+    vertex 之前的 element 必须是定长记录，才能算出偏移。
+    """
+    endian = _PLY_ENDIAN[header["format"]]
+    offset = header["header_len"]
+    vi, _ = _find_vertex(header)
+
+    for element in header["elements"][:vi]:
+        offset += _element_dtype(element, endian).itemsize * element["count"]
+
+    element = header["elements"][vi]
+    dtype = _element_dtype(element, endian)
+    count = element["count"]
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    if mmap:
+        # mode="c"：写时复制，数组可写但不会改动原文件
+        return np.memmap(path, dtype=dtype, mode="c", offset=offset, shape=(count,))
+    return np.fromfile(path, dtype=dtype, count=count, offset=offset)
+
+
+def _load_binary_vertices(path: str, header: dict, mmap: bool) -> np.ndarray:
+    """
+    读取二进制 PLY 的 vertex 块，返回 (N,3) float32。
+    """
+    vertex = _map_binary_vertices(path, header, mmap)
+    if vertex.shape[0] == 0:
+        return np.zeros((0, 3), dtype=np.float32)
+    return _structured_to_xyz(vertex)
+
+
+def _ascii_xyz_columns(element: dict):
+    """
+    ASCII vertex 行的列数，以及 x/y/z 所在列号。
+    """
+    names = []
+    for prop in element["properties"]:
+        if len(prop) != 2:
+            raise ValueError("ASCII PLY 的 vertex 含有 list property，无法按固定列数解析")
+        names.append(prop[0])
+    for name in ("x", "y", "z"):
+        if name not in names:
+            raise ValueError(f"PLY vertex 缺少属性 '{name}'")
+    return len(names), [names.index("x"), names.index("y"), names.index("z")]
+
+
+def _tokens_per_line(raw: bytes, num_lines: int) -> np.ndarray:
+    """
+    向量化统计每行的 token 数（空白分隔），返回 (num_lines,)。
+    """
+    buf = np.frombuffer(raw, dtype=np.uint8)
+    if buf.size == 0:
+        return np.zeros(num_lines, dtype=np.int64)
+    newline = buf == 10
+    space = (buf == 32) | (buf == 9) | (buf == 13) | newline
+    # token 起点：非空白字节，且前一个字节是空白（或位于开头）
+    starts = ~space
+    starts[1:] &= space[:-1]
+    # 换行符归属于它结束的那一行
+    line_id = np.cumsum(newline) - newline
+    return np.bincount(line_id[starts], minlength=num_lines)[:num_lines]
+
+
+def _parse_ascii_block(lines, ncols: int, cols) -> np.ndarray:
+    """
+    把一批 ASCII vertex 行解析为 (k,3) float32。
+    快速路径：每行 token 数都等于 ncols 时，整块拼接后用 np.fromstring 一次性分词；
+    否则（坏行/空行/列数不整齐）退回逐行解析，每行只要求 max(cols)+1 个 token。
+    """
+    raw = b"".join(lines)
+    if np.all(_tokens_per_line(raw, len(lines)) == ncols):
+        vals = np.fromstring(raw.decode("ascii", errors="ignore"), dtype=np.float32, sep=" ")
+        if vals.size == len(lines) * ncols:
+            table = vals.reshape(-1, ncols)
+            if cols == [0, 1, 2] and ncols == 3:
+                return table
+            return table[:, cols]
+
+    need = max(cols) + 1
     pts = []
-    for line in lines[header_end:header_end + num_verts]:
-        parts = line.strip().split()
-        if len(parts) < 3:
+    for line in lines:
+        parts = line.split()
+        if len(parts) < need:
             continue
-        x, y, z = map(float, parts[:3])
-        pts.append([x, y, z])
+        pts.append([float(parts[c]) for c in cols])
+    return np.asarray(pts, dtype=np.float32).reshape(-1, 3)
 
-    xyz = np.asarray(pts, dtype=np.float32)
-    return xyz
 
+def _iter_ascii_vertices(path: str, header: dict, block_size: int):
+    """
+    分块读取 ASCII PLY 的 vertex 块，每次产出最多 block_size 个点 (k,3) float32。
+    只读取 header 声明的 vertex 数量；vertex 之前的 element 逐行跳过、不保存，
+    之后的 face 等块完全不读。
+    """
+    vi, element = _find_vertex(header)
+    ncols, cols = _ascii_xyz_columns(element)
+
+    with open(path, "rb") as f:
+        f.seek(header["header_len"])
+
+        for prev in header["elements"][:vi]:
+            deque(islice(f, prev["count"]), maxlen=0)
 
-def save_colored_ply(path: str, xyz: np.ndarray, labels: np.ndarray):
+        remaining = element["count"]
+        while remaining > 0:
+            lines = list(islice(f, min(block_size, remaining)))
+            if not lines:
+                break
+            remaining -= len(lines)
+            yield _parse_ascii_block(lines, ncols, cols)
+
+
+def _load_ascii_vertices(path: str, header: dict) -> np.ndarray:
+    """
+    读取 ASCII PLY 的 vertex 块，返回 (N,3) float32。
+    结果数组按声明点数预分配，逐块填充，不会生成逐点的 Python 列表。
     """
-    保存带颜色的 ASCII ply。
+    _, element = _find_vertex(header)
+    xyz = np.empty((element["count"], 3), dtype=np.float32)
+
+    n = 0
+    for block in _iter_ascii_vertices(path, header, _ASCII_CHUNK_LINES):
+        xyz[n:n + block.shape[0]] = block
+        n += block.shape[0]
+
+    return xyz[:n]
+
+
+def load_pointcloud(path: str, mmap: bool = True) -> np.ndarray:
+    """
+    读取 PLY 点云文件，返回 xyz (N,3) float32
+    支持格式：
+      - ascii 1.0（按块向量化解析，只读取声明的 vertex 数量）
+      - binary_little_endian 1.0 / binary_big_endian 1.0
+        （按 header 的 property 构造结构化 dtype；mmap=True 时用 np.memmap 映射，
+          x/y/z 连续且为本机字节序 float32 时返回的是文件映射上的视图）
+    """
+    if not path.lower().endswith(".ply"):
+        raise ValueError("目前只支持 .ply 文件")
+
+    header = _read_ply_header(path)
+    fmt = header["format"]
+
+    if fmt == "ascii":
+        return _load_ascii_vertices(path, header)
+    if fmt in _PLY_ENDIAN:
+        return _load_binary_vertices(path, header, mmap)
+
+    raise ValueError(f"不支持的 PLY 格式: {fmt}")
+
+
+def iter_pointcloud(path: str, block_size: int = DEFAULT_BLOCK_SIZE):
+    """
+    流式读取 PLY 点云：每次产出最多 block_size 个点的 (k,3) float32 数组。
+    适用于内存放不下两份完整点云的情况，峰值内存只和 block_size 有关。
+      - ASCII：逐块读取并解析
+      - 二进制：在 memmap 上逐块切片（对齐时产出的是映射视图，需要保留请自行 copy）
+    """
+    if not path.lower().endswith(".ply"):
+        raise ValueError("目前只支持 .ply 文件")
+    if block_size <= 0:
+        raise ValueError("block_size 必须为正数")
+
+    header = _read_ply_header(path)
+    fmt = header["format"]
+
+    if fmt == "ascii":
+        yield from _iter_ascii_vertices(path, header, block_size)
+    elif fmt in _PLY_ENDIAN:
+        vertex = _map_binary_vertices(path, header, mmap=True)
+        for start in range(0, vertex.shape[0], block_size):
+            yield _structured_to_xyz(vertex[start:start + block_size])
+    else:
+        raise ValueError(f"不支持的 PLY 格式: {fmt}")
+
+
+def save_colored_ply(path: str, xyz: np.ndarray, labels: np.ndarray, binary: bool = True):
+    """
+    保存带颜色的 ply（binary=True 写 binary_little_endian，否则写 ASCII）。
     labels 数值：
       0 -> 灰色 (环境)
       1 -> 蓝色 (工件)
       2 -> 红色 (瑕疵)
     """
+    xyz = np.asarray(xyz)
+    labels = np.asarray(labels)
     assert xyz.ndim == 2 and xyz.shape[1] == 3
     assert labels.ndim == 1 and labels.shape[0] == xyz.shape[0]
 
-    # 颜色映射
-    colors = np.zeros((labels.shape[0], 3), dtype=np.uint8)
-    colors[labels == 0] = [128, 128, 128]
-    colors[labels == 1] = [0, 0, 255]
-    colors[labels == 2] = [255, 0, 0]
-
     N = xyz.shape[0]
 
+    # 一次性组装成结构化数组，避免逐点格式化
+    vertex = np.zeros(N, dtype=[
+        ("x", "<f4"), ("y", "<f4"), ("z", "<f4"),
+        ("red", "u1"), ("green", "u1"), ("blue", "u1"),
+    ])
+    vertex["x"] = xyz[:, 0]
+    vertex["y"] = xyz[:, 1]
+    vertex["z"] = xyz[:, 2]
+    for cls, (r, g, b) in _LABEL_COLORS.items():
+        mask = labels == cls
+        vertex["red"][mask] = r
+        vertex["green"][mask] = g
+        vertex["blue"][mask] = b
+
     header = [
         "ply",
-        "format ascii 1.0",
+        "format binary_little_endian 1.0" if binary else "format ascii 1.0",
         f"element vertex {N}",
         "property float x",
         "property float y",
@@ -84,10 +375,11 @@ def save_colored_ply(path: str, xyz: np.ndarray, labels: np.ndarray):
         "end_header"
     ]
 
-    with open(path, "w", encoding="utf-8") as f:
-        for h in header:
-            f.write(h + "\n")
-        for (x, y, z), (r, g, b) in zip(xyz, colors):
-            f.write(f"{x:.6f} {y:.6f} {z:.6f} {r} {g} {b}\n")
+    with open(path, "wb") as f:
+        f.write(("\n".join(header) + "\n").encode("ascii"))
+        if binary:
+            vertex.tofile(f)
+        else:
+            np.savetxt(f, vertex, fmt="%.6f %.6f %.6f %d %d %d")
 
     print(f"✅ 已保存带颜色的 ply: {path}")
@@ -1,21 +1,46 @@
 import os
-import torch
 import numpy as np  # 新增：用于处理点云坐标与标签
-from dianyun.cse.pointcloud_project.src.test_inference import inference_one_cloud
-from dianyun.cse.pointcloud_project.src.eval_one_cloud import main as eval_npz_main
-from dianyun.cse.pointcloud_project.src.train_pointnet import train as train_main
+
+from dianyun.cse.pointcloud_project.src.detection_result import DetectionResult
+
+# torch 只在 backend="torch" / 训练 / 评估 / 导出时需要；
+# backend="onnx" 时控制板上可以不装 torch
+try:
+    import torch
+except ImportError:
+    torch = None
 
 
 class PointCloudAPI:
-    def __init__(self, project_root, enable_file_receiver=False, client_port=8001, **kwargs):
+    def __init__(self, project_root, enable_file_receiver=False, client_port=8001, chunk_size=65536,
+                 backend="torch", onnx_path=None, variant="plain", cache_max_mb=None, **kwargs):
         # 必需参数
         self.project_root = project_root
         self.enable_file_receiver = enable_file_receiver
         self.client_port = client_port
 
+        # 分块推理的每块点数（None = 整个点云一次前向），控制稠密扫描时的峰值内存
+        self.chunk_size = chunk_size
+
         self.project_root = os.path.expanduser(project_root)
         self.model_path = "/home/er/MasterComputer/dianyun/cse/pointcloud_project/checkpoints/pointnet_seg_best.pth"
 
+        # 推理后端："torch"（PyTorch）或 "onnx"（onnxruntime，不依赖 torch）
+        if backend not in ("torch", "onnx"):
+            raise ValueError(f"未知的推理后端: {backend}")
+        self.backend = backend
+        self.onnx_path = onnx_path or os.path.splitext(self.model_path)[0] + ".onnx"
+
+        # torch 后端的模型变体（见 model_registry.VARIANTS）：
+        #   "plain" 原始模型 / "fused" Conv+BN 折叠的推理版 / "int8" CPU 动态量化
+        self.variant = variant
+
+        # 推理结果缓存（见 result_cache.py）：cache_max_mb 为磁盘预算（MB），None 表示不缓存
+        self.result_cache = None
+        if cache_max_mb is not None:
+            from dianyun.cse.pointcloud_project.src.result_cache import InferenceCache
+            self.result_cache = InferenceCache(int(cache_max_mb * 1024 * 1024))
+
         # 保存最近一次推理中“类别为 2”的点的坐标（N, 3）或 None
         self.last_class2_coords = None
 
@@ -25,8 +50,11 @@ class PointCloudAPI:
     def check_env(self):
         print("🔍 Checking environment...")
         print("Project root:", self.project_root)
-        print("CUDA available:", torch.cuda.is_available())
+        print("CUDA available:", torch.cuda.is_available() if torch is not None else "torch not installed")
+        print("Backend:", self.backend)
         print("Model path:", self.model_path)
+        if self.backend == "onnx":
+            print("ONNX path:", self.onnx_path)
 
     # ---------------------------
     # 2. C++ 构建（实际上你的 .so 已提供）
@@ -38,6 +66,8 @@ class PointCloudAPI:
     # 3. 训练
     # ---------------------------
     def train(self):
+        from dianyun.cse.pointcloud_project.src.train_pointnet import train as train_main
+
         print("🚀 Starting training ...")
         train_main()
         print("🎉 Training completed.")
@@ -120,10 +150,37 @@ class PointCloudAPI:
         filename = os.path.basename(out_path)
         relative_out_path = os.path.join(output_dir, filename)
 
+        # 缓存命中：不解析 PLY、不做前向，也不重新生成带颜色的 PLY；
+        # 上次生成的带颜色 PLY 仍存在且未被覆盖时返回其路径，否则 result_path 为 None
+        cache_key = None
+        if self.result_cache is not None:
+            model_file = self.onnx_path if self.backend == "onnx" else self.model_path
+            cache_key = self.result_cache.make_key(
+                ply_path, model_file, backend=self.backend, variant=self.variant, chunk_size=self.chunk_size
+            )
+            hit = self.result_cache.get(cache_key)
+            if hit is not None:
+                print("⚡ Cache hit, skipped parsing and inference.")
+                class2_coords = hit[1] if len(hit[1]) else None
+                self.last_class2_coords = class2_coords
+                result = DetectionResult(class2_coords, result_path=hit[2], cache_hit=True)
+                result.log_summary(max_print_count)
+                return result
+
         # === 新增：兼容 inference_one_cloud 返回 2 个或 3 个值 ===
-        infer_result = inference_one_cloud(
-            self.model_path, ply_path, relative_out_path
-        )
+        if self.backend == "onnx":
+            from dianyun.cse.pointcloud_project.src.onnx_engine import inference_one_cloud_onnx
+
+            infer_result = inference_one_cloud_onnx(
+                self.onnx_path, ply_path, relative_out_path, chunk_size=self.chunk_size
+            )
+        else:
+            from dianyun.cse.pointcloud_project.src.test_inference import inference_one_cloud
+
+            infer_result = inference_one_cloud(
+                self.model_path, ply_path, relative_out_path,
+                chunk_size=self.chunk_size, variant=self.variant
+            )
 
         pred_data = None
         class2_coords = None
@@ -155,26 +212,14 @@ class PointCloudAPI:
 
         self.last_class2_coords = class2_coords
 
-        # === 新增：打印类别为 2 的点的坐标（最多 300 个） ===
-        if class2_coords is not None:
-            num_pts = class2_coords.shape[0]
-            print(f"📍 Detected {num_pts} point(s) of class 2. Coordinates:")
-
-            # 限制打印的数量不超过 max_print_count (默认 300)
-            print_count = min(num_pts, max_print_count)
-            for i, (x, y, z) in enumerate(class2_coords[:print_count]):
-                print(f"  #{i:04d}: ({x:.6f}, {y:.6f}, {z:.6f})")
+        if cache_key is not None and pred_data is not None and np.ndim(pred_data) == 1:
+            self.result_cache.put(cache_key, ply_path, pred_data, class2_coords, result_path=relative_out_path)
 
-            if num_pts > max_print_count:
-                print(f"ℹ️ Only the first {max_print_count} points are printed.")
-        else:
-            print("ℹ️ No class-2 points detected, or prediction output has no labels/coords.")
+        # 坐标保持为 numpy 数组；result['class2_coordinates'] 等 dict 用法在访问时才转换
+        result = DetectionResult(class2_coords, result_path=relative_out_path)
 
-        # 返回字典而不是字符串
-        result = {
-            'result_path': relative_out_path,
-            'class2_coordinates': class2_coords.tolist() if class2_coords is not None else None
-        }
+        # 打印类别为 2 的点数；逐点坐标（最多 max_print_count 个）只在 DEBUG 日志级别输出
+        result.log_summary(max_print_count)
 
         return result
 
@@ -182,6 +227,77 @@ class PointCloudAPI:
     # 5. 评估 npz 点云
     # ---------------------------
     def evaluate(self):
+        from dianyun.cse.pointcloud_project.src.eval_one_cloud import main as eval_npz_main
+
         print("📊 Running evaluation on NPZ dataset ...")
         eval_npz_main()
         print("🎉 Evaluation completed.")
+
+    # ---------------------------
+    # 5.1 评估 INT8 相对 float 的精度漂移
+    # ---------------------------
+    def evaluate_int8(self, data_root=None, max_files=None):
+        """
+        在 npz 评估集上比较 float / INT8 的逐类准确率和耗时，打印并返回报告。
+        data_root 默认使用 eval_one_cloud.TEST_DATA_ROOT。
+        """
+        from dianyun.cse.pointcloud_project.src.model_int8 import evaluate_drift, print_drift_report
+
+        if data_root is None:
+            from dianyun.cse.pointcloud_project.src.eval_one_cloud import TEST_DATA_ROOT
+            data_root = TEST_DATA_ROOT
+
+        print("📊 Comparing INT8 against float model on:", data_root)
+        report = evaluate_drift(self.model_path, data_root, max_files=max_files)
+        print_drift_report(report)
+        return report
+
+    # ---------------------------
+    # 6. 预热模型（启动时调用一次）
+    # ---------------------------
+    def warmup(self, num_points=4096, runs=2):
+        """
+        把模型加载进进程级注册表并空跑几次前向，
+        之后的 infer() 不再重复加载 checkpoint。
+        """
+        path = self.onnx_path if self.backend == "onnx" else self.model_path
+        if not os.path.isfile(path):
+            print("⚠️ Model file not found, skip warm-up:", path)
+            return False
+
+        print("🔥 Warming up model:", path)
+        if self.backend == "onnx":
+            from dianyun.cse.pointcloud_project.src.onnx_engine import get_engine
+
+            get_engine(path).warmup(num_points=num_points, runs=runs)
+        else:
+            from dianyun.cse.pointcloud_project.src import model_registry
+
+            model_registry.warmup(path, num_classes=3, num_points=num_points, runs=runs,
+                                  variant=self.variant)
+        print("✅ Model warm-up finished.")
+        return True
+
+    # ---------------------------
+    # 7. 导出 ONNX（需要 torch）
+    # ---------------------------
+    def export_onnx(self, onnx_path=None, check=True):
+        """
+        把 checkpoint 导出为 ONNX（点数维度动态），默认写到 self.onnx_path。
+        check=True 时对比 torch 与 onnxruntime 的输出。
+        """
+        from dianyun.cse.pointcloud_project.src.onnx_engine import export_onnx, check_parity
+
+        onnx_path = onnx_path or self.onnx_path
+        print("📦 Exporting ONNX:", self.model_path, "->", onnx_path)
+        export_onnx(self.model_path, onnx_path, num_classes=3)
+        print("✅ ONNX exported:", onnx_path)
+
+        parity = None
+        if check:
+            parity = check_parity(self.model_path, onnx_path, num_classes=3)
+            status = "✅" if parity["passed"] else "⚠️"
+            print(f"{status} Parity check: max |Δlogit| = {parity['max_abs_diff']:.2e}, "
+                  f"label agreement = {parity['label_agreement'] * 100:.2f}%")
+
+        return {"onnx_path": onnx_path, "parity": parity}
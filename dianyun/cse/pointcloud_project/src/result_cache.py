@@ -0,0 +1,206 @@
+"""
+result_cache.py
+作用：
+  推理结果缓存：同一个扫描文件、同一个模型、同样的推理参数只推理一次。
+    - 键 = PLY 文件内容哈希 + 模型文件内容哈希 + 推理参数（后端 / 变体 / 分块大小 ...）
+    - 预测标签和类别 2 坐标以 .npy 保存在扫描文件旁边的 .infer_cache/ 目录
+    - 所有缓存条目登记在一个 sqlite 索引中，总大小超过 max_bytes 时按最近最少使用（LRU）淘汰
+    - 命中时既不解析 PLY，也不做前向；未命中时生成的带颜色 PLY 路径也登记在索引中，
+      命中时若该文件仍存在且未被覆盖（大小和 mtime 不变）则一并返回
+说明：
+  - 文件哈希按 (路径, 大小, mtime) 在进程内记忆，同一个文件不重复读取
+  - 扫描目录不可写时只打印提示，不影响推理
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+
+CACHE_DIRNAME = ".infer_cache"
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".cache", "pointnet_seg", "result_cache.sqlite")
+
+_HASH_CHUNK = 1 << 20
+
+# abs_path -> (size, mtime_ns, hexdigest)
+_digest_memo = {}
+_digest_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    """
+    文件内容哈希（blake2b-128），按 (大小, mtime) 记忆。
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+
+    with _digest_lock:
+        entry = _digest_memo.get(path)
+        if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_CHUNK), b""):
+            h.update(block)
+    digest = h.hexdigest()
+
+    with _digest_lock:
+        _digest_memo[path] = (st.st_size, st.st_mtime_ns, digest)
+    return digest
+
+
+class InferenceCache:
+    def __init__(self, max_bytes: int, index_path: str = DEFAULT_INDEX_PATH):
+        """
+        :param max_bytes: 所有缓存文件的总大小上限（字节）
+        :param index_path: sqlite 索引文件路径
+        """
+        self.max_bytes = int(max_bytes)
+        self.index_path = index_path
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, labels_path TEXT, class2_path TEXT,"
+                " size INTEGER, last_used REAL, result_path TEXT, result_stat TEXT)"
+            )
+            # 旧版索引没有带颜色 PLY 的列
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(entries)")}
+            for column in ("result_path", "result_stat"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE entries ADD COLUMN {column} TEXT")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """
+        事务结束时提交（异常时回滚），并且总是关闭连接
+        """
+        conn = sqlite3.connect(self.index_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _file_stat(path):
+        """
+        带颜色 PLY 的 "大小:mtime_ns"，用来判断文件是否已被后来的推理覆盖；文件不存在返回 None
+        """
+        try:
+            st = os.stat(path)
+        except (OSError, TypeError):
+            return None
+        return f"{st.st_size}:{st.st_mtime_ns}"
+
+    @staticmethod
+    def make_key(ply_path: str, model_path: str, **params) -> str:
+        """
+        扫描文件哈希 + 模型哈希 + 推理参数 -> 缓存键
+        """
+        payload = json.dumps(
+            {"ply": file_digest(ply_path), "model": file_digest(model_path), "params": params},
+            sort_keys=True,
+        )
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key: str, with_labels: bool = False):
+        """
+        命中返回 (labels 或 None, class2_coords (M,3), result_path 或 None)，否则返回 None。
+        labels 以只读 mmap 方式打开；result_path 为登记的带颜色 PLY，已删除或被覆盖时为 None。
+        """
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT labels_path, class2_path, result_path, result_stat FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            labels_path, class2_path, result_path, result_stat = row
+            if not (os.path.isfile(labels_path) and os.path.isfile(class2_path)):
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+
+            conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+
+        if result_path is not None and self._file_stat(result_path) != result_stat:
+            result_path = None
+
+        class2 = np.load(class2_path)
+        labels = np.load(labels_path, mmap_mode="r") if with_labels else None
+        return labels, class2, result_path
+
+    def put(self, key: str, ply_path: str, labels: np.ndarray, class2_coords, result_path=None) -> bool:
+        """
+        把结果写到 <扫描目录>/.infer_cache/ 并登记，随后按 LRU 淘汰到预算以内。
+        result_path：本次生成的带颜色 PLY（不计入缓存大小，也不会被淘汰删除）。
+        """
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(ply_path)), CACHE_DIRNAME)
+        labels_path = os.path.join(cache_dir, f"{key}.labels.npy")
+        class2_path = os.path.join(cache_dir, f"{key}.class2.npy")
+
+        if class2_coords is None:
+            class2_coords = np.zeros((0, 3), dtype=np.float32)
+
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            np.save(labels_path, np.asarray(labels, dtype=np.uint8).reshape(-1))
+            np.save(class2_path, np.asarray(class2_coords, dtype=np.float32).reshape(-1, 3))
+        except OSError as e:
+            print(f"⚠️ 推理结果缓存写入失败（{cache_dir}）: {e}")
+            return False
+
+        size = os.path.getsize(labels_path) + os.path.getsize(class2_path)
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries"
+                " (key, labels_path, class2_path, size, last_used, result_path, result_stat)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, labels_path, class2_path, size, time.time(),
+                 result_path, self._file_stat(result_path)),
+            )
+            self._evict(conn)
+        return True
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = conn.execute("SELECT key, labels_path, class2_path, size FROM entries ORDER BY last_used").fetchall()
+        for key, labels_path, class2_path, size in rows:
+            if total <= self.max_bytes:
+                break
+            for path in (labels_path, class2_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+
+    def total_bytes(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def clear(self):
+        """
+        删除全部缓存文件和索引条目。
+        """
+        with self._lock, self._connect() as conn:
+            for labels_path, class2_path in conn.execute("SELECT labels_path, class2_path FROM entries"):
+                for path in (labels_path, class2_path):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            conn.execute("DELETE FROM entries")
@@ -0,0 +1,188 @@
+"""
+sampling.py
+作用：
+  推理前把原始点云降到固定点数，以及把预测标签映射回每一个原始点。
+    - random：随机采样（原来的做法，不确定）
+    - voxel ：向量化体素网格降采样，每个体素取离体素质心最近的点（确定性）
+    - fps   ：最远点采样；点多时先体素降到若干倍候选点再做 FPS（确定性）
+    - nearest_labels：最近邻回投，给所有原始点赋予预测标签
+说明：
+  - 只依赖 numpy；装了 scipy 时最近邻用 cKDTree，否则用分块矩阵运算暴力求解
+    （每块距离矩阵的元素数有上限，内存与 ref 点数无关）
+"""
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+
+SAMPLING_STRATEGIES = ("random", "voxel", "fps")
+
+# fps 候选点数 = num_points * FPS_CANDIDATE_FACTOR
+FPS_CANDIDATE_FACTOR = 4
+
+# 体素尺寸二分搜索的最大迭代次数；非空体素数落在 [num_points, num_points * _VOXEL_COUNT_TOL] 内即提前结束
+_VOXEL_SEARCH_ITERS = 12
+_VOXEL_COUNT_TOL = 1.25
+
+# 暴力最近邻每块距离矩阵 (chunk, M) 的最大元素数（float32，约 16 MB）
+_NN_MAX_ELEMS = 1 << 22
+
+
+def _pad_indices(idx: np.ndarray, num_points: int) -> np.ndarray:
+    """
+    点数不足时按顺序循环重复已有索引，补齐到 num_points。
+    """
+    if idx.shape[0] >= num_points:
+        return idx
+    extra = idx[np.arange(num_points - idx.shape[0]) % idx.shape[0]]
+    return np.concatenate([idx, extra])
+
+
+def _voxel_keys(xyz: np.ndarray, origin: np.ndarray, voxel_size: float) -> np.ndarray:
+    """
+    每个点所在体素的一维键。
+    """
+    cell = np.floor((xyz - origin) / voxel_size).astype(np.int64)
+    dims = cell.max(axis=0) + 1
+    return (cell[:, 0] * dims[1] + cell[:, 1]) * dims[2] + cell[:, 2]
+
+
+def voxel_downsample_indices(xyz: np.ndarray, voxel_size: float) -> np.ndarray:
+    """
+    体素降采样：每个非空体素保留离体素质心最近的那个点，返回其索引（按体素键排序）。
+    """
+    xyz = np.asarray(xyz, dtype=np.float64)
+    keys = _voxel_keys(xyz, xyz.min(axis=0), voxel_size)
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+
+    centroid = np.empty((counts.shape[0], 3), dtype=np.float64)
+    for d in range(3):
+        centroid[:, d] = np.bincount(inverse, weights=xyz[:, d]) / counts
+
+    dist = ((xyz - centroid[inverse]) ** 2).sum(axis=1)
+
+    # 先按体素、再按到质心距离排序，每个体素的第一个就是最近点
+    order = np.lexsort((dist, inverse))
+    first = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    return order[first]
+
+
+def voxel_grid_indices(xyz: np.ndarray, num_points: int) -> np.ndarray:
+    """
+    自动确定体素尺寸，使非空体素数不少于 num_points 且尽量接近，
+    再从体素代表点中等间隔取 num_points 个（不足时循环补齐）。
+    """
+    xyz = np.asarray(xyz, dtype=np.float64)
+    N = xyz.shape[0]
+    if N <= num_points:
+        return _pad_indices(np.arange(N), num_points)
+
+    extent = float(np.max(xyz.max(axis=0) - xyz.min(axis=0)))
+    if extent <= 0:
+        return _pad_indices(np.arange(min(N, num_points)), num_points)
+
+    # 二分体素尺寸（只统计非空体素数）：lo 方向体素更多，hi 方向体素更少。
+    # 第一次按“表面点云”估计 extent / sqrt(num_points) 试探，体素数足够接近目标时提前结束
+    origin = xyz.min(axis=0)
+    lo, hi = 0.0, extent
+    mid = extent / np.sqrt(num_points)
+    best_size = None
+    for _ in range(_VOXEL_SEARCH_ITERS):
+        count = np.unique(_voxel_keys(xyz, origin, mid)).shape[0]
+        if count >= num_points:
+            best_size = mid
+            if count <= num_points * _VOXEL_COUNT_TOL:
+                break
+            lo = mid
+        else:
+            hi = mid
+        mid = (lo + hi) / 2.0
+
+    if best_size is None:
+        best = np.arange(N)
+    else:
+        best = voxel_downsample_indices(xyz, best_size)
+
+    pick = np.linspace(0, best.shape[0] - 1, num_points).astype(np.int64)
+    return best[pick]
+
+
+def farthest_point_indices(xyz: np.ndarray, num_points: int,
+                           candidate_factor: int = FPS_CANDIDATE_FACTOR) -> np.ndarray:
+    """
+    最远点采样。点数超过 num_points * candidate_factor 时先体素降采样得到候选点，
+    FPS 的代价从 O(N * num_points) 降到 O(候选点数 * num_points)。
+    从离质心最远的点开始，结果是确定性的。
+    """
+    xyz = np.asarray(xyz, dtype=np.float32)
+    N = xyz.shape[0]
+    if N <= num_points:
+        return _pad_indices(np.arange(N), num_points)
+
+    if N > num_points * candidate_factor:
+        cand = voxel_grid_indices(xyz, num_points * candidate_factor)
+    else:
+        cand = np.arange(N)
+    pts = xyz[cand]
+
+    selected = np.empty(num_points, dtype=np.int64)
+    dist = np.full(pts.shape[0], np.inf, dtype=np.float32)
+    far = int(np.argmax(((pts - pts.mean(axis=0)) ** 2).sum(axis=1)))
+
+    for i in range(num_points):
+        selected[i] = far
+        d = ((pts - pts[far]) ** 2).sum(axis=1)
+        np.minimum(dist, d, out=dist)
+        far = int(np.argmax(dist))
+
+    return cand[selected]
+
+
+def sample_indices(xyz: np.ndarray, num_points: int, strategy: str = "random") -> np.ndarray:
+    """
+    按策略从 (N,3) 中选出 num_points 个索引（点数不足时允许重复）。
+    """
+    N = xyz.shape[0]
+    if strategy == "random":
+        return np.random.choice(N, num_points, replace=N < num_points)
+    if strategy == "voxel":
+        return voxel_grid_indices(xyz, num_points)
+    if strategy == "fps":
+        return farthest_point_indices(xyz, num_points)
+    raise ValueError(f"未知的采样策略: {strategy}，可选: {SAMPLING_STRATEGIES}")
+
+
+def nearest_labels(ref_xyz: np.ndarray, ref_labels: np.ndarray, query_xyz: np.ndarray) -> np.ndarray:
+    """
+    最近邻回投：query 中每个点取 ref 中最近点的标签。
+    ref_xyz: (M,3)，ref_labels: (M,)，query_xyz: (N,3) -> (N,)
+    """
+    ref_xyz = np.asarray(ref_xyz, dtype=np.float32)
+    query_xyz = np.asarray(query_xyz, dtype=np.float32)
+    ref_labels = np.asarray(ref_labels)
+
+    if cKDTree is not None:
+        _, nn = cKDTree(ref_xyz).query(query_xyz, k=1)
+        return ref_labels[nn]
+
+    # 以 ref 的中心为原点，减小 float32 下 |a|^2 - 2ab + |b|^2 的舍入误差
+    center = ref_xyz.mean(axis=0)
+    ref = ref_xyz - center
+    ref_sq = (ref ** 2).sum(axis=1)
+
+    # 每块查询点数随 ref 点数缩小，距离矩阵 (chunk, M) 不超过 _NN_MAX_ELEMS 个 float32
+    chunk = max(1, _NN_MAX_ELEMS // max(ref.shape[0], 1))
+
+    out = np.empty(query_xyz.shape[0], dtype=ref_labels.dtype)
+    for s in range(0, query_xyz.shape[0], chunk):
+        q = query_xyz[s:s + chunk] - center
+        d = q @ ref.T                               # (chunk, M) float32
+        d *= -2.0
+        d += ref_sq                                 # 省略每行常数 |q|^2
+        out[s:s + chunk] = ref_labels[np.argmin(d, axis=1)]
+    return out
@@ -0,0 +1,121 @@
+"""
+seg_client.py
+作用：
+  常驻分割推理服务（seg_server.py）的客户端：
+    - predict_points：把 (N,3) 点云以 .npy 二进制发给服务，拿回每个点的预测类别 (N,)
+    - infer：和 PointCloudAPI.infer 相同的签名和返回值，可直接替换 PointCloudDefectDetector 的推理后端
+    - metrics：读取服务的队列深度 / 延迟统计
+说明：
+  - 不依赖 torch，只需要 numpy + httpx
+  - url 以 "unix:" 开头时走 Unix socket，例如 "unix:/tmp/pointnet_seg.sock"；否则为 http 地址
+"""
+
+import io
+import os
+
+import numpy as np
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from dianyun.cse.pointcloud_project.src.detection_result import DetectionResult
+from dianyun.cse.pointcloud_project.src.pc_backend import load_pointcloud, save_colored_ply
+
+
+DEFAULT_PORT = 9100
+DEFAULT_UDS = "/tmp/pointnet_seg.sock"
+
+NPY_CONTENT_TYPE = "application/x-npy"
+
+
+def encode_array(arr: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    np.save(buf, np.ascontiguousarray(arr), allow_pickle=False)
+    return buf.getvalue()
+
+
+def decode_array(data: bytes) -> np.ndarray:
+    return np.load(io.BytesIO(data), allow_pickle=False)
+
+
+class SegServerClient:
+    def __init__(self, url=f"unix:{DEFAULT_UDS}", timeout=60.0):
+        if httpx is None:
+            raise ImportError("SegServerClient 需要 httpx：pip install httpx")
+
+        if url.startswith("unix:"):
+            transport = httpx.HTTPTransport(uds=url[len("unix:"):])
+            self._client = httpx.Client(transport=transport, base_url="http://seg-server", timeout=timeout)
+        else:
+            self._client = httpx.Client(base_url=url, timeout=timeout)
+        self.url = url
+
+        # 与 PointCloudAPI 保持一致
+        self.last_class2_coords = None
+
+    def close(self):
+        self._client.close()
+
+    def health(self) -> bool:
+        try:
+            return self._client.get("/health").status_code == 200
+        except httpx.HTTPError:
+            return False
+
+    def warmup(self):
+        """
+        模型在服务端常驻且已预热，这里只检查服务是否可用。
+        """
+        if not self.health():
+            raise RuntimeError(f"推理服务不可用: {self.url}")
+        return True
+
+    def metrics(self) -> dict:
+        resp = self._client.get("/metrics")
+        resp.raise_for_status()
+        return resp.json()
+
+    def predict_points(self, points: np.ndarray) -> np.ndarray:
+        """
+        :param points: (N,3) 原始点云
+        :return: (N,) 每个原始点的预测类别
+        """
+        points = np.asarray(points, dtype=np.float32)
+        resp = self._client.post(
+            "/predict",
+            content=encode_array(points),
+            headers={"Content-Type": NPY_CONTENT_TYPE},
+        )
+        if resp.status_code != 200:
+            raise RuntimeError(f"推理服务返回错误 {resp.status_code}: {resp.text}")
+        return decode_array(resp.content)
+
+    def infer(self, ply_path, out_path=None, max_print_count=300):
+        """
+        与 PointCloudAPI.infer 相同的返回值（DetectionResult）：
+          result_path 为带颜色 PLY 路径（out_path 为 None 时不保存）
+        """
+        print("🔎 Running inference (seg server) on:", ply_path)
+
+        xyz = load_pointcloud(ply_path)
+        if xyz is None or len(xyz) == 0:
+            raise RuntimeError(f"从 {ply_path} 读取到的点云为空")
+
+        labels = self.predict_points(xyz)
+
+        result_path = None
+        if out_path is not None:
+            output_dir = "output_results"
+            os.makedirs(output_dir, exist_ok=True)
+            result_path = os.path.join(output_dir, os.path.basename(out_path))
+            save_colored_ply(result_path, xyz, labels)
+
+        mask = labels == 2
+        class2_coords = np.asarray(xyz)[mask] if np.any(mask) else None
+        self.last_class2_coords = class2_coords
+
+        result = DetectionResult(class2_coords, result_path=result_path)
+        result.log_summary(max_print_count)
+        return result
@@ -0,0 +1,261 @@
+"""
+seg_server.py
+作用：
+  常驻的本地分割推理服务，推理流程与 PointCloudAPI.infer（test_inference.inference_one_cloud）相同：
+  原始坐标、全部点、按 chunk_size 两遍分块推理，不做归一化和降采样，
+  因此 PointCloudDefectDetector 切换到 inference_url 后检出的缺陷点不变。
+    - 进程启动时加载并预热模型，之后的调用不再承担 import / 加载 checkpoint 的开销
+    - POST /predict：请求体为 (N,3) 点云的 .npy 二进制，返回 (N,) 每个原始点的预测类别（.npy）
+    - 微批处理：max_wait_ms 内到达的请求（最多 max_batch 个）循环补齐到相同点数后合并成一个 batch，只做一次前向
+    - GET /metrics：队列深度、批大小、排队 / 推理 / 端到端延迟
+    - 可监听 TCP 端口或 Unix socket
+  客户端见 seg_client.SegServerClient。
+
+用法：
+  python -m dianyun.cse.pointcloud_project.src.seg_server --model checkpoints/pointnet_seg_best.pth --uds /tmp/pointnet_seg.sock
+"""
+
+import argparse
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+import torch
+
+from fastapi import FastAPI, HTTPException, Request, Response
+import uvicorn
+
+from dianyun.cse.pointcloud_project.src import model_registry
+from dianyun.cse.pointcloud_project.src.bulk_infer import DEFAULT_CHUNK_SIZE, predict_padded_batch
+from dianyun.cse.pointcloud_project.src.model_registry import VARIANTS, get_model, resolve_device
+from dianyun.cse.pointcloud_project.src.seg_client import (
+    DEFAULT_PORT, NPY_CONTENT_TYPE, decode_array, encode_array,
+)
+
+
+# 合并请求时最多等待的毫秒数 / 单批最多的点云数
+DEFAULT_MAX_WAIT_MS = 5.0
+DEFAULT_MAX_BATCH = 8
+
+# 延迟统计保留最近多少个请求
+_LATENCY_WINDOW = 1024
+
+
+class FullResolutionSegmenter:
+    """
+    与 inference_one_cloud 相同的推理：整个原始点云参与前向，chunk_size 控制峰值内存。
+    """
+
+    def __init__(self, model_path: str, num_classes: int = 3, device=None, variant: str = "plain",
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.model_path = model_path
+        self.num_classes = num_classes
+        self.variant = variant
+        self.chunk_size = chunk_size
+        self.device = resolve_device(device, variant)
+        self.model = get_model(model_path, num_classes=num_classes, device=self.device, variant=variant)
+
+    def warmup(self, num_points: int = 4096, runs: int = 2):
+        model_registry.warmup(self.model_path, num_classes=self.num_classes, device=self.device,
+                              num_points=num_points, runs=runs, variant=self.variant)
+
+    def predict_batch(self, clouds) -> list:
+        """
+        clouds: [(N_i,3), ...] -> [(N_i,), ...] 每个原始点的预测类别
+        """
+        with torch.no_grad():
+            return predict_padded_batch(self.model, clouds, self.chunk_size)
+
+
+class _Job:
+    __slots__ = ("points", "future", "t_enqueue")
+
+    def __init__(self, points: np.ndarray):
+        self.points = points
+        self.future = Future()
+        self.t_enqueue = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    后台线程从队列中取请求：拿到第一个请求后最多再等 max_wait_ms，
+    把这段时间内到达的请求一起交给 FullResolutionSegmenter.predict_batch（一次前向）。
+    """
+
+    def __init__(self, api: FullResolutionSegmenter, max_batch: int = DEFAULT_MAX_BATCH,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS):
+        self.api = api
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stop = threading.Event()
+
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._errors = 0
+        self._queue_ms = deque(maxlen=_LATENCY_WINDOW)
+        self._forward_ms = deque(maxlen=_LATENCY_WINDOW)
+        self._total_ms = deque(maxlen=_LATENCY_WINDOW)
+        self._batch_sizes = deque(maxlen=_LATENCY_WINDOW)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="seg-batcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def submit(self, points: np.ndarray) -> Future:
+        job = _Job(points)
+        self._queue.put(job)
+        return job.future
+
+    def _collect(self):
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+
+            t_start = time.perf_counter()
+            try:
+                results = self.api.predict_batch([job.points for job in batch])
+            except Exception as e:
+                for job in batch:
+                    job.future.set_exception(e)
+                with self._stats_lock:
+                    self._errors += len(batch)
+                continue
+            t_done = time.perf_counter()
+
+            for job, labels in zip(batch, results):
+                job.future.set_result(labels)
+
+            with self._stats_lock:
+                self._batches += 1
+                self._requests += len(batch)
+                self._batch_sizes.append(len(batch))
+                self._forward_ms.append((t_done - t_start) * 1000.0)
+                for job in batch:
+                    self._queue_ms.append((t_start - job.t_enqueue) * 1000.0)
+                    self._total_ms.append((t_done - job.t_enqueue) * 1000.0)
+
+    def metrics(self) -> dict:
+        def summary(values):
+            if not values:
+                return {"mean": None, "p50": None, "p95": None, "max": None}
+            arr = np.asarray(values)
+            return {
+                "mean": float(arr.mean()),
+                "p50": float(np.percentile(arr, 50)),
+                "p95": float(np.percentile(arr, 95)),
+                "max": float(arr.max()),
+            }
+
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "requests_total": self._requests,
+                "batches_total": self._batches,
+                "errors_total": self._errors,
+                "mean_batch_size": float(np.mean(self._batch_sizes)) if self._batch_sizes else None,
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queue_ms": summary(self._queue_ms),
+                "batch_ms": summary(self._forward_ms),
+                "latency_ms": summary(self._total_ms),
+            }
+
+
+def create_app(api: FullResolutionSegmenter, max_batch: int = DEFAULT_MAX_BATCH,
+               max_wait_ms: float = DEFAULT_MAX_WAIT_MS) -> FastAPI:
+    app = FastAPI(title="PointNet 分割推理服务")
+    batcher = MicroBatcher(api, max_batch=max_batch, max_wait_ms=max_wait_ms)
+    app.state.batcher = batcher
+    batcher.start()
+
+    @app.post("/predict")
+    async def predict(request: Request):
+        try:
+            points = decode_array(await request.body())
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"无法解析 .npy 请求体: {e}")
+        if points.ndim != 2 or points.shape[1] != 3 or points.shape[0] == 0:
+            raise HTTPException(status_code=400, detail=f"预期点云形状为 (N,3)，但收到 {points.shape}")
+
+        try:
+            labels = await asyncio.wrap_future(batcher.submit(points.astype(np.float32, copy=False)))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"推理失败: {e}")
+
+        return Response(content=encode_array(labels.astype(np.uint8)), media_type=NPY_CONTENT_TYPE)
+
+    @app.get("/metrics")
+    async def metrics():
+        return batcher.metrics()
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy", "model_path": api.model_path, "variant": api.variant,
+                "chunk_size": api.chunk_size, "device": str(api.device)}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PointNet 分割推理服务")
+    parser.add_argument("--model", required=True, help="checkpoint 路径")
+    parser.add_argument("--num-classes", type=int, default=3)
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--variant", default="plain", choices=VARIANTS)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="分块推理的每块点数，与 PointCloudAPI 的 chunk_size 保持一致")
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--uds", default=None, help="Unix socket 路径（指定后忽略 host/port）")
+    args = parser.parse_args()
+
+    api = FullResolutionSegmenter(args.model, num_classes=args.num_classes, device=args.device,
+                                  variant=args.variant, chunk_size=args.chunk_size)
+    api.warmup()
+    print(f"✅ 模型已加载并预热: {args.model} ({args.variant}, {api.device})")
+
+    app = create_app(api, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    if args.uds:
+        uvicorn.run(app, uds=args.uds, log_level="info")
+    else:
+        uvicorn.run(app, host=args.host, port=args.port, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,34 @@
 import torch
 from dianyun.cse.pointcloud_project.src.pc_backend import load_pointcloud, save_colored_ply   # C++
 
-from dianyun.cse.pointcloud_project.src.model_pointnet import SimplePointNetSeg
+from dianyun.cse.pointcloud_project.src.model_registry import get_model, resolve_device
 
-def inference_one_cloud(model_path, ply_path, out_path="infer_result.ply"):
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+def inference_one_cloud(model_path, ply_path, out_path="infer_result.ply", chunk_size=None, variant="plain"):
+    """
+    chunk_size=None：整个点云一次前向
+    chunk_size=k   ：两遍分块推理（见 SimplePointNetSeg.predict_chunked），
+                     每个点的标签不变，峰值内存只和 k 有关
+    variant        ：模型变体，见 model_registry.VARIANTS
+    """
+    device = resolve_device(None, variant)
 
-    # 1. 加载模型
-    model = SimplePointNetSeg(num_classes=3).to(device)
-    state = torch.load(model_path, map_location=device)
-    model.load_state_dict(state)
-    model.eval()
+    # 1. 加载模型（进程内只加载一次，见 model_registry）
+    model = get_model(model_path, num_classes=3, device=device, variant=variant)
 
     # 2. 用 C++ 加载 PLY
     xyz = load_pointcloud(ply_path)        # numpy (N,3)
-    xyz_t = torch.from_numpy(xyz).float().unsqueeze(0).to(device)
+    xyz_t = torch.from_numpy(xyz).float().unsqueeze(0)
 
     # 3. 推理
-    with torch.no_grad():
-        logits = model(xyz_t.transpose(1, 2))   # (1,N,3)
-        pred = logits.argmax(dim=-1).squeeze(0).cpu().numpy()
+    if chunk_size is None:
+        with torch.no_grad():
+            logits = model(xyz_t.to(device).transpose(1, 2))   # (1,N,3)
+            pred = logits.argmax(dim=-1).squeeze(0).cpu().numpy()
+    else:
+        # 分块时点云留在 CPU，每块单独搬到 device
+        pred = model.predict_chunked(xyz_t.transpose(1, 2), chunk_size=chunk_size).squeeze(0).numpy()
 
     # 4. 保存上色结果
     save_colored_ply(out_path, xyz, pred)
 
-    return out_path, pred
+    return out_path, pred, xyz[pred == 2]
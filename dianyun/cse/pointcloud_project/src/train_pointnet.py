@@ -3,36 +3,57 @@ train_pointnet.py (improved)
 
 改进点：
 1) 类感知采样：采样4096点时，优先保留瑕疵点（类2），再随机补齐。
+   采样只在数据集中（DataLoader worker 里）完成，每个文件的瑕疵 / 非瑕疵点索引只计算一次并缓存。
 2) 类权重改为 sqrt(1/count) + clamp，避免权重极端不稳定。
+3) train_ddp(world_size)：无 GPU 的多核机器上用 torch.distributed（gloo）做 CPU 数据并行，
+   每个进程读取数据集的一个分片，梯度 all-reduce，只有 rank 0 保存 checkpoint。
 """
 
 import os
+import socket
 import time
 import numpy as np
 
 import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
 import torch.nn as nn
+from torch.nn.parallel import DistributedDataParallel
 from torch.utils.data import DataLoader
+from torch.utils.data.distributed import DistributedSampler
 
 from dianyun.cse.pointcloud_project.src.dataset_pointcloud import PointCloudDataset
 from dianyun.cse.pointcloud_project.src.model_pointnet import SimplePointNetSeg
 
 
+# -------- 配置 --------
+DATA_ROOT = r"C:\Users\SRIT\Desktop\ai\5\pointcloud_project\data\train"
+CHECKPOINT_DIR = r"C:\Users\SRIT\Desktop\ai\5\pointcloud_project\checkpoints"
+
+NUM_POINTS = 4096
+NUM_CLASSES = 3
+BATCH_SIZE = 2
+NUM_EPOCHS = 30
+LEARNING_RATE = 1e-3
+
+
 def compute_class_weights(dataset, num_classes=3, max_ratio=10.0):
     """
     改进版类别权重：
       w = 1/sqrt(count)
       再归一化到均值=1
       再 clamp 最大权重倍数，避免极端不稳定
+    点数来自数据集清单（每个文件全部点的精确直方图，按 mtime 失效）；
+    没有清单的数据集退回逐个样本统计。
     """
-    counts = np.zeros(num_classes, dtype=np.float64)
-
     print("\n🔢 正在统计整个数据集中各类别的点数...")
-    for idx in range(len(dataset)):
-        _, label = dataset[idx]
-        label_np = label.numpy()
-        for c in range(num_classes):
-            counts[c] += (label_np == c).sum()
+    if hasattr(dataset, "class_histogram"):
+        counts = dataset.class_histogram(num_classes=num_classes).astype(np.float64)
+    else:
+        counts = np.zeros(num_classes, dtype=np.float64)
+        for idx in range(len(dataset)):
+            _, label = dataset[idx]
+            counts += np.bincount(label.numpy().reshape(-1), minlength=num_classes)[:num_classes]
 
     print("📊 各类别点数统计：")
     for c in range(num_classes):
@@ -52,139 +73,216 @@ def compute_class_weights(dataset, num_classes=3, max_ratio=10.0):
     return torch.tensor(class_weights, dtype=torch.float32)
 
 
-def class_aware_sample(xyz, label, num_points=4096, defect_class=2):
+def _train_one_epoch(model, dataloader, optimizer, criterion, device, epoch, log=True):
     """
-    类感知采样：
-    - 优先把 defect_class 的点全选进来（如果超过 num_points 就随机截断）
-    - 剩下的点再从非 defect 中随机补齐
+    训练一个 epoch，返回 (loss 之和, batch 数, 预测正确点数, 总点数, 样本数)
     """
-    xyz_np = xyz.cpu().numpy()
-    label_np = label.cpu().numpy()
+    model.train()
+    epoch_loss = 0.0
+    num_batches = 0
+    total_points = 0
+    correct_points = 0
+    num_samples = 0
 
-    defect_idx = np.where(label_np == defect_class)[0]
-    other_idx  = np.where(label_np != defect_class)[0]
+    for batch_idx, (xyz, label) in enumerate(dataloader):
+        # 数据集已按类感知采样到 NUM_POINTS 个点
+        xyz = xyz.to(device)     # (B,4096,3)
+        label = label.to(device) # (B,4096)
 
-    if len(defect_idx) >= num_points:
-        chosen_defect = np.random.choice(defect_idx, num_points, replace=False)
-        final_idx = chosen_defect
-    else:
-        # 先放全部瑕疵点
-        need = num_points - len(defect_idx)
-        chosen_other = np.random.choice(other_idx, need, replace=(len(other_idx) < need))
-        final_idx = np.concatenate([defect_idx, chosen_other])
+        xyz_transposed = xyz.transpose(1, 2)     # (B,3,4096)
 
-    np.random.shuffle(final_idx)
+        pred = model(xyz_transposed)             # (B,4096,3)
 
-    xyz_s = torch.from_numpy(xyz_np[final_idx]).to(xyz.device)
-    label_s = torch.from_numpy(label_np[final_idx]).to(label.device)
-    return xyz_s, label_s
+        B, N, C = pred.shape
+        pred_2d = pred.reshape(B * N, C)
+        label_1d = label.reshape(B * N)
 
+        loss = criterion(pred_2d, label_1d)
 
-def train():
-    # -------- 配置 --------
-    data_root = r"C:\Users\SRIT\Desktop\ai\5\pointcloud_project\data\train"
-    checkpoint_dir = r"C:\Users\SRIT\Desktop\ai\5\pointcloud_project\checkpoints"
-    os.makedirs(checkpoint_dir, exist_ok=True)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
 
-    num_points = 4096
-    num_classes = 3
-    batch_size = 2
-    num_epochs = 30
-    learning_rate = 1e-3
+        epoch_loss += loss.item()
+        num_batches += 1
+        total_points += B * N
+        num_samples += B
+
+        with torch.no_grad():
+            pred_labels = pred.argmax(dim=-1)
+            correct_points += (pred_labels == label).sum().item()
+
+        if log and (batch_idx + 1) % 10 == 0:
+            print(f"  [Epoch {epoch:03d}] Batch {batch_idx+1:03d} | Loss: {loss.item():.4f}")
+
+    return epoch_loss, num_batches, correct_points, total_points, num_samples
+
+
+def train():
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
 
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     print("当前设备:", device)
 
     # -------- Dataset & Loader --------
-    dataset = PointCloudDataset(data_root=data_root, num_points=num_points)
+    # 数据集按文件缓存瑕疵 / 非瑕疵点索引，子采样时优先保留瑕疵点
+    dataset = PointCloudDataset(DATA_ROOT, num_points=NUM_POINTS, defect_class=2)
 
+    # 分片格式（dataset_pointcloud.convert_to_shards）下每个 worker 各自 memmap 读取
+    num_workers = min(4, os.cpu_count() or 1)
     dataloader = DataLoader(
         dataset,
-        batch_size=batch_size,
+        batch_size=BATCH_SIZE,
         shuffle=True,
-        num_workers=0,
-        pin_memory=True
+        num_workers=num_workers,
+        pin_memory=True,
+        persistent_workers=num_workers > 0
     )
 
     # -------- 类权重 --------
-    class_weights = compute_class_weights(dataset, num_classes=num_classes).to(device)
+    class_weights = compute_class_weights(dataset, num_classes=NUM_CLASSES).to(device)
 
     # -------- 模型/优化器/loss --------
-    model = SimplePointNetSeg(num_classes=num_classes).to(device)
-    optimizer = torch.optim.Adam(model.parameters(), lr=learning_rate)
+    model = SimplePointNetSeg(num_classes=NUM_CLASSES).to(device)
+    optimizer = torch.optim.Adam(model.parameters(), lr=LEARNING_RATE)
     criterion = nn.CrossEntropyLoss(weight=class_weights)
 
     print("\n✅ 开始训练（带瑕疵增强采样）...\n")
 
     best_loss = float("inf")
-    best_model_path = os.path.join(checkpoint_dir, "pointnet_seg_best.pth")
-
-    for epoch in range(1, num_epochs + 1):
-        model.train()
-        epoch_loss = 0.0
-        total_points = 0
-        correct_points = 0
+    best_model_path = os.path.join(CHECKPOINT_DIR, "pointnet_seg_best.pth")
 
+    for epoch in range(1, NUM_EPOCHS + 1):
         start_time = time.time()
 
-        for batch_idx, (xyz, label) in enumerate(dataloader):
-            xyz = xyz.to(device)     # (B,N,3)
-            label = label.to(device) # (B,N)
+        epoch_loss, num_batches, correct_points, total_points, _ = _train_one_epoch(
+            model, dataloader, optimizer, criterion, device, epoch
+        )
 
-            # --- 类感知采样：对 batch 内每个样本单独增强 ---
-            xyz_list = []
-            label_list = []
-            for b in range(xyz.shape[0]):
-                xyz_s, label_s = class_aware_sample(xyz[b], label[b], num_points=num_points, defect_class=2)
-                xyz_list.append(xyz_s)
-                label_list.append(label_s)
+        avg_loss = epoch_loss / num_batches
+        acc = correct_points / total_points
 
-            xyz = torch.stack(xyz_list, dim=0)       # (B,4096,3)
-            label = torch.stack(label_list, dim=0)   # (B,4096)
+        elapsed = time.time() - start_time
+        print(f"\n📎 Epoch {epoch:03d}/{NUM_EPOCHS} 完成 | "
+              f"平均 Loss: {avg_loss:.4f} | 点级精度: {acc*100:.2f}% | "
+              f"用时: {elapsed:.1f} 秒")
+
+        if avg_loss < best_loss:
+            best_loss = avg_loss
+            torch.save(model.state_dict(), best_model_path)
+            print(f"💾 已保存当前最优模型到: {best_model_path}\n")
+        else:
+            print("（本轮没有超越最优模型）\n")
+
+    print("🎉 训练结束！")
+    print(f"最优平均 Loss: {best_loss:.4f}")
+    print(f"最优模型已保存在: {best_model_path}")
 
-            xyz_transposed = xyz.transpose(1, 2)     # (B,3,4096)
 
-            pred = model(xyz_transposed)             # (B,4096,3)
+# ===========================
+# CPU 数据并行（gloo）
+# ===========================
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
 
-            B, N, C = pred.shape
-            pred_2d = pred.reshape(B * N, C)
-            label_1d = label.reshape(B * N)
 
-            loss = criterion(pred_2d, label_1d)
+def _ddp_worker(rank, world_size, class_weights, threads_per_worker):
+    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+    torch.set_num_threads(threads_per_worker)
+    torch.manual_seed(rank)
+    np.random.seed(rank)
 
-            optimizer.zero_grad()
-            loss.backward()
-            optimizer.step()
+    is_main = rank == 0
+    device = torch.device("cpu")
 
-            epoch_loss += loss.item()
-            total_points += B * N
+    # 每个进程只读取数据集的 1/world_size（DistributedSampler 按 epoch 重新打乱）
+    dataset = PointCloudDataset(DATA_ROOT, num_points=NUM_POINTS, defect_class=2)
+    sampler = DistributedSampler(dataset, num_replicas=world_size, rank=rank, shuffle=True)
+    dataloader = DataLoader(dataset, batch_size=BATCH_SIZE, sampler=sampler,
+                            num_workers=1, persistent_workers=True)
 
-            with torch.no_grad():
-                pred_labels = pred.argmax(dim=-1)
-                correct_points += (pred_labels == label).sum().item()
+    # 各进程初始权重相同（DDP 构造时从 rank 0 广播），反向时梯度 all-reduce 取平均
+    model = DistributedDataParallel(SimplePointNetSeg(num_classes=NUM_CLASSES))
+    optimizer = torch.optim.Adam(model.parameters(), lr=LEARNING_RATE)
+    criterion = nn.CrossEntropyLoss(weight=class_weights)
 
-            if (batch_idx + 1) % 10 == 0:
-                print(f"  [Epoch {epoch:03d}] Batch {batch_idx+1:03d} | Loss: {loss.item():.4f}")
+    best_loss = float("inf")
+    best_model_path = os.path.join(CHECKPOINT_DIR, "pointnet_seg_best.pth")
 
-        avg_loss = epoch_loss / len(dataloader)
-        acc = correct_points / total_points
+    for epoch in range(1, NUM_EPOCHS + 1):
+        sampler.set_epoch(epoch)
+        start_time = time.time()
 
+        epoch_loss, num_batches, correct_points, total_points, num_samples = _train_one_epoch(
+            model, dataloader, optimizer, criterion, device, epoch, log=is_main
+        )
         elapsed = time.time() - start_time
-        print(f"\n📎 Epoch {epoch:03d}/{num_epochs} 完成 | "
-              f"平均 Loss: {avg_loss:.4f} | 点级精度: {acc*100:.2f}% | "
-              f"用时: {elapsed:.1f} 秒")
+
+        # 汇总所有进程的 loss / 精度；收集每个进程的吞吐
+        totals = torch.tensor([epoch_loss, num_batches, correct_points, total_points], dtype=torch.float64)
+        dist.all_reduce(totals)
+        throughput = [torch.zeros(1, dtype=torch.float64) for _ in range(world_size)]
+        dist.all_gather(throughput, torch.tensor([num_samples / max(elapsed, 1e-9)], dtype=torch.float64))
+
+        if not is_main:
+            continue
+
+        avg_loss = totals[0].item() / totals[1].item()
+        acc = totals[2].item() / totals[3].item()
+        per_worker = [t.item() for t in throughput]
+        print(f"\n📎 Epoch {epoch:03d}/{NUM_EPOCHS} 完成 | "
+              f"平均 Loss: {avg_loss:.4f} | 点级精度: {acc*100:.2f}% | 用时: {elapsed:.1f} 秒")
+        print(f"⚡ 吞吐: 每进程 {[round(v, 2) for v in per_worker]} 样本/秒 | 合计 {sum(per_worker):.2f} 样本/秒")
 
         if avg_loss < best_loss:
             best_loss = avg_loss
-            torch.save(model.state_dict(), best_model_path)
+            torch.save(model.module.state_dict(), best_model_path)
             print(f"💾 已保存当前最优模型到: {best_model_path}\n")
         else:
             print("（本轮没有超越最优模型）\n")
 
-    print("🎉 训练结束！")
-    print(f"最优平均 Loss: {best_loss:.4f}")
-    print(f"最优模型已保存在: {best_model_path}")
+    if is_main:
+        print("🎉 训练结束！")
+        print(f"最优平均 Loss: {best_loss:.4f}")
+        print(f"最优模型已保存在: {best_model_path}")
+
+    dist.destroy_process_group()
+
+
+def train_ddp(world_size=None):
+    """
+    启动 world_size 个进程做 CPU 数据并行训练（默认每 2 个核一个进程）。
+    每个进程的 torch 线程数 = CPU 核数 / world_size。
+    """
+    cpu_count = os.cpu_count() or 1
+    world_size = world_size or max(1, cpu_count // 2)
+    threads_per_worker = max(1, cpu_count // world_size)
+
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    os.environ.setdefault("MASTER_ADDR", "127.0.0.1")
+    os.environ.setdefault("MASTER_PORT", str(_free_port()))
+
+    print(f"🚀 CPU 数据并行训练：{world_size} 个进程，每进程 {threads_per_worker} 个线程")
+
+    # 类权重只在主进程统计一次（数据集清单），再传给各个进程
+    dataset = PointCloudDataset(DATA_ROOT, num_points=NUM_POINTS)
+    class_weights = compute_class_weights(dataset, num_classes=NUM_CLASSES)
+
+    mp.spawn(_ddp_worker, args=(world_size, class_weights, threads_per_worker),
+             nprocs=world_size, join=True)
 
 
 if __name__ == "__main__":
-    train()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="训练 SimplePointNetSeg")
+    parser.add_argument("--ddp", type=int, default=0, metavar="N",
+                        help="N > 0 时启动 N 个进程做 CPU 数据并行（gloo）")
+    args = parser.parse_args()
+
+    if args.ddp > 0:
+        train_ddp(args.ddp)
+    else:
+        train()